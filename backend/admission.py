@@ -0,0 +1,150 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+# классы приоритета заданий судьи: меньше — раньше
+# (бой > практика > генерация тестов > оценка сложности принятых посылок)
+PRIORITIES = {
+    "battle": 0,
+    "submission": 1,
+    "generate_tests": 2,
+    "complexity": 3,
+}
+LOWEST_PRIORITY = max(PRIORITIES.values())
+
+# корзина токенов пользователя: BURST посылок подряд, дальше — по одной в 1 / RATE секунд
+USER_BURST = float(os.getenv("JUDGE_USER_BURST", "10"))
+USER_RATE = float(os.getenv("JUDGE_USER_RATE", "0.2"))
+USER_BUCKETS = int(os.getenv("JUDGE_USER_BUCKETS", "10000"))
+# сколько заданий может ждать в очереди; генерация тестов отсекается раньше, бои — никогда
+MAX_BACKLOG = int(os.getenv("JUDGE_MAX_BACKLOG", "100"))
+BACKLOG_SHARE = {
+    "submission": 1.0,
+    "generate_tests": 0.5,
+}
+# начальная оценка длительности задания, пока нет замеров, и потолок Retry-After
+DEFAULT_JOB_SECONDS = float(os.getenv("JUDGE_DEFAULT_JOB_SECONDS", "2"))
+MAX_RETRY_AFTER = 300
+
+
+class JudgeBusy(Exception):
+    """Задание не принято: пользователь исчерпал лимит или очередь судьи переполнена"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, min(MAX_RETRY_AFTER, math.ceil(retry_after)))
+
+
+def priority(kind: str) -> int:
+    return PRIORITIES.get(kind, LOWEST_PRIORITY)
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """0, если токен взят, иначе — через сколько секунд он появится"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else MAX_RETRY_AFTER
+
+
+class RateLimiter:
+    """Корзины токенов по пользователям; давно не заходившие вытесняются (LRU) —
+    их корзина все равно успела бы наполниться"""
+
+    def __init__(self, capacity: float = USER_BURST, rate: float = USER_RATE, max_users: int = USER_BUCKETS):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_users = max_users
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, user_id: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(self.capacity, self.rate, now)
+            self._buckets.move_to_end(user_id)
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+            return bucket.take(now)
+
+
+class FairQueue:
+    """Справедливая очередь между пользователями (start-time fair queuing).
+
+    У каждого пользователя — виртуальное время: сколько времени судьи он уже
+    занял, деленное на вес. Следующим берется задание пользователя с меньшим
+    временем, поэтому один пользователь с сотней посылок не задерживает
+    остальных дольше, чем на одно свое задание. Вернувшийся после простоя
+    пользователь начинает с текущего виртуального времени, а не с накопленного запаса.
+    Стоимость списывается оценкой при захвате и уточняется по факту.
+    """
+
+    def __init__(self, default_seconds: float = DEFAULT_JOB_SECONDS):
+        self._virtual = 0.0
+        self._finish = {}
+        self._durations = {}
+        self.default_seconds = default_seconds
+        self._lock = threading.Lock()
+
+    def _start_tag(self, user_id: int) -> float:
+        return max(self._finish.get(user_id, 0.0), self._virtual)
+
+    def pick(self, heads: list):
+        """heads — [(user_id, время самой старой посылки)]; возвращает user_id"""
+        with self._lock:
+            return min(heads, key=lambda head: (self._start_tag(head[0]), head[1]))[0]
+
+    def estimate(self, kind: str) -> float:
+        with self._lock:
+            return self._durations.get(kind, self.default_seconds)
+
+    def start(self, user_id: int, kind: str, weight: float = 1.0) -> float:
+        """Списывает с пользователя оценку задания; возвращает ее для finish"""
+        with self._lock:
+            cost = self._durations.get(kind, self.default_seconds)
+            start = self._start_tag(user_id)
+            self._virtual = start
+            self._finish[user_id] = start + cost / weight
+            # пользователи, отставшие от виртуального времени, ничем не отличаются от новых
+            if len(self._finish) > USER_BUCKETS:
+                self._finish = {user: tag for user, tag in self._finish.items() if tag > self._virtual}
+            return cost
+
+    def finish(self, user_id: int, kind: str, estimate: float, seconds: float, weight: float = 1.0):
+        with self._lock:
+            if user_id in self._finish:
+                self._finish[user_id] += (seconds - estimate) / weight
+            previous = self._durations.get(kind)
+            self._durations[kind] = seconds if previous is None else 0.9 * previous + 0.1 * seconds
+
+
+rate_limiter = RateLimiter()
+fair_queue = FairQueue()
+
+
+def admit(queued: int, user_id: int, kind: str, workers: int):
+    """Пропускает задание в очередь или бросает JudgeBusy с подсказкой Retry-After.
+
+    queued — сколько заданий уже ждет; при переполнении токен пользователя не тратится.
+    """
+    share = BACKLOG_SHARE.get(kind)
+    if share is not None and queued >= MAX_BACKLOG * share:
+        excess = queued - MAX_BACKLOG * share + 1
+        raise JudgeBusy("Judge queue is full", excess * fair_queue.estimate(kind) / max(1, workers))
+    wait = rate_limiter.take(user_id)
+    if wait > 0:
+        raise JudgeBusy("Too many submissions", wait)
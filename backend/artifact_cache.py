@@ -0,0 +1,121 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+
+ARTIFACT_CACHE_DIR = os.getenv("JUDGE_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "codebattle_artifacts"))
+ARTIFACT_CACHE_MB = int(os.getenv("JUDGE_ARTIFACT_CACHE_MB", "512"))
+
+
+def artifact_key(image: str, compile_cmd: str, source: str) -> str:
+    """Ключ артефакта: одинаковая обертка одним и тем же компилятором дает одинаковый бинарник"""
+    digest = hashlib.sha256()
+    for part in (image, compile_cmd, source):
+        data = part.encode()
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Скомпилированные бинарники на диске хоста, общие для всех воркеров.
+
+    Запись атомарная (временный файл + rename), поэтому читатели никогда не видят
+    недописанный файл. Давность использования — mtime, по нему же вытесняем.
+    """
+
+    def __init__(self, root: str = ARTIFACT_CACHE_DIR, max_bytes: int = ARTIFACT_CACHE_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def read(self, key: str):
+        """Содержимое артефакта или None"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self._count(False)
+            return None
+        self._count(True)
+        return data
+
+    def store_bytes(self, key: str, data: bytes):
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o755)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._evict()
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def _evict(self):
+        """Удаляет давно не использованные артефакты, пока кеш не влезет в бюджет"""
+        entries = list(self._entries())
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> dict:
+        entries = list(self._entries()) if os.path.isdir(self.root) else []
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes
+        }
+
+
+artifact_cache = ArtifactCache()
@@ -0,0 +1,598 @@
+import codecs
+import json
+import re
+from collections import Counter
+from functools import lru_cache
+
+
+# как сравнивать вывод решения с ожидаемым — выбирается у задачи (task_checkers)
+DEFAULT_COMPARATOR = "auto"
+FLOAT_TOLERANCE = 1e-6
+# auto: ожидаемый вывод из одного слова не длиннее — сравнивается как число или JSON-значение;
+# длиннее целые json.loads и int все равно не читают
+AUTO_WORD_LIMIT = 4300
+
+
+def expected_chunks(expected):
+    """Ожидаемый вывод по кускам текста: строка или объект с chunks() -> bytes (тест из хранилища)"""
+    if isinstance(expected, str) or expected is None:
+        if expected:
+            yield expected
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in expected.chunks():
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _tokens(chunks):
+    partial = ""
+    for chunk in chunks:
+        data = partial + chunk
+        tokens = data.split()
+        partial = tokens.pop() if tokens and not data[-1].isspace() else ""
+        yield from tokens
+    if partial:
+        yield partial
+
+
+def _lines(chunks):
+    partial = ""
+    for chunk in chunks:
+        lines = (partial + chunk).splitlines(keepends=True)
+        partial = lines.pop() if lines and lines[-1] == lines[-1].rstrip("\r\n") else ""
+        yield from lines
+    if partial:
+        yield partial
+
+
+class _Reader:
+    """Ожидаемый вывод с подглядыванием вперед: в памяти только еще не сравненная часть куска"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = ""
+        self._pos = 0
+
+    def peek(self, n: int) -> str:
+        while len(self._buffer) - self._pos < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer = self._buffer[self._pos:] + chunk
+            self._pos = 0
+        return self._buffer[self._pos:self._pos + n]
+
+    def skip(self, n: int):
+        self._pos += n
+
+    def lstrip(self):
+        while True:
+            rest = self.peek(1)
+            if not rest or not rest.isspace():
+                return
+            data = self.peek(len(self._buffer) - self._pos)
+            self.skip(len(data) - len(data.lstrip()))
+
+    def blank(self) -> bool:
+        """Осталась ли только пробельная часть (читает остаток до конца)"""
+        self.lstrip()
+        return not self.peek(1)
+
+
+class Comparator:
+    """Сравнивает вывод с ожидаемым по кускам, по мере их поступления.
+
+    feed(chunk) возвращает False, как только несовпадение уже известно —
+    дальше вывод можно не передавать. finish() — итоговый ответ.
+    Ведущие и хвостовые пробельные символы вывода не учитываются.
+    expected — строка или поток (см. expected_chunks): большой ожидаемый
+    вывод из хранилища читается по мере сравнения, а не целиком.
+    """
+
+    def __init__(self, expected, tolerance: float = None):
+        self.expected = expected
+        self.tolerance = FLOAT_TOLERANCE if tolerance is None else tolerance
+        self.failed = False
+
+    def feed(self, chunk: str) -> bool:
+        if not self.failed and not self._feed(chunk):
+            self.failed = True
+        return not self.failed
+
+    def finish(self) -> bool:
+        return not self.failed and self._finish()
+
+    def _feed(self, chunk: str) -> bool:
+        raise NotImplementedError
+
+    def _finish(self) -> bool:
+        raise NotImplementedError
+
+
+class ExactComparator(Comparator):
+    """Посимвольное совпадение"""
+
+    def __init__(self, expected, tolerance: float = None):
+        super().__init__(expected, tolerance)
+        self.reader = _Reader(self._expected_chunks(expected))
+        self.reader.lstrip()
+        self.started = False
+        # пробелы, которые могут оказаться хвостовыми, — решаем, когда придет следующий символ
+        self.pending = ""
+        self.tail = False
+
+    def _expected_chunks(self, expected):
+        return expected_chunks(expected)
+
+    def _feed(self, chunk: str) -> bool:
+        if not self.started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return True
+            self.started = True
+        if self.tail:
+            # после хвостовых пробелов не должно быть ничего
+            return not chunk.strip()
+        data = self.pending + chunk
+        core = data.rstrip()
+        self.pending = data[len(core):]
+        if core:
+            if self.reader.peek(len(core)) != core:
+                return False
+            self.reader.skip(len(core))
+        if self.pending and self.reader.peek(len(self.pending)) != self.pending:
+            self.pending = ""
+            self.tail = True
+        return True
+
+    def _finish(self) -> bool:
+        # хвостовые пробелы ожидаемого не учитываются
+        return self.reader.blank()
+
+
+class TokenComparator(Comparator):
+    """Совпадение последовательностей токенов: пробелы и переводы строк между ними не важны"""
+
+    def __init__(self, expected, tolerance: float = None):
+        super().__init__(expected, tolerance)
+        self.tokens = _tokens(expected_chunks(expected))
+        self.current = next(self.tokens, None)
+        self.partial = ""
+
+    def _equal(self, actual: str, expected: str) -> bool:
+        return actual == expected
+
+    def _take(self, token: str) -> bool:
+        if self.current is None or not self._equal(token, self.current):
+            return False
+        self.current = next(self.tokens, None)
+        return True
+
+    def _feed(self, chunk: str) -> bool:
+        data = self.partial + chunk
+        tokens = data.split()
+        self.partial = tokens.pop() if tokens and not data[-1].isspace() else ""
+        return all(self._take(token) for token in tokens) and self._partial_ok()
+
+    def _partial_ok(self) -> bool:
+        # недописанный токен уже не совпадет, если он не начало ожидаемого
+        if not self.partial:
+            return True
+        return self.current is not None and self.current.startswith(self.partial)
+
+    def _finish(self) -> bool:
+        if self.partial and not self._take(self.partial):
+            return False
+        return self.current is None
+
+
+class FloatComparator(TokenComparator):
+    """Как tokens, но числа сравниваются с допуском (абсолютным или относительным)"""
+
+    def _equal(self, actual: str, expected: str) -> bool:
+        try:
+            a, e = float(actual), float(expected)
+        except ValueError:
+            return actual == expected
+        return abs(a - e) <= self.tolerance * max(1.0, abs(e))
+
+    def _partial_ok(self) -> bool:
+        # "1.000000001" длиннее "1", но может совпасть с допуском
+        return True
+
+
+class UnorderedLinesComparator(Comparator):
+    """Те же строки в любом порядке; пустые строки и пробелы в конце строк не учитываются"""
+
+    def __init__(self, expected, tolerance: float = None):
+        super().__init__(expected, tolerance)
+        self.remaining = Counter(line.rstrip() for line in _lines(expected_chunks(expected)) if line.strip())
+        self.partial = ""
+
+    def _take(self, line: str) -> bool:
+        line = line.rstrip()
+        if not line.strip():
+            return True
+        if not self.remaining[line]:
+            return False
+        self.remaining[line] -= 1
+        return True
+
+    def _feed(self, chunk: str) -> bool:
+        *lines, self.partial = (self.partial + chunk).replace("\r", "").split("\n")
+        return all(self._take(line) for line in lines)
+
+    def _finish(self) -> bool:
+        return self._take(self.partial) and not +self.remaining
+
+
+class _BufferedComparator(Comparator):
+    """Сравнение, которому нужен весь вывод (размер ограничен лимитом вывода);
+    ожидаемый читается целиком только на время finish()"""
+
+    def __init__(self, expected, tolerance: float = None):
+        super().__init__(expected, tolerance)
+        self.chunks = []
+
+    def _feed(self, chunk: str) -> bool:
+        self.chunks.append(chunk)
+        return True
+
+    def _finish(self) -> bool:
+        return self._compare("".join(expected_chunks(self.expected)).strip(), "".join(self.chunks).strip())
+
+
+class JsonComparator(_BufferedComparator):
+    """Равенство JSON-значений; если вывод не JSON — посимвольное совпадение"""
+
+    def _compare(self, expected: str, actual: str) -> bool:
+        try:
+            return json.loads(expected) == json.loads(actual)
+        except ValueError:
+            return expected == actual
+
+
+def _auto_equal(expected: str, actual: str, tolerance: float) -> bool:
+    """Сравнение auto целиком: JSON, затем число, затем строки без хвостовых пробелов"""
+    try:
+        return json.loads(expected) == json.loads(actual)
+    except ValueError:
+        pass
+    try:
+        if "." in expected or "." in actual:
+            return abs(float(expected) - float(actual)) < tolerance
+        return int(expected) == int(actual)
+    except ValueError:
+        pass
+
+    def norm(text: str) -> str:
+        return "\n".join(line.rstrip() for line in text.replace("\r\n", "\n").replace("\r", "\n").splitlines()).strip()
+    return norm(expected) == norm(actual)
+
+
+class _LineEnds:
+    """Переводит текст по кускам к виду norm() из _auto_equal: переводы строк — \\n,
+    пробелы в конце строк убраны. Пробелы в конце куска придерживаются до следующего:
+    пока неизвестно, хвостовые ли они."""
+
+    BREAKS = re.compile(r"\r\n|[\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
+    TRAILING = re.compile(r"[^\S\n]+(?=\n)")
+
+    def __init__(self):
+        self.pending = ""
+
+    def _normalize(self, text: str) -> str:
+        # регулярки дороги на мегабайтах вывода — для ASCII сначала дешевые проверки
+        ascii = text.isascii()
+        if not ascii or any(char in text for char in "\r\v\f\x1c\x1d\x1e"):
+            text = self.BREAKS.sub("\n", text)
+        if not ascii or " \n" in text or "\t\n" in text or "\x1f\n" in text:
+            text = self.TRAILING.sub("", text)
+        return text
+
+    def feed(self, chunk: str, final: bool = False) -> str:
+        data = self.pending + chunk
+        if final:
+            self.pending = ""
+            return self._normalize(data)
+        head = data.rstrip()
+        tail = data[len(head):]
+        # \r в конце может оказаться началом \r\n
+        hold = "\r" if tail.endswith("\r") else ""
+        tail = self.BREAKS.sub("\n", tail[:len(tail) - len(hold)])
+        newlines = tail.count("\n")
+        self.pending = tail[tail.rfind("\n") + 1:] + hold
+        return self._normalize(head) + "\n" * newlines
+
+
+def _normalized(chunks):
+    line_ends = _LineEnds()
+    for chunk in chunks:
+        text = line_ends.feed(chunk)
+        if text:
+            yield text
+    yield line_ends.feed("", final=True)
+
+
+class _AutoLinesComparator(ExactComparator):
+    """auto для текста: строки без хвостовых пробелов, переводы строк любые"""
+
+    def __init__(self, expected, tolerance: float = None):
+        super().__init__(expected, tolerance)
+        self.line_ends = _LineEnds()
+
+    def _expected_chunks(self, expected):
+        return _normalized(expected_chunks(expected))
+
+    def _feed(self, chunk: str) -> bool:
+        text = self.line_ends.feed(chunk)
+        return not text or super()._feed(text)
+
+    def _finish(self) -> bool:
+        text = self.line_ends.feed("", final=True)
+        return (not text or super()._feed(text)) and super()._finish()
+
+
+_WORD = re.compile(r"\S*")
+
+
+class _AutoWordComparator(Comparator):
+    """auto для ожидаемого из одного слова (обычно числа): равным может быть только
+    вывод из одного слова, поэтому копится лишь оно, и не длиннее AUTO_WORD_LIMIT"""
+
+    def __init__(self, expected, tolerance: float = None, word: str = ""):
+        super().__init__(expected, tolerance)
+        self.word = word
+        self.actual = ""
+        self.ended = False
+
+    def _feed(self, chunk: str) -> bool:
+        if self.ended:
+            return not chunk.strip()
+        if not self.actual:
+            chunk = chunk.lstrip()
+        word = _WORD.match(chunk).group()
+        self.actual += word
+        rest = chunk[len(word):]
+        if rest:
+            if rest.strip():
+                return False
+            self.ended = True
+        return len(self.actual) <= AUTO_WORD_LIMIT
+
+    def _finish(self) -> bool:
+        return _auto_equal(self.word, self.actual, self.tolerance)
+
+
+_JSON_SPACE = " \t\n\r"
+_JSON_PUNCTUATION = frozenset("[]{}:,")
+JSON_SLICE = 64 * 1024
+# токены JSON-подобного текста: знак, строка (в конце куска — возможно, незакрытая), слово
+_JSON_TOKEN = re.compile(r'[ \t\n\r]*([^ \t\n\r\[\]{}:,"]+|[\[\]{}:,]|"(?:[^"\\]|\\.)*"|"(?:[^"\\]|\\.)*\\?\Z)')
+_JSON_STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+_JSON_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(\.\d+)?([eE][-+]?\d+)?")
+_JSON_ESCAPE_OR_QUOTE = re.compile(r'["\\]')
+# json.loads принимает и эти
+_JSON_WORDS = {"true": True, "false": False, "null": None,
+               "NaN": float("nan"), "Infinity": float("inf"), "-Infinity": float("-inf")}
+
+
+def _json_value(token: str):
+    """Значение токена, как его прочитал бы json.loads, или None, если такого в JSON нет"""
+    if token in _JSON_PUNCTUATION:
+        return "punct", token
+    if token[0] == '"':
+        try:
+            return "string", json.loads(token)
+        except ValueError:
+            return None
+    if token in _JSON_WORDS:
+        return "value", _JSON_WORDS[token]
+    match = _JSON_NUMBER.fullmatch(token)
+    if match is None:
+        return None
+    try:
+        return "value", float(token) if match.group(1) or match.group(2) else int(token)
+    except ValueError:
+        return None
+
+
+def _json_token_equal(expected: str, actual: str) -> bool:
+    if expected == actual:
+        return True
+    value = _json_value(expected)
+    return value is not None and value == _json_value(actual)
+
+
+class _JsonLexer:
+    """Режет текст на JSON-токены по кускам (пробелы между токенами выбрасываются).
+
+    Токены — исходный текст: в JSON ли они вообще, не проверяется, чтобы совпадающий
+    вывод сравнивался одним сравнением списков. Незаконченный токен в конце куска
+    придерживается до следующего; незакрытая строка копится кусками, не пересматриваясь.
+    """
+
+    def __init__(self):
+        self._partial = ""
+        # незакрытая строка: ее куски и экранирован ли следующий символ
+        self._string = None
+        self._escaped = False
+
+    def _string_end(self, text: str, start: int = 0) -> int:
+        """Индекс после закрывающей кавычки незакрытой строки или -1"""
+        index = start
+        while True:
+            if self._escaped:
+                if index >= len(text):
+                    return -1
+                index += 1
+                self._escaped = False
+            match = _JSON_ESCAPE_OR_QUOTE.search(text, index)
+            if match is None:
+                return -1
+            if match.group() == '"':
+                return match.end()
+            self._escaped = True
+            index = match.end()
+
+    def feed(self, chunk: str, final: bool = False) -> list:
+        tokens = []
+        if self._string is not None:
+            end = self._string_end(chunk)
+            if end < 0:
+                self._string.append(chunk)
+                return ["".join(self._string)] if final else []
+            tokens.append("".join(self._string) + chunk[:end])
+            self._string = None
+            chunk = chunk[end:]
+        data = self._partial + chunk
+        self._partial = ""
+        tokens.extend(_JSON_TOKEN.findall(data))
+        if final or not data.strip(_JSON_SPACE):
+            return tokens
+        last = tokens[-1]
+        if last[0] == '"' and not _JSON_STRING.fullmatch(last):
+            tokens.pop()
+            self._string = [last]
+            self._escaped = False
+            self._string_end(last, 1)
+        elif last not in _JSON_PUNCTUATION and last[0] != '"' and data[-1] not in _JSON_SPACE:
+            # слово у конца куска может продолжиться
+            tokens.pop()
+            self._partial = last
+        return tokens
+
+
+def _json_tokens(chunks):
+    lexer = _JsonLexer()
+    for chunk in chunks:
+        tokens = lexer.feed(chunk)
+        if tokens:
+            yield tokens
+    yield lexer.feed("", final=True)
+
+
+def _parses_as_json(text: str) -> bool:
+    try:
+        json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=1024)
+def _stored_json_valid(store, key: str) -> bool:
+    return _parses_as_json(store.read(key).decode(errors="replace"))
+
+
+def _json_valid(expected) -> bool:
+    """JSON ли ожидаемый вывод. Читается целиком, но только когда вывод совпал
+    с ним по токенам, а не дословно; для данных хранилища (test_store.BlobInput)
+    ответ запоминается по ключу — хешу содержимого"""
+    if hasattr(expected, "store") and hasattr(expected, "key"):
+        return _stored_json_valid(expected.store, expected.key)
+    return _parses_as_json("".join(expected_chunks(expected)))
+
+
+class _AutoJsonComparator(Comparator):
+    """auto для ожидаемого, похожего на JSON (начинается с [, { или ").
+
+    Параллельно идут два сравнения: строк (как для текста) и JSON-токенов по
+    значению (1 и 1.0 равны, пробелы между токенами не важны). Совпали строки —
+    ответ да; совпали только токены — да, если ожидаемый вообще JSON (тогда
+    и вывод тоже). В отличие от json.loads ключи объектов сравниваются в порядке вывода.
+    """
+
+    def __init__(self, expected, tolerance: float = None):
+        super().__init__(expected, tolerance)
+        self.lines = _AutoLinesComparator(expected, tolerance)
+        self.expected_batches = _json_tokens(expected_chunks(expected))
+        self.expected_tokens = []
+        self.position = 0
+        self.lexer = _JsonLexer()
+        self.tokens_equal = True
+
+    def _take(self, tokens: list) -> bool:
+        while tokens:
+            if self.position == len(self.expected_tokens):
+                self.expected_tokens = next(self.expected_batches, None)
+                self.position = 0
+                if self.expected_tokens is None:
+                    return False
+                continue
+            count = min(len(tokens), len(self.expected_tokens) - self.position)
+            expected = self.expected_tokens[self.position:self.position + count]
+            actual = tokens[:count]
+            # обычно вывод совпадает дословно — тогда хватает одного сравнения списков
+            if expected != actual and not all(map(_json_token_equal, expected, actual)):
+                return False
+            self.position += count
+            tokens = tokens[count:]
+        return True
+
+    def _feed(self, chunk: str) -> bool:
+        # вывод приходит строками, а строка бывает в мегабайты — токены режем частями
+        for start in range(0, len(chunk), JSON_SLICE):
+            if not self.tokens_equal:
+                break
+            self.tokens_equal = self._take(self.lexer.feed(chunk[start:start + JSON_SLICE]))
+        return self.lines.feed(chunk) or self.tokens_equal
+
+    def _finish(self) -> bool:
+        if self.lines.finish():
+            return True
+        if not self.tokens_equal or not self._take(self.lexer.feed("", final=True)):
+            return False
+        if self.expected_tokens[self.position:] or any(self.expected_batches):
+            return False
+        return _json_valid(self.expected)
+
+
+class AutoComparator(Comparator):
+    """Прежнее поведение: JSON, затем число, затем строки без хвостовых пробелов.
+
+    Вид сравнения выбирается по ожидаемому выводу, и вывод решения сравнивается
+    потоком, целиком не копится: JSON-подобный ожидаемый — _AutoJsonComparator,
+    одно слово (число, литерал) — _AutoWordComparator, остальное — _AutoLinesComparator.
+    """
+
+    def __init__(self, expected, tolerance: float = None):
+        super().__init__(expected, tolerance)
+        reader = _Reader(expected_chunks(expected))
+        reader.lstrip()
+        head = reader.peek(AUTO_WORD_LIMIT + 1)
+        word = _WORD.match(head).group()
+        if head[:1] in ("[", "{", '"'):
+            self.delegate = _AutoJsonComparator(expected, self.tolerance)
+            return
+        if word and len(word) <= AUTO_WORD_LIMIT:
+            reader.skip(len(word))
+            if reader.blank():
+                self.delegate = _AutoWordComparator(expected, self.tolerance, word)
+                return
+        self.delegate = _AutoLinesComparator(expected, self.tolerance)
+
+    def _feed(self, chunk: str) -> bool:
+        return self.delegate.feed(chunk)
+
+    def _finish(self) -> bool:
+        return self.delegate.finish()
+
+
+COMPARATORS = {
+    "auto": AutoComparator,
+    "exact": ExactComparator,
+    "tokens": TokenComparator,
+    "float": FloatComparator,
+    "json": JsonComparator,
+    "unordered_lines": UnorderedLinesComparator,
+}
+
+
+def make_comparator(name: str, expected, tolerance: float = None) -> Comparator:
+    return COMPARATORS[name or DEFAULT_COMPARATOR](expected, tolerance)
@@ -0,0 +1,66 @@
+import math
+import os
+
+
+# масштабы входа для оценки сложности принятых решений; пусто — оценка выключена
+COMPLEXITY_SCALES = [int(n) for n in os.getenv("JUDGE_COMPLEXITY_SCALES", "1000,10000,100000").split(",") if n]
+COMPLEXITY_REPEATS = int(os.getenv("JUDGE_COMPLEXITY_REPEATS", "3"))
+# быстрее этого время — шум замера, а не рост
+NOISE_FLOOR_MS = 0.05
+# исходы, после которых масштаб считается «не уложившимся в лимит»
+BOUND_STATUSES = ("tle", "mle")
+
+COMPLEXITY_CLASSES = [
+    ("O(1)", lambda n: 1.0),
+    ("O(log n)", lambda n: math.log2(n)),
+    ("O(n)", lambda n: float(n)),
+    ("O(n log n)", lambda n: n * math.log2(n)),
+    ("O(n^2)", lambda n: float(n) ** 2),
+    ("O(n^3)", lambda n: float(n) ** 3),
+]
+
+
+def fit_complexity(points: list):
+    """Класс сложности по замерам [(n, cpu_ms)]: модель t = c * f(n) с наименьшей ошибкой в логарифмах.
+
+    None, если различных масштабов меньше двух.
+    """
+    if len({n for n, _ in points}) < 2:
+        return None
+    if max(ms for _, ms in points) < NOISE_FLOOR_MS:
+        return "O(1)"
+
+    best, best_error = None, None
+    for name, f in COMPLEXITY_CLASSES:
+        logs = [math.log(max(ms, NOISE_FLOOR_MS)) - math.log(f(n)) for n, ms in points]
+        c = sum(logs) / len(logs)
+        error = sum((value - c) ** 2 for value in logs)
+        if best_error is None or error < best_error - 1e-9:
+            best, best_error = name, error
+    return best
+
+
+def scale_inputs(generate, scales: list = COMPLEXITY_SCALES, repeats: int = COMPLEXITY_REPEATS) -> list:
+    """Входы оценки: сначала базовые (n = 1) — накладные расходы вызова, затем масштабы по возрастанию"""
+    return [generate(n) for n in [1] + scales for _ in range(repeats)]
+
+
+def scale_points(scales: list, outcomes: list, repeats: int = COMPLEXITY_REPEATS):
+    """(точки [(n, cpu_ms)], масштаб, на котором решение не уложилось в лимит, или None).
+
+    Берем минимум по повторам: он меньше всего зашумлен соседними процессами.
+    Из времени вычитается базовый замер, иначе на малых n рост тонет в накладных расходах.
+    Оценкой снизу служат только TLE и MLE: падение решения о его скорости ничего не говорит.
+    """
+    points, limit_n = [], None
+    for position, n in enumerate([1] + scales):
+        runs = outcomes[position * repeats:(position + 1) * repeats]
+        if len(runs) < repeats or any(run["status"] != "ok" or not run.get("stats") for run in runs):
+            if any(run["status"] in BOUND_STATUSES for run in runs):
+                limit_n = n
+            break
+        points.append((n, min(run["stats"]["cpu_ms"] for run in runs)))
+    if not points:
+        return [], limit_n
+    baseline = points[0][1]
+    return [(n, round(max(ms - baseline, 0), 3)) for n, ms in points[1:]], limit_n
@@ -0,0 +1,125 @@
+import os
+import threading
+from contextlib import contextmanager
+from sandbox import JudgeCancelled
+
+
+# проверка получает ядро целиком: соседние проверки не делят его, и замеры времени стабильны
+PIN_CORES = os.getenv("JUDGE_PIN_CORES", "1") != "0"
+# ядра, на которых судья не запускает проверки, — на них работает сам API
+RESERVED_CORES = int(os.getenv("JUDGE_RESERVED_CORES", "1"))
+# какие ядра хоста отдать этому процессу ("0-3,6"); по умолчанию — все доступные
+JUDGE_CORES = os.getenv("JUDGE_CORES", "")
+# ядра делятся внутри процесса: несколько процессов судьи на одном хосте (API с
+# JUDGE_WORKERS > 0 и worker.py) без JUDGE_CORES делят ядра проверки поровну по номеру
+# процесса — 0 .. JUDGE_WORKER_COUNT-1, у каждого свой JUDGE_WORKER_INDEX
+WORKER_INDEX = int(os.getenv("JUDGE_WORKER_INDEX", "0"))
+WORKER_COUNT = int(os.getenv("JUDGE_WORKER_COUNT", "1"))
+CORE_POLL_INTERVAL = 0.25
+
+
+def parse_cores(spec: str) -> list:
+    """"0-3,6" -> [0, 1, 2, 3, 6]"""
+    cores = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cores.update(range(int(first), int(last or first) + 1))
+    return sorted(cores)
+
+
+def partition(cores: list, index: int, count: int) -> list:
+    """Доля процесса index из count: подряд идущие ядра, поровну (первым — на одно больше)"""
+    if count <= 1 or not cores:
+        return cores
+    if not 0 <= index < count:
+        raise ValueError(f"JUDGE_WORKER_INDEX must be in 0..{count - 1}, got {index}")
+    if len(cores) < count:
+        # процессов больше, чем ядер: без общего ядра кому-то не досталось бы ни одного
+        return [cores[index % len(cores)]]
+    size, extra = divmod(len(cores), count)
+    start = index * size + min(index, extra)
+    return cores[start:start + size + (1 if index < extra else 0)]
+
+
+def host_cores() -> list:
+    if JUDGE_CORES:
+        return parse_cores(JUDGE_CORES)
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+class CorePool:
+    """Свободные ядра хоста для проверок: одна проверка — одно ядро.
+
+    Первые reserved ядер остаются API; если ядер не больше, чем резерв,
+    резервировать нечего и все ядра идут под проверки. Когда свободных
+    ядер нет, проверка ждет в очереди.
+
+    Пул знает только о своем процессе. Если ядра не заданы явно (cores или
+    JUDGE_CORES), ядра проверки делятся между worker_count процессами хоста,
+    и этому достается доля worker_index (см. partition).
+    """
+
+    def __init__(self, cores: list = None, reserved: int = RESERVED_CORES, enabled: bool = PIN_CORES,
+                 worker_index: int = WORKER_INDEX, worker_count: int = WORKER_COUNT):
+        explicit = cores is not None or bool(JUDGE_CORES)
+        cores = host_cores() if cores is None else cores
+        self.enabled = enabled
+        self.reserved = cores[:reserved] if len(cores) > reserved else []
+        self.cores = cores[len(self.reserved):]
+        if not explicit:
+            self.cores = partition(self.cores, worker_index, worker_count)
+        self._free = list(self.cores)
+        self._cond = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        return len(self.cores)
+
+    def acquire(self, cancel: threading.Event = None):
+        """Номер ядра (или None, если закрепление выключено); ждет, пока ядро освободится"""
+        if not self.enabled:
+            return None
+        with self._cond:
+            while not self._free:
+                if cancel is not None and cancel.is_set():
+                    raise JudgeCancelled()
+                self._cond.wait(CORE_POLL_INTERVAL)
+            return self._free.pop(0)
+
+    def release(self, core):
+        if core is None:
+            return
+        with self._cond:
+            self._free.append(core)
+            self._cond.notify()
+
+    @contextmanager
+    def core(self, cancel: threading.Event = None):
+        core = self.acquire(cancel)
+        try:
+            yield core
+        finally:
+            self.release(core)
+
+    def pin_api(self):
+        """Переносит все потоки процесса API на зарезервированные ядра.
+
+        Дочерние процессы наследуют эту маску, поэтому локальная песочница
+        закрепляет свои запуски за ядром проверки явно.
+        """
+        if not self.enabled or not self.reserved:
+            return
+        for tid in os.listdir("/proc/self/task"):
+            try:
+                os.sched_setaffinity(int(tid), self.reserved)
+            except OSError:
+                pass
+
+
+core_pool = CorePool()
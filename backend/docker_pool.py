@@ -0,0 +1,492 @@
+import os
+import shlex
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from docker.utils.socket import STDOUT, STDERR
+from toolchain_cache import toolchain_caches
+
+
+POOL_MIN = int(os.getenv("JUDGE_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("JUDGE_POOL_MAX", "4"))
+POOL_MAX_USES = int(os.getenv("JUDGE_POOL_MAX_USES", "50"))
+# потолок памяти контейнера до первого exec; дальше каждый exec ставит свой (лимит + запас)
+POOL_MEMORY = os.getenv("JUDGE_POOL_MEMORY", "512m")
+# запас памяти на сам рантайм поверх лимита задачи (интерпретатор, стандартная библиотека,
+# бинарник в /workspace на tmpfs) — одинаковый во всех песочницах
+MEMORY_HEADROOM_MB = int(os.getenv("JUDGE_MEMORY_HEADROOM_MB", "64"))
+POOL_HEALTH_INTERVAL = float(os.getenv("JUDGE_POOL_HEALTH_INTERVAL", "30"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("JUDGE_POOL_ACQUIRE_TIMEOUT", "60"))
+# /workspace контейнера — в памяти; exec обязателен, там лежат собранные бинарники
+WORKSPACE_TMPFS = os.getenv("JUDGE_WORKSPACE_TMPFS", "rw,exec,nosuid,size=64m")
+CANCEL_POLL_INTERVAL = 0.25
+# stderr нужен только для сообщения об ошибке — дальше этого не копим
+STDERR_LIMIT = 64 * 1024
+# чей контейнер: по метке после падения воркера находим и удаляем осиротевшие
+OWNER_LABEL = "codebattle.owner"
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+# очистка теплого контейнера перед следующим пользователем: убить все, кроме PID 1 (sleep),
+# стереть все, куда решение могло писать, и убедиться, что живых процессов не осталось
+# (зомби не считаются: sleep их не пожинает, но они уже ничего не делают)
+RESET_SCRIPT = r"""
+kill -9 -1 2>/dev/null
+rm -rf /workspace/* /workspace/.[!.]* /tmp/* /tmp/.[!.]* /var/tmp/* /var/tmp/.[!.]* /dev/shm/* /dev/shm/.[!.]*
+case "$HOME" in ""|/) ;; *) rm -rf "$HOME"/* "$HOME"/.[!.]* ;; esac
+alive() {
+    for p in /proc/[0-9]*; do
+        pid=${p#/proc/}
+        [ "$pid" = 1 ] || [ "$pid" = $$ ] && continue
+        state=$(sed -n 's/^State:[[:space:]]*\(.\).*/\1/p' "$p/status" 2>/dev/null)
+        [ -n "$state" ] && [ "$state" != Z ] && return 0
+    done
+    return 1
+}
+for attempt in 1 2 3 4 5; do
+    alive || exit 0
+    kill -9 -1 2>/dev/null
+    sleep 0.1
+done
+exit 1
+"""
+
+
+class PoolExhausted(RuntimeError):
+    """Свободный контейнер не появился за отведенное время"""
+
+
+def stdin_chunks(stdin):
+    """stdin песочницы: байты целиком или итератор кусков байтов"""
+    if isinstance(stdin, (bytes, bytearray)):
+        yield stdin
+    else:
+        yield from stdin
+
+
+class OutputBuffer:
+    """Копит вывод, но не больше limit байт.
+
+    При переполнении сохраняется limit + 1 байт: по длине результата
+    вызывающий видит, что вывод был обрезан.
+    """
+
+    def __init__(self, limit: int = None):
+        self.limit = limit
+        self.size = 0
+        self.overflow = False
+        self._chunks = []
+
+    def add(self, chunk: bytes) -> bool:
+        """False, если лимит превышен"""
+        if self.overflow:
+            return False
+        if self.limit is not None and self.size + len(chunk) > self.limit:
+            chunk = chunk[:self.limit + 1 - self.size]
+            self.overflow = True
+        self._chunks.append(chunk)
+        self.size += len(chunk)
+        return not self.overflow
+
+    def value(self) -> bytes:
+        return b"".join(self._chunks)
+
+
+def _recv_exact(raw, size: int, deadline: float, cancel: threading.Event = None, watchdog=None):
+    chunks = []
+    while size > 0:
+        wait = CANCEL_POLL_INTERVAL if cancel is not None or watchdog is not None else None
+        current = deadline
+        if watchdog is not None:
+            current = watchdog.deadline if current is None else min(current, watchdog.deadline)
+        if current is not None:
+            remaining = current - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("exec timed out")
+            wait = min(wait, remaining) if wait is not None else remaining
+        raw.settimeout(wait)
+        try:
+            chunk = raw.recv(min(size, 65536))
+        except socket.timeout:
+            if cancel is not None and cancel.is_set():
+                raise
+            continue
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frames(raw, deadline: float = None, cancel: threading.Event = None, watchdog=None):
+    """Читает мультиплексированный поток docker attach/exec: (stream, data).
+
+    docker.utils.socket.frames_iter ждет данных через poll() без таймаута,
+    поэтому читаем заголовки сами, с общим дедлайном на весь вывод
+    и подвижным дедлайном watchdog.deadline, если он задан.
+    """
+    while True:
+        header = _recv_exact(raw, 8, deadline, cancel, watchdog)
+        if header is None:
+            return
+        stream, size = struct.unpack(">BxxxL", header)
+        data = _recv_exact(raw, size, deadline, cancel, watchdog)
+        if data is None:
+            return
+        yield stream, data
+
+
+def spawn_container(client, image: str, labels: dict = None, cpu: int = None):
+    """Запускает контейнер-песочницу: без сети, с потолком памяти и /workspace на tmpfs.
+
+    Кеш тулчейна образа (toolchain_cache), если он есть, монтируется только для чтения.
+    cpu — ядро, за которым закреплен контейнер (None — без закрепления).
+    """
+    return client.containers.run(
+        image, ["sleep", "infinity"],
+        detach=True,
+        network_disabled=True,
+        mem_limit=POOL_MEMORY,
+        memswap_limit=POOL_MEMORY,
+        tmpfs={"/workspace": WORKSPACE_TMPFS},
+        volumes=toolchain_caches.volumes(image),
+        cpuset_cpus=str(cpu) if cpu is not None else None,
+        working_dir="/workspace",
+        labels={**(labels or {}), OWNER_LABEL: OWNER}
+    )
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def owner_alive(owner: str) -> bool:
+    """Жив ли процесс-владелец с этого хоста; чужие хосты считаем живыми"""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    return pid_alive(int(pid))
+
+
+def reap_orphans(client) -> int:
+    """Удаляет контейнеры, оставшиеся от упавших процессов судьи на этом хосте"""
+    removed = 0
+    for container in client.containers.list(all=True, filters={"label": OWNER_LABEL}):
+        if owner_alive(container.labels.get(OWNER_LABEL, "")):
+            continue
+        try:
+            container.remove(force=True)
+            removed += 1
+        except Exception as e:
+            print(f"Failed to remove orphaned container {container.id[:12]}: {e}")
+    return removed
+
+
+class PooledContainer:
+    """Заранее запущенный контейнер, в который задания попадают через exec"""
+
+    def __init__(self, client, container, image: str = None):
+        self.client = client
+        self.container = container
+        self.toolchain = image
+        # каталог кеша тулчейна, примонтированный в контейнер (см. spawn_container)
+        self.cache_dir = toolchain_caches.host_dir(image)
+        self.cpu = None
+        self.memory = POOL_MEMORY
+        self.uses = 0
+        self.broken = False
+
+    @property
+    def id(self):
+        return self.container.id
+
+    def put_file(self, path: str, content, mode: int = 0o644):
+        """Кладет файл в контейнер через stdin exec: архивный API не пишет в tmpfs"""
+        data = content.encode() if isinstance(content, str) else content
+        quoted = shlex.quote(path)
+        exit_code, _, stderr, _ = self.exec(f"cat > {quoted} && chmod {mode:o} {quoted}", stdin=data, timeout=30)
+        if exit_code != 0:
+            raise OSError(f"Failed to write {path}: {stderr.decode(errors='replace').strip()}")
+
+    def get_file(self, path: str) -> bytes:
+        """Забирает файл из контейнера через stdout exec"""
+        exit_code, stdout, stderr, _ = self.exec(f"cat {shlex.quote(path)}", timeout=30)
+        if exit_code != 0:
+            raise FileNotFoundError(f"Failed to read {path}: {stderr.decode(errors='replace').strip()}")
+        return stdout
+
+    def exec(self, cmd: str, stdin=None, timeout: float = None, cancel: threading.Event = None,
+             on_stdout=None, watchdog=None, memory_mb: int = None, max_output: int = None):
+        """Выполняет команду в контейнере: (exit_code, stdout, stderr, timed_out).
+
+        stdin — байты или итератор кусков (большие тесты идут потоком).
+        on_stdout получает куски вывода по мере поступления (тогда stdout не копится
+        и возвращается пустым), watchdog — подвижный дедлайн (см. read_frames).
+        Если stdout длиннее max_output, команду останавливают, а stdout обрезается
+        до max_output + 1 байта. При таймауте, отмене или переполнении процессы
+        в контейнере убиваются; если это не удалось, контейнер помечается сломанным
+        и пересоздается. Потолок памяти контейнера на время команды — memory_mb
+        плюс MEMORY_HEADROOM_MB, как и в остальных песочницах.
+        """
+        self.limit_memory(memory_mb)
+        api = self.client.api
+        exec_id = api.exec_create(
+            self.container.id, ["sh", "-c", cmd],
+            stdin=stdin is not None, stdout=True, stderr=True,
+            workdir="/workspace"
+        )["Id"]
+        sock = api.exec_start(exec_id, socket=True)
+        raw = getattr(sock, "_sock", sock)
+        deadline = time.monotonic() + timeout if timeout else None
+
+        if stdin is not None:
+            # пишем в отдельном потоке, чтобы большой вывод не заблокировал запись
+            def feed():
+                try:
+                    for chunk in stdin_chunks(stdin):
+                        raw.sendall(chunk)
+                    raw.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+            threading.Thread(target=feed, daemon=True).start()
+
+        stdout, stderr = OutputBuffer(max_output), OutputBuffer(STDERR_LIMIT)
+        timed_out = False
+        try:
+            for stream, chunk in read_frames(raw, deadline, cancel, watchdog):
+                if stream == STDOUT:
+                    if on_stdout is not None:
+                        on_stdout(chunk)
+                    elif not stdout.add(chunk):
+                        break
+                elif stream == STDERR:
+                    stderr.add(chunk)
+        except (socket.timeout, TimeoutError):
+            timed_out = True
+        finally:
+            sock.close()
+        if timed_out or stdout.overflow:
+            self.broken = not self.kill_processes()
+
+        exit_code = None if timed_out or stdout.overflow else api.exec_inspect(exec_id).get("ExitCode")
+        return exit_code, stdout.value(), stderr.value(), timed_out
+
+    def pin(self, cpu: int):
+        """Закрепляет контейнер за ядром проверки (docker update --cpuset-cpus)"""
+        if cpu is None or cpu == self.cpu:
+            return
+        self.container.update(cpuset_cpus=str(cpu))
+        self.cpu = cpu
+
+    def limit_memory(self, memory_mb: int):
+        """Потолок памяти контейнера (docker update); меняется, только если отличается"""
+        if memory_mb is None:
+            return
+        limit = f"{memory_mb + MEMORY_HEADROOM_MB}m"
+        if limit == self.memory:
+            return
+        self.container.update(mem_limit=limit, memswap_limit=limit)
+        self.memory = limit
+
+    def kill_processes(self) -> bool:
+        """Убивает все процессы контейнера, кроме основного (sleep)"""
+        try:
+            result = self.container.exec_run(["sh", "-c", "kill -9 -1"])
+            return result.exit_code in (0, 1)
+        except Exception:
+            return False
+
+    def reset(self) -> bool:
+        """Готовит контейнер к следующему заданию: никаких процессов и файлов предыдущего.
+
+        False — очистить не удалось, контейнер надо пересоздать.
+        """
+        try:
+            result = self.container.exec_run(["sh", "-c", RESET_SCRIPT])
+            return result.exit_code == 0
+        except Exception:
+            return False
+
+    def healthy(self) -> bool:
+        try:
+            self.container.reload()
+            return self.container.status == "running"
+        except Exception:
+            return False
+
+    def destroy(self):
+        try:
+            self.container.remove(force=True)
+        except Exception:
+            pass
+
+
+class LanguagePool:
+    """Пул теплых контейнеров одного образа"""
+
+    def __init__(self, client, lang: str, image: str,
+                 min_size: int = POOL_MIN, max_size: int = POOL_MAX, max_uses: int = POOL_MAX_USES):
+        self.client = client
+        self.lang = lang
+        self.image = image
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.max_uses = max_uses
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _spawn(self) -> PooledContainer:
+        container = spawn_container(self.client, self.image, labels={"codebattle.pool": self.lang})
+        return PooledContainer(self.client, container, self.image)
+
+    def acquire(self, timeout: float = POOL_ACQUIRE_TIMEOUT) -> PooledContainer:
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._closed:
+                        raise PoolExhausted(f"No free {self.lang} container")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    box = self._idle.pop()
+                else:
+                    self._size += 1
+                    box = None
+
+            if box is None:
+                try:
+                    return self._spawn()
+                except Exception:
+                    self._forget()
+                    raise
+
+            if box.healthy():
+                return box
+            box.destroy()
+            self._forget()
+
+    def release(self, box: PooledContainer):
+        box.uses += 1
+        recycle = box.broken or box.uses >= self.max_uses or self._closed or not box.reset()
+        if recycle:
+            box.destroy()
+            self._forget()
+            threading.Thread(target=self.fill, daemon=True).start()
+            return
+        with self._cond:
+            self._idle.append(box)
+            self._cond.notify()
+
+    def _forget(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def fill(self):
+        """Дозапускает контейнеры до минимального размера"""
+        while not self._closed:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                box = self._spawn()
+            except Exception as e:
+                self._forget()
+                print(f"Pool {self.lang}: failed to start container: {e}")
+                return
+            with self._cond:
+                self._idle.append(box)
+                self._cond.notify()
+
+    def health_check(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        alive = []
+        for box in idle:
+            if box.healthy():
+                alive.append(box)
+            else:
+                box.destroy()
+                self._forget()
+        with self._cond:
+            self._idle.extend(alive)
+            self._cond.notify_all()
+        self.fill()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for box in idle:
+            box.destroy()
+            self._forget()
+
+
+class ContainerPool:
+    """Теплые контейнеры для каждого языка из LANG_CONFIG"""
+
+    def __init__(self):
+        self.pools = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, client, lang_config: dict):
+        if POOL_MAX <= 0:
+            return
+        # один образ (gcc:12 у c и cpp) — один пул
+        by_image = {}
+        for lang, config in lang_config.items():
+            pool = by_image.get(config["image"])
+            if pool is None:
+                pool = by_image[config["image"]] = LanguagePool(client, lang, config["image"])
+            self.pools[lang] = pool
+        for pool in by_image.values():
+            pool.fill()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._health_loop, daemon=True)
+        self._thread.start()
+
+    def _health_loop(self):
+        while not self._stop.wait(POOL_HEALTH_INTERVAL):
+            for pool in set(self.pools.values()):
+                try:
+                    pool.health_check()
+                except Exception as e:
+                    print(f"Pool {pool.lang}: health check failed: {e}")
+
+    def enabled(self, lang: str) -> bool:
+        return lang in self.pools
+
+    @contextmanager
+    def container(self, lang: str, cpu: int = None):
+        pool = self.pools[lang]
+        box = pool.acquire()
+        try:
+            # теплый контейнер переходит между проверками — ядро назначается на каждую
+            box.pin(cpu)
+            yield box
+        except BaseException:
+            box.broken = True
+            raise
+        finally:
+            pool.release(box)
+
+    def close(self):
+        self._stop.set()
+        for pool in set(self.pools.values()):
+            pool.close()
+        self.pools = {}
+
+
+container_pool = ContainerPool()
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from sqlalchemy.exc import IntegrityError
+import warap
+from warap import parse_parameters, harness_template, HarnessTemplate, BatchNotSupported
+from judge import LANG_CONFIG
+from database import session_local
+from models import TaskSignature
+
+
+HARNESS_CACHE_SIZE = int(os.getenv("JUDGE_HARNESS_CACHE_SIZE", "256"))
+# обертки собирает warap.py: после его правки сохраненные шаблоны устаревают
+HARNESS_VERSION = hashlib.sha256(Path(warap.__file__).read_bytes()).hexdigest()
+
+
+class TaskHarness:
+    """Сигнатура задачи и шаблон пакетной обертки (None — собирается из кода решения)"""
+
+    def __init__(self, param_types: list, template: HarnessTemplate = None):
+        self.param_types = param_types
+        self.template = template
+
+
+def _isolate(lang: str) -> bool:
+    return LANG_CONFIG.get(lang, {}).get("isolate", False)
+
+
+def signature_key(task) -> str:
+    """Меняется вместе с Task.code, языком задачи и версией оберток"""
+    digest = hashlib.sha256()
+    for part in (task.language, task.code or "", HARNESS_VERSION, str(_isolate(task.language))):
+        data = part.encode()
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def build_harness(lang: str, code: str) -> TaskHarness:
+    """Разбирает сигнатуру и собирает шаблон обертки с нуля"""
+    param_types = parse_parameters(code or "", lang)
+    try:
+        template = harness_template(lang, param_types, _isolate(lang))
+    except (ValueError, BatchNotSupported):
+        template = None
+    return TaskHarness(param_types, template)
+
+
+class HarnessCache:
+    """LRU сигнатур и оберток задач поверх task_signatures.
+
+    Разбор сигнатуры и сборка обертки одинаковы для всех посылок задачи —
+    делаются один раз, а посылке остается подставить свой код в шаблон.
+    """
+
+    def __init__(self, max_entries: int = HARNESS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, task) -> TaskHarness:
+        key = signature_key(task)
+        with self._lock:
+            entry = self._entries.get(task.id)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(task.id)
+                return entry[1]
+
+        harness = self._load(task, key)
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[task.id] = (key, harness)
+                self._entries.move_to_end(task.id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return harness
+
+    def _load(self, task, key: str) -> TaskHarness:
+        db = session_local()
+        try:
+            row = db.query(TaskSignature).filter(TaskSignature.task_id == task.id).first()
+            if row is not None and row.key == key:
+                template = None
+                if row.harness is not None:
+                    template = HarnessTemplate(task.language, row.harness, _isolate(task.language))
+                return TaskHarness(json.loads(row.param_types), template)
+
+            # строки нет или Task.code с тех пор поменялся — собираем заново
+            harness = build_harness(task.language, task.code)
+            if row is None:
+                row = TaskSignature(task_id=task.id)
+                db.add(row)
+            row.key = key
+            row.param_types = json.dumps(harness.param_types)
+            row.harness = harness.template.source if harness.template is not None else None
+            try:
+                db.commit()
+            except IntegrityError:
+                # ту же задачу одновременно собрал другой воркер
+                db.rollback()
+            return harness
+        finally:
+            db.close()
+
+
+harness_cache = HarnessCache()
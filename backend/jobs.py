@@ -0,0 +1,968 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from fastapi.concurrency import run_in_threadpool
+from database import session_local
+from sqlalchemy import func, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from models import JudgeJob, JudgeLease, Task, TaskLimit, TaskChecker, task_test, TestStat, User, Solution, SubmissionStat, ComplexityEstimate
+from judge import run_tests_async, grade, grade_one, resolve_limits, CompileError, COMPILE_TIMEOUT_ERROR
+from verdict_cache import verdict_cache, verdict_key, tests_version
+from testgen import generate_cases, generate_scaled, minimize_tests, save_generated_tests
+from complexity import COMPLEXITY_SCALES, fit_complexity, scale_inputs, scale_points
+from harness_cache import harness_cache, build_harness
+from checker import make_comparator, DEFAULT_COMPARATOR
+from test_store import load_tests, test_source, test_expected
+from admission import admit, fair_queue, priority
+
+
+JUDGE_WORKERS = int(os.getenv("JUDGE_WORKERS", "2"))
+QUEUE_POLL_INTERVAL = float(os.getenv("JUDGE_QUEUE_POLL_INTERVAL", "1"))
+# аренда задания: воркер продлевает ее каждые LEASE_SECONDS / 3; не продленное
+# задание (воркер упал или потерял базу) возвращается в очередь
+LEASE_SECONDS = float(os.getenv("JUDGE_LEASE_SECONDS", "30"))
+HEARTBEAT_INTERVAL = LEASE_SECONDS / 3
+# воркеры на разных хостах отличаются именем хоста и pid
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+EVENTS_POLL_INTERVAL = 0.25
+# как часто воркер проверяет, не отменены ли его задания (клиент ушел со страницы)
+CANCEL_POLL_INTERVAL = float(os.getenv("JUDGE_CANCEL_POLL_INTERVAL", "1"))
+CANCELLED_ERROR = "Cancelled: client disconnected"
+# задание больше не изменится
+FINAL_STATUSES = ("done", "failed", "cancelled")
+EVENTS_KEEPALIVE = 15
+# 1 — проверка останавливается на первом непройденном тесте; по умолчанию гоняются все тесты
+FAIL_FAST = os.getenv("JUDGE_FAIL_FAST", "0") != "0"
+# порядок тестов: сначала примеры, затем скрытые
+TEST_TIERS = ("sample", "hidden")
+# в итоге принятой посылки, пока ее сложность оценивает отдельное задание
+COMPLEXITY_PENDING = {"status": "pending"}
+# прирост ELO за первое решение задачи по ее сложности
+ELO_BY_DIFFICULTY = {1: 15, 2: 30, 3: 45, 4: 50, 5: 65}
+
+
+def _admit(db, user_id: int, kind: str):
+    # оценки сложности ставит сам судья: места в очереди у посылок они не отнимают
+    queued = (
+        db.query(func.count(JudgeJob.id))
+        .filter(JudgeJob.status == "queued", JudgeJob.kind != "complexity")
+        .scalar()
+    )
+    admit(queued, user_id, kind, JUDGE_WORKERS)
+
+
+def enqueue_submission(db, task_id: int, user_id: int, code: str, battle: bool = False) -> JudgeJob:
+    """Кладет посылку в очередь и будит воркеров; посылки боя идут вне очереди практики.
+
+    Бросает admission.JudgeBusy, если пользователь превысил лимит или очередь переполнена.
+    """
+    kind = "battle" if battle else "submission"
+    _admit(db, user_id, kind)
+    job = JudgeJob(kind=kind, task_id=task_id, user_id=user_id, code=code, status="queued")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    job_queue.notify()
+    return job
+
+
+def enqueue_test_generation(db, task: Task, user_id: int) -> JudgeJob:
+    """Ставит в очередь генерацию скрытых тестов по эталонному решению задачи"""
+    _admit(db, user_id, "generate_tests")
+    job = JudgeJob(kind="generate_tests", task_id=task.id, user_id=user_id, code=task.code, status="queued")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    job_queue.notify()
+    return job
+
+
+def enqueue_complexity(parent_id: str, task_id: int, user_id: int, code: str) -> str:
+    """Ставит в очередь оценку сложности принятой посылки parent_id.
+
+    Класс приоритета самый низкий, admission не применяется: задание заказывает
+    судья, а не пользователь.
+    """
+    db = session_local()
+    try:
+        job = JudgeJob(kind="complexity", parent_id=parent_id, task_id=task_id, user_id=user_id,
+                       code=code, status="queued")
+        db.add(job)
+        db.commit()
+        job_id = job.id
+    finally:
+        db.close()
+    job_queue.notify()
+    return job_id
+
+
+def _result_fields(kind: str, result: dict) -> dict:
+    """Поля итога для клиента: у посылок status итога — вердикт (OK / WA / TLE / MLE / OLE / RE / CE),
+    у остальных заданий вердикта нет, а status — только состояние задания"""
+    fields = dict(result)
+    result_status = fields.pop("status", None)
+    if kind in ("submission", "battle"):
+        fields.setdefault("verdict", result_status)
+    return fields
+
+
+def job_out(job: JudgeJob) -> dict:
+    out = {"job_id": job.id, "kind": job.kind, "status": job.status}
+    if job.status == "running":
+        progress = job_events.latest(job.id, "progress")
+        if progress is not None:
+            out["progress"] = {"done": progress["done"], "total": progress["total"]}
+    if job.result:
+        out.update(_result_fields(job.kind, json.loads(job.result)))
+    return out
+
+
+def _load_job(job_id: str):
+    db = session_local()
+    try:
+        return db.query(JudgeJob).filter(JudgeJob.id == job_id).first()
+    finally:
+        db.close()
+
+
+class JobEvents:
+    """Живые события проверки: история и подписчики каждой посылки в работе"""
+
+    def __init__(self):
+        self._loop = None
+        self._history = {}
+        self._subscribers = {}
+
+    def bind(self, loop):
+        self._loop = loop
+
+    def open(self, job_id: str):
+        self._history[job_id] = []
+        self._subscribers.setdefault(job_id, set())
+
+    def publish(self, job_id: str, event: dict):
+        history = self._history.get(job_id)
+        if history is None:
+            return
+        history.append(event)
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait(event)
+
+    def publish_threadsafe(self, job_id: str, event: dict):
+        # вердикты по тестам приходят из потока судьи
+        self._loop.call_soon_threadsafe(self.publish, job_id, event)
+
+    def close(self, job_id: str):
+        self._history.pop(job_id, None)
+        for queue in self._subscribers.pop(job_id, ()):
+            queue.put_nowait(None)
+
+    def latest(self, job_id: str, name: str):
+        """Последнее событие данного типа по посылке в работе"""
+        for event in reversed(self._history.get(job_id, ())):
+            if event["event"] == name:
+                return event
+        return None
+
+    def subscribe(self, job_id: str):
+        """(уже случившиеся события, очередь новых) или None, если посылка не в работе"""
+        if job_id not in self._history:
+            return None
+        queue = asyncio.Queue()
+        self._subscribers[job_id].add(queue)
+        return list(self._history[job_id]), queue
+
+    def unsubscribe(self, job_id: str, queue):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+
+
+job_events = JobEvents()
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+def _summary_event(kind: str, status: str, result: dict) -> dict:
+    summary = _result_fields(kind, {key: value for key, value in result.items() if key != "results"})
+    return {"event": "summary", "status": status, **summary}
+
+
+async def job_event_stream(job_id: str):
+    """SSE-поток посылки: вердикт каждого теста по мере готовности, затем итог.
+
+    Если посылка уже проверена, события восстанавливаются из сохраненного результата.
+    Пока она ждет в очереди или идет в другом процессе, база опрашивается, но
+    событие status уходит только при смене статуса, а между ними — keepalive.
+    """
+    subscription = job_events.subscribe(job_id)
+    last_status = None
+    last_sent = time.monotonic()
+    while subscription is None:
+        job = await run_in_threadpool(_load_job, job_id)
+        if job is None:
+            yield _sse({"event": "error", "error": "Job not found"})
+            return
+        if job.status in FINAL_STATUSES:
+            result = json.loads(job.result or "{}")
+            for index, test in enumerate(result.get("results", [])):
+                yield _sse({"event": "test", "index": index, **test})
+            yield _sse(_summary_event(job.kind, job.status, result))
+            return
+        if job.status != last_status:
+            last_status = job.status
+            last_sent = time.monotonic()
+            yield _sse({"event": "status", "status": job.status})
+        elif time.monotonic() - last_sent >= EVENTS_KEEPALIVE:
+            last_sent = time.monotonic()
+            yield ": keepalive\n\n"
+        await asyncio.sleep(EVENTS_POLL_INTERVAL)
+        subscription = job_events.subscribe(job_id)
+
+    history, queue = subscription
+    try:
+        for event in history:
+            yield _sse(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                return
+            yield _sse(event)
+    finally:
+        job_events.unsubscribe(job_id, queue)
+
+
+def cancel_job(job_id: str) -> bool:
+    """Отменяет задание, итог которого еще не записан.
+
+    Ждущее в очереди сразу получает статус cancelled; у идущего ставится
+    cancelled_at, и воркер, который его проверяет, прерывает проверку.
+    """
+    db = session_local()
+    try:
+        now = datetime.now(timezone.utc)
+        cancelled = (
+            db.query(JudgeJob)
+            .filter(JudgeJob.id == job_id, JudgeJob.status == "queued")
+            .update({"status": "cancelled", "cancelled_at": now, "finished_at": now,
+                     "result": json.dumps({"error": CANCELLED_ERROR})}, synchronize_session=False)
+        ) or (
+            db.query(JudgeJob)
+            .filter(JudgeJob.id == job_id, JudgeJob.status == "running")
+            .update({"cancelled_at": now}, synchronize_session=False)
+        )
+        db.commit()
+        return bool(cancelled)
+    finally:
+        db.close()
+
+
+def _cancel_requested(job_ids: list) -> list:
+    """Какие из заданий этого воркера отменены"""
+    if not job_ids:
+        return []
+    db = session_local()
+    try:
+        return [
+            job_id for job_id, in db.query(JudgeJob.id)
+            .filter(JudgeJob.id.in_(job_ids), JudgeJob.cancelled_at.isnot(None))
+            .all()
+        ]
+    finally:
+        db.close()
+
+
+def _claim_next():
+    """Забирает следующее задание: (id, kind, task_id, user_id, code) или None.
+
+    Сначала — старший класс приоритета из ждущих, внутри него — пользователь,
+    которого fair_queue обслужил меньше всех, и его самое старое задание.
+    Строка берется FOR UPDATE SKIP LOCKED: воркеры других процессов и хостов
+    не ждут друг друга на одной строке. Дважды задание не заберут и без этого:
+    его переводит в running условный UPDATE ... WHERE status = 'queued'.
+    Вместе с заданием в той же транзакции заводится его аренда.
+    """
+    db = session_local()
+    try:
+        while True:
+            heads = (
+                db.query(JudgeJob.kind, JudgeJob.user_id, func.min(JudgeJob.created_at))
+                .filter(JudgeJob.status == "queued")
+                .group_by(JudgeJob.kind, JudgeJob.user_id)
+                .all()
+            )
+            if not heads:
+                return None
+            top = min(priority(kind) for kind, _, _ in heads)
+            kinds = {kind for kind, _, _ in heads if priority(kind) == top}
+            oldest = {}
+            for kind, user_id, created_at in heads:
+                if kind in kinds and (user_id not in oldest or created_at < oldest[user_id]):
+                    oldest[user_id] = created_at
+            user_id = fair_queue.pick(list(oldest.items()))
+            queued = db.query(JudgeJob).filter(JudgeJob.status == "queued", JudgeJob.kind.in_(kinds))
+            # задания пользователя могут быть заблокированы соседом — тогда самое старое в классе
+            job = (
+                queued.filter(JudgeJob.user_id == user_id)
+                .order_by(JudgeJob.created_at)
+                .with_for_update(skip_locked=True)
+                .first()
+            ) or queued.order_by(JudgeJob.created_at).with_for_update(skip_locked=True).first()
+            if job is None:
+                # все ждущие задания сейчас забирают другие воркеры
+                db.rollback()
+                return None
+            # условный UPDATE: если посылку уже забрал другой воркер, берем следующую
+            now = datetime.now(timezone.utc)
+            claimed = (
+                db.query(JudgeJob)
+                .filter(JudgeJob.id == job.id, JudgeJob.status == "queued")
+                .update({"status": "running", "started_at": now}, synchronize_session=False)
+            )
+            if claimed:
+                db.merge(JudgeLease(
+                    job_id=job.id, worker_id=WORKER_ID,
+                    heartbeat_at=now, expires_at=now + timedelta(seconds=LEASE_SECONDS)
+                ))
+            db.commit()
+            if claimed:
+                return job.id, job.kind, job.task_id, job.user_id, job.code
+    finally:
+        db.close()
+
+
+def _finish(job_id: str, status: str, result: dict) -> bool:
+    """Сохраняет итог, если аренда задания все еще у этого воркера.
+
+    Если аренду успели отобрать (пульс не доходил до базы), задание уже
+    проверяет другой воркер — его итог и запишется.
+    """
+    db = session_local()
+    try:
+        released = (
+            db.query(JudgeLease)
+            .filter(JudgeLease.job_id == job_id, JudgeLease.worker_id == WORKER_ID)
+            .delete(synchronize_session=False)
+        )
+        if not released:
+            db.rollback()
+            return False
+        db.query(JudgeJob).filter(JudgeJob.id == job_id).update({
+            "status": status,
+            "result": json.dumps(result),
+            "finished_at": datetime.now(timezone.utc)
+        }, synchronize_session=False)
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def _heartbeat(job_ids: list) -> int:
+    """Продлевает аренду заданий, которые этот воркер сейчас проверяет.
+
+    Аренда задания, итог которого не удалось записать, не продлевается —
+    истекает, и задание возвращается в очередь.
+    """
+    if not job_ids:
+        return 0
+    db = session_local()
+    try:
+        now = datetime.now(timezone.utc)
+        renewed = (
+            db.query(JudgeLease)
+            .filter(JudgeLease.worker_id == WORKER_ID, JudgeLease.job_id.in_(job_ids))
+            .update({"heartbeat_at": now, "expires_at": now + timedelta(seconds=LEASE_SECONDS)},
+                    synchronize_session=False)
+        )
+        db.commit()
+        return renewed
+    finally:
+        db.close()
+
+
+def _requeue_expired(worker_id: str = None) -> int:
+    """Возвращает в очередь задания с просроченной арендой (или без нее).
+
+    С worker_id — все задания этого воркера: так он отдает их при остановке.
+    """
+    db = session_local()
+    try:
+        query = (
+            db.query(JudgeJob)
+            .outerjoin(JudgeLease, JudgeLease.job_id == JudgeJob.id)
+            .filter(JudgeJob.status == "running")
+        )
+        if worker_id is not None:
+            query = query.filter(JudgeLease.worker_id == worker_id)
+        else:
+            query = query.filter(or_(JudgeLease.job_id.is_(None), JudgeLease.expires_at < datetime.now(timezone.utc)))
+        expired = [job.id for job in query.with_for_update(of=JudgeJob, skip_locked=True).all()]
+        if expired:
+            db.query(JudgeLease).filter(JudgeLease.job_id.in_(expired)).delete(synchronize_session=False)
+            db.query(JudgeJob).filter(JudgeJob.id.in_(expired)).update(
+                {"status": "queued", "started_at": None}, synchronize_session=False
+            )
+        db.commit()
+        return len(expired)
+    finally:
+        db.close()
+
+
+def _load_task(task_id: int):
+    """(task, тесты, лимиты, компаратор) задачи; компаратор — {"comparator", "tolerance"}"""
+    db = session_local()
+    try:
+        task = db.query(Task).filter(Task.id == task_id).first()
+        testiki = db.query(task_test).filter(task_test.task_id == task_id).order_by(task_test.id).all()
+        testiki = load_tests(db, testiki)
+        if task is None:
+            return None, testiki, None, None
+        limit = db.query(TaskLimit).filter(TaskLimit.task_id == task_id, TaskLimit.language == task.language).first()
+        limits = resolve_limits(
+            task.language,
+            limit.time_limit_ms if limit else None,
+            limit.memory_limit_mb if limit else None
+        )
+        checker = db.query(TaskChecker).filter(TaskChecker.task_id == task_id).first()
+        comparator = {
+            "comparator": checker.comparator if checker else DEFAULT_COMPARATOR,
+            "tolerance": checker.tolerance if checker else None
+        }
+        return task, testiki, limits, comparator
+    finally:
+        db.close()
+
+
+def _order_tests(testiki: list) -> list:
+    """Примеры, затем скрытые тесты — чаще всего валившие посылки первыми.
+
+    Доля провалов сглажена (failures + 1) / (runs + 2): новые и редко доходившие
+    до запуска тесты получают шанс подняться выше.
+    """
+    db = session_local()
+    try:
+        stats = {
+            stat.test_id: stat
+            for stat in db.query(TestStat).filter(TestStat.test_id.in_([test.id for test in testiki])).all()
+        }
+    finally:
+        db.close()
+
+    def key(test):
+        tier = TEST_TIERS.index(test.test_type) if test.test_type in TEST_TIERS else len(TEST_TIERS)
+        stat = stats.get(test.id)
+        runs, failures = (stat.runs, stat.failures) if stat else (0, 0)
+        return tier, -(failures + 1) / (runs + 2), test.id
+
+    return sorted(testiki, key=key)
+
+
+def _record_test_stats(results: list):
+    """Учитывает прогон в статистике тестов; она эвристика, гонки между воркерами не страшны"""
+    db = session_local()
+    try:
+        counted = {result["test_id"]: not result["passed"] for result in results if result.get("test_id")}
+        existing = {
+            stat.test_id: stat
+            for stat in db.query(TestStat).filter(TestStat.test_id.in_(list(counted))).all()
+        }
+        for test_id, failed in counted.items():
+            stat = existing.get(test_id)
+            if stat is None:
+                db.add(TestStat(test_id=test_id, runs=1, failures=int(failed)))
+            else:
+                stat.runs = TestStat.runs + 1
+                stat.failures = TestStat.failures + int(failed)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+    finally:
+        db.close()
+
+
+def _save_accepted(task_id: int, user_id: int, solution: str) -> int:
+    """Засчитывает решение и начисляет ELO, если задача решена впервые; возвращает прирост ELO.
+
+    Две одновременные принятые посылки не засчитаются дважды: строку решения
+    вставляет только одна (уникальность user_id + task_id), и ELO начисляет
+    только она — атомарным UPDATE, без чтения старого значения.
+    """
+    db = session_local()
+    try:
+        myTest = db.query(Task).filter(Task.id == task_id).first()
+        inserted = db.execute(
+            insert(Solution)
+            .values(
+                user_id=user_id,
+                task_id=task_id,
+                solution=solution,
+                submitted_at=datetime.now(timezone.utc),
+                is_correct=True
+            )
+            .on_conflict_do_nothing(index_elements=["user_id", "task_id"])
+            .returning(Solution.id)
+        ).first()
+
+        elo_delta = 0
+        if inserted is not None:
+            elo_delta = ELO_BY_DIFFICULTY.get(myTest.difficulty, 0)
+            updated = db.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(elo=User.elo + elo_delta, solved=func.coalesce(User.solved, 0) + 1)
+            )
+            if updated.rowcount == 0:
+                raise ValueError("User not found")
+        db.commit()
+        return elo_delta
+    finally:
+        db.close()
+
+
+def _cacheable(verdict: dict) -> bool:
+    # таймауты зависят от нагрузки на машину — такие вердикты не запоминаем
+    if verdict.get("error") == COMPILE_TIMEOUT_ERROR:
+        return False
+    return all(result["verdict"] != "TLE" for result in verdict["results"])
+
+
+def _performance(results: list):
+    """Итоговые замеры посылки или None, если хоть один тест шел без замеров"""
+    if not results or any(result.get("cpu_ms") is None for result in results):
+        return None
+    return {
+        "wall_ms": round(sum(result["wall_ms"] for result in results), 3),
+        "cpu_ms": round(sum(result["cpu_ms"] for result in results), 3),
+        "memory_kb": max(result["memory_kb"] for result in results)
+    }
+
+
+def _faster_than(db, task_id: int, user_id: int, cpu_ms: float):
+    """Быстрее скольких % чужих принятых решений задачи посылка с таким процессорным временем"""
+    # лучшее принятое решение каждого другого пользователя по процессорному времени
+    best = (
+        db.query(func.min(SubmissionStat.cpu_ms))
+        .filter(
+            SubmissionStat.task_id == task_id,
+            SubmissionStat.accepted == True,
+            SubmissionStat.user_id != user_id
+        )
+        .group_by(SubmissionStat.user_id)
+        .all()
+    )
+    if not best:
+        return None
+    slower = sum(1 for (other_ms,) in best if other_ms > cpu_ms)
+    return round(100 * slower / len(best), 1)
+
+
+def _save_stats(job_id, task_id: int, user_id: int, accepted: bool, performance: dict, results: list):
+    """Сохраняет замеры посылки; для принятой возвращает, быстрее скольких % чужих решений она"""
+    db = session_local()
+    try:
+        db.add(SubmissionStat(
+            job_id=job_id,
+            task_id=task_id,
+            user_id=user_id,
+            accepted=accepted,
+            wall_ms=performance["wall_ms"],
+            cpu_ms=performance["cpu_ms"],
+            memory_kb=performance["memory_kb"],
+            tests=json.dumps([[r["wall_ms"], r["cpu_ms"], r["memory_kb"]] for r in results])
+        ))
+        db.commit()
+        if not accepted:
+            return None
+        return _faster_than(db, task_id, user_id, performance["cpu_ms"])
+    finally:
+        db.close()
+
+
+def _cached_faster_than(task_id: int, user_id: int, accepted: bool, performance: dict):
+    """Процентиль посылки из verdict_cache: ее замеры уже записаны при первом прогоне"""
+    if not accepted:
+        return None
+    db = session_local()
+    try:
+        return _faster_than(db, task_id, user_id, performance["cpu_ms"])
+    finally:
+        db.close()
+
+
+async def judge_submission(task_id: int, user_id: int, code: str, job_id: str = None) -> dict:
+    """Проверяет посылку на всех тестах задачи и засчитывает её при успехе.
+
+    Если передан job_id, вердикт каждого теста публикуется в job_events сразу по готовности.
+    Повторная посылка того же кода на тех же тестах берется из verdict_cache без запуска.
+    С FAIL_FAST тесты после первого непройденного не запускаются (skipped в итоге).
+    Сложность принятой посылки оценивается уже после вердикта отдельным заданием
+    (см. estimate_complexity); до тех пор в итоге complexity = COMPLEXITY_PENDING.
+    """
+    myTest, testiki, limits, comparator = await run_in_threadpool(_load_task, task_id)
+    if myTest is None or not testiki:
+        raise ValueError("Task not found")
+
+    total = len(testiki)
+    # лимиты и компаратор входят в ключ: с другими вердикт мог быть другим
+    key = verdict_key(
+        myTest.language, code,
+        f"{tests_version(testiki)}:{limits['time_ms']}:{limits['memory_mb']}"
+        f":{comparator['comparator']}:{comparator['tolerance']}"
+    )
+    verdict = verdict_cache.get(key)
+    cached = verdict is not None
+
+    if cached:
+        if job_id is not None:
+            for index, result in enumerate(verdict["results"]):
+                job_events.publish(job_id, {"event": "test", "index": index, "total": total, **result})
+    else:
+        verdict = await _run_submission(myTest, testiki, limits, comparator, user_id, code, job_id)
+        if _cacheable(verdict):
+            verdict_cache.put(task_id, key, verdict)
+
+    accepted = verdict["status"] == "done" and verdict["passed"] == total
+    elo_delta = 0
+    if accepted:
+        elo_delta = await run_in_threadpool(_save_accepted, task_id, user_id, code)
+
+    performance = _performance(verdict["results"])
+    if performance is not None and cached:
+        # замеры взяты из кеша: второй раз в SubmissionStat их не пишем, иначе
+        # повторные посылки одного кода искажали бы статистику задачи
+        performance["faster_than"] = await run_in_threadpool(
+            _cached_faster_than, task_id, user_id, accepted, performance
+        )
+    elif performance is not None:
+        performance["faster_than"] = await run_in_threadpool(
+            _save_stats, job_id, task_id, user_id, accepted, performance, verdict["results"]
+        )
+
+    complexity = None
+    if accepted and not cached and COMPLEXITY_SCALES and job_id is not None:
+        complexity = COMPLEXITY_PENDING
+
+    return {**verdict, "elo_delta": elo_delta, "performance": performance, "complexity": complexity}
+
+
+async def _estimate_complexity(myTest, limits: dict, user_id: int, code: str, job_id: str = None):
+    """Гоняет принятое решение на входах растущего размера и подбирает класс сложности.
+
+    Масштабы идут по возрастанию; на первом непрошедшем запуске оценка останавливается.
+    """
+    harness = await run_in_threadpool(harness_cache.get, myTest)
+    inputs = scale_inputs(lambda n: generate_scaled(harness.param_types, n))
+    try:
+        outcomes = await run_tests_async(
+            lang=myTest.language,
+            code=code,
+            param_types=harness.param_types,
+            inputs=inputs,
+            user_id=user_id,
+            limits=limits,
+            stop_on=lambda index, outcome: outcome["status"] != "ok",
+            template=harness.template
+        )
+    except CompileError:
+        return None
+
+    points, limit_n = scale_points(COMPLEXITY_SCALES, outcomes)
+    # не уложилось в лимит — на этом масштабе время не меньше лимита: оценка снизу
+    bound = [(limit_n, limits["time_ms"])] if limit_n is not None else []
+    estimate = {"class": fit_complexity(points + bound), "points": points, "limit_n": limit_n}
+    await run_in_threadpool(_save_complexity, job_id, myTest.id, user_id, estimate)
+    return estimate
+
+
+async def estimate_complexity(task_id: int, user_id: int, code: str, job_id: str = None) -> dict:
+    """Задание оценки сложности: оценка дописывается в итог родительской посылки"""
+    job = await run_in_threadpool(_load_job, job_id)
+    myTest, _, limits, _ = await run_in_threadpool(_load_task, task_id)
+    if job is None or myTest is None:
+        raise ValueError("Task not found")
+    try:
+        estimate = await _estimate_complexity(myTest, limits, user_id, code, job.parent_id)
+    except Exception:
+        # в итоге посылки не должно навсегда остаться «pending»
+        await run_in_threadpool(_set_complexity, job.parent_id, None)
+        raise
+    await run_in_threadpool(_set_complexity, job.parent_id, estimate)
+    return {"status": "done", "complexity": estimate}
+
+
+def _set_complexity(job_id: str, estimate):
+    """Заменяет complexity в сохраненном итоге посылки"""
+    db = session_local()
+    try:
+        job = db.query(JudgeJob).filter(JudgeJob.id == job_id).with_for_update().first()
+        if job is None or not job.result:
+            return
+        result = json.loads(job.result)
+        result["complexity"] = estimate
+        job.result = json.dumps(result)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _save_complexity(job_id, task_id: int, user_id: int, estimate: dict):
+    db = session_local()
+    try:
+        db.add(ComplexityEstimate(
+            job_id=job_id,
+            task_id=task_id,
+            user_id=user_id,
+            complexity=estimate["class"],
+            points=json.dumps(estimate["points"]),
+            limit_n=estimate["limit_n"]
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _run_submission(myTest, testiki: list, limits: dict, comparator: dict, user_id: int, code: str,
+                          job_id: str = None) -> dict:
+    harness = await run_in_threadpool(harness_cache.get, myTest)
+    total = len(testiki)
+    testiki = await run_in_threadpool(_order_tests, testiki)
+    checker = partial(make_comparator, comparator["comparator"], tolerance=comparator["tolerance"])
+
+    on_outcome = None
+    if job_id is not None:
+        def on_outcome(index, outcome):
+            event = {"event": "test", "index": index, "total": total, **grade_one(testiki[index], outcome, checker)}
+            job_events.publish_threadsafe(job_id, event)
+
+    stop_on = None
+    if FAIL_FAST:
+        def stop_on(index, outcome):
+            return not grade_one(testiki[index], outcome, checker)["passed"]
+
+    # компилируем один раз и гоняем все тесты одним запуском контейнера
+    try:
+        outcomes = await run_tests_async(
+            lang=myTest.language,
+            code=code,
+            param_types=harness.param_types,
+            inputs=[test_source(test) for test in testiki],
+            user_id=user_id,
+            on_outcome=on_outcome,
+            limits=limits,
+            stop_on=stop_on,
+            # вывод сравнивается по мере поступления и целиком в памяти не копится
+            check=lambda index: checker(test_expected(testiki[index])),
+            template=harness.template
+        )
+    except CompileError as e:
+        return {"status": "compile_error", "verdict": "CE", "total": total, "passed": 0, "error": str(e), "results": []}
+
+    passed, results = grade(testiki, outcomes, checker)
+    await run_in_threadpool(_record_test_stats, results)
+    # итог посылки — вердикт первого непройденного теста
+    failed = next((result["verdict"] for result in results if not result["passed"]), "OK")
+    return {
+        "status": "done", "verdict": failed, "total": total, "passed": passed,
+        "skipped": total - len(results), "results": results
+    }
+
+
+def _save_tests(task_id: int, inputs: list, outcomes: list) -> int:
+    db = session_local()
+    try:
+        generated_tests = save_generated_tests(db, task_id, inputs, outcomes)
+    finally:
+        db.close()
+    # набор тестов изменился — старые вердикты по задаче больше не нужны
+    verdict_cache.invalidate_task(task_id)
+    return generated_tests
+
+
+async def generate_tests(task_id: int, user_id: int, code: str, job_id: str = None) -> dict:
+    """Прогоняет эталонное решение на случайных и стресс-входах одним пакетом
+    и сохраняет минимальный набор тестов, покрывающий различное поведение"""
+    task, _, limits, _ = await run_in_threadpool(_load_task, task_id)
+    if task is None:
+        raise ValueError("Task not found")
+
+    # эталон из задания обычно совпадает с Task.code — тогда сигнатура и обертка уже готовы
+    if code == task.code:
+        harness = await run_in_threadpool(harness_cache.get, task)
+    else:
+        harness = build_harness(task.language, code)
+    param_types = harness.param_types
+    cases = generate_cases(param_types)
+    inputs = [input_data for input_data, _, _ in cases]
+
+    on_outcome = None
+    if job_id is not None:
+        def on_outcome(index, outcome):
+            event = {"event": "progress", "done": index + 1, "total": len(inputs)}
+            job_events.publish_threadsafe(job_id, event)
+
+    try:
+        outcomes = await run_tests_async(
+            lang=task.language,
+            code=code,
+            param_types=param_types,
+            inputs=inputs,
+            user_id=user_id,
+            on_outcome=on_outcome,
+            limits=limits,
+            template=harness.template
+        )
+    except (CompileError, ValueError) as e:
+        raise ValueError(f"Reference solution failed to compile: {str(e)}")
+
+    kept = minimize_tests(cases, outcomes)
+    generated_tests = await run_in_threadpool(
+        _save_tests, task_id, [inputs[index] for index in kept], [outcomes[index] for index in kept]
+    )
+    return {"status": "done", "total": len(inputs), "generated_tests": generated_tests}
+
+
+JOB_HANDLERS = {
+    "battle": judge_submission,
+    "submission": judge_submission,
+    "generate_tests": generate_tests,
+    "complexity": estimate_complexity,
+}
+
+
+class JobQueue:
+    """Воркеры судьи: разбирают judge_jobs (посылки и генерацию тестов) с заданным параллелизмом"""
+
+    def __init__(self):
+        self._wakeup = None
+        self._loop = None
+        self._workers = []
+        # задания в проверке у этого процесса и их задачи: аренду продлевает _leases,
+        # отмененные клиентом прерывает _cancellations
+        self._running = {}
+        self._cancelled = set()
+
+    async def start(self, workers: int = JUDGE_WORKERS):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        job_events.bind(self._loop)
+        await run_in_threadpool(_requeue_expired)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+        self._workers.append(asyncio.create_task(self._leases()))
+        self._workers.append(asyncio.create_task(self._cancellations()))
+
+    async def stop(self):
+        if not self._workers:
+            return
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # прерванные задания сразу отдаем другим воркерам, не дожидаясь конца аренды
+        try:
+            await run_in_threadpool(_requeue_expired, WORKER_ID)
+        except Exception as e:
+            print(f"Judge queue: releasing leases failed: {e}")
+
+    async def _leases(self):
+        """Пульс своих аренд и возврат в очередь чужих просроченных"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await run_in_threadpool(_heartbeat, list(self._running))
+                if await run_in_threadpool(_requeue_expired):
+                    self._wakeup.set()
+            except Exception as e:
+                print(f"Judge queue: heartbeat failed: {e}")
+
+    async def _cancellations(self):
+        """Прерывает проверку заданий, от которых ушел клиент (их отменил cancel_job)"""
+        while True:
+            await asyncio.sleep(CANCEL_POLL_INTERVAL)
+            if not self._running:
+                continue
+            try:
+                cancelled = await run_in_threadpool(_cancel_requested, list(self._running))
+            except Exception as e:
+                print(f"Judge queue: cancellation check failed: {e}")
+                continue
+            for job_id in cancelled:
+                handler = self._running.get(job_id)
+                if handler is not None and job_id not in self._cancelled:
+                    self._cancelled.add(job_id)
+                    # отмена задачи доходит до run_tests_async, и тот убивает запуск в песочнице
+                    handler.cancel()
+
+    def notify(self):
+        # enqueue зовут из потоков пула, поэтому будим через call_soon_threadsafe
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _worker(self):
+        while True:
+            try:
+                claimed = await run_in_threadpool(_claim_next)
+            except Exception as e:
+                print(f"Judge queue: claim failed: {e}")
+                claimed = None
+
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), QUEUE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, kind, task_id, user_id, code = claimed
+            handler = asyncio.create_task(JOB_HANDLERS[kind](task_id, user_id, code, job_id))
+            self._running[job_id] = handler
+            job_events.open(job_id)
+            estimate = fair_queue.start(user_id, kind)
+            started = time.monotonic()
+            try:
+                result = await handler
+                status = "done"
+            except asyncio.CancelledError:
+                if job_id not in self._cancelled:
+                    # останавливают сам воркер
+                    self._running.pop(job_id, None)
+                    job_events.close(job_id)
+                    raise
+                result, status = {"error": CANCELLED_ERROR}, "cancelled"
+            except Exception as e:
+                result, status = {"error": str(e)}, "failed"
+            try:
+                # пользователю засчитывается фактическое время судьи
+                fair_queue.finish(user_id, kind, estimate, time.monotonic() - started)
+                if await run_in_threadpool(_finish, job_id, status, result):
+                    job_events.publish(job_id, _summary_event(kind, status, result))
+                    # вердикт уже записан — сложность оценивается в фоне, когда освободится судья
+                    if status == "done" and result.get("complexity") == COMPLEXITY_PENDING:
+                        try:
+                            await run_in_threadpool(enqueue_complexity, job_id, task_id, user_id, code)
+                        except Exception as e:
+                            print(f"Judge queue: complexity job for {job_id} not queued: {e}")
+            except Exception as e:
+                # воркер продолжает работу; аренда больше не продлевается, и по ее
+                # истечении задание проверит заново любой воркер
+                print(f"Judge queue: finishing job {job_id} failed: {e}")
+            finally:
+                self._running.pop(job_id, None)
+                self._cancelled.discard(job_id)
+                job_events.close(job_id)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,523 @@
+import asyncio
+import difflib
+import os
+import secrets
+import threading
+import time
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from warap import wrap_code, wrap_code_batch, frame_batch_stream, BatchOutputParser, BatchNotSupported
+from artifact_cache import artifact_cache, artifact_key
+from sandbox import open_sandbox, JudgeCancelled, DEFAULT_MEMORY_LIMIT_MB
+from checker import make_comparator, DEFAULT_COMPARATOR
+from toolchain_cache import toolchain_caches
+from core_pool import core_pool
+
+
+LANG_CONFIG = {
+    "python": {
+        "image": "python:3.11-slim",
+        "file": "/workspace/solution.py",
+        "run": "python3 /workspace/solution.py",
+        "time_limit_ms": 2000,
+        "isolate": True
+    },
+    "js": {
+        "image": "node:20-slim",
+        "file": "/workspace/solution.js",
+        "run": "node /workspace/solution.js",
+        "time_limit_ms": 2000,
+        "isolate": True
+    },
+    "c": {
+        "image": "gcc:12",
+        "file": "/workspace/solution.c",
+        "compile": "gcc /workspace/solution.c -o /workspace/solution",
+        "artifact": "/workspace/solution",
+        "run": "/workspace/solution",
+        "time_limit_ms": 1000
+    },
+    "cpp": {
+        "image": "gcc:12",
+        "file": "/workspace/solution.cpp",
+        "compile": "g++ /workspace/solution.cpp -o /workspace/solution",
+        # заголовки обертки, предкомпилированные в кеше тулчейна
+        "toolchain_cache": (
+            "printf '#include <%s>\\n' iostream sstream vector string exception time.h sys/resource.h > judge.hpp"
+            " && g++ -x c++-header judge.hpp -o judge.hpp.gch"
+        ),
+        "compile_cached": "g++ -include /judge-cache/judge.hpp /workspace/solution.cpp -o /workspace/solution",
+        "artifact": "/workspace/solution",
+        "run": "/workspace/solution",
+        "time_limit_ms": 1000
+    },
+    "rust": {
+        "image": "rust:1.72",
+        "file": "/workspace/solution.rs",
+        "compile": "rustc /workspace/solution.rs -o /workspace/solution",
+        "artifact": "/workspace/solution",
+        "run": "/workspace/solution",
+        "time_limit_ms": 1000
+    },
+    "go": {
+        "image": "golang:1.21",
+        "file": "/workspace/solution.go",
+        "compile": "go build -o /workspace/solution /workspace/solution.go",
+        # стандартная библиотека собрана заранее: сборке остаются пакет решения и линковка
+        "toolchain_cache": "GOCACHE=/judge-cache/go go build std",
+        "compile_cached": "GOCACHE=/judge-cache/go go build -o /workspace/solution /workspace/solution.go",
+        "artifact": "/workspace/solution",
+        "run": "/workspace/solution",
+        "time_limit_ms": 1000
+    }
+}
+
+# песочница по языкам: docker (CLI), docker_sdk (теплый пул) или local (rlimit на хосте)
+DEFAULT_SANDBOX = os.getenv("JUDGE_SANDBOX", "docker_sdk")
+for _lang, _config in LANG_CONFIG.items():
+    _config.setdefault("sandbox", os.getenv(f"JUDGE_SANDBOX_{_lang.upper()}", DEFAULT_SANDBOX))
+# isolate: тест в форке заранее загруженного интерпретатора (зигота) вместо общего процесса
+if os.getenv("JUDGE_ISOLATE_TESTS", "1") == "0":
+    for _config in LANG_CONFIG.values():
+        _config["isolate"] = False
+
+COMPILE_TIMEOUT = 30
+# компилятору (rustc, g++) нужно больше памяти, чем решению
+COMPILE_MEMORY_MB = int(os.getenv("JUDGE_COMPILE_MEMORY_MB", "512"))
+# лимиты по умолчанию: время — в LANG_CONFIG, память — JUDGE_MEMORY_LIMIT_MB;
+# у задачи могут быть свои (task_limits)
+# запас на запуск контейнера и интерпретатора до первого теста
+STARTUP_GRACE = float(os.getenv("JUDGE_STARTUP_GRACE", "5"))
+# запас на передачу вывода между тестами; точный вердикт — по замеру в обертке
+CASE_SLACK = 0.5
+OOM_EXIT_CODE = 137
+# потолок вывода одного теста: больше — вердикт OLE, процесс останавливается
+OUTPUT_LIMIT = int(os.getenv("JUDGE_OUTPUT_LIMIT_KB", "8192")) * 1024
+# большие ожидаемые и фактические выводы клиенту отдаются обрезанными
+DISPLAY_LIMIT = 1000
+
+TIMEOUT_ERROR = "Time limit exceeded"
+MEMORY_ERROR = "Memory limit exceeded"
+OUTPUT_ERROR = "Output limit exceeded"
+COMPILE_TIMEOUT_ERROR = "Compilation timed out"
+# так среды выполнения сообщают об отказе в выделении памяти: при лимите через
+# RLIMIT_DATA (локальная песочница) процесс не убивают, а падает он сам
+ALLOCATION_FAILURES = (
+    "MemoryError", "std::bad_alloc", "memory allocation of", "out of memory", "cannot allocate memory"
+)
+
+# сколько посылок судится одновременно: всего и по каждому языку;
+# с закреплением за ядрами — по числу ядер проверки (лишние все равно ждали бы ядро)
+JUDGE_CONCURRENCY = int(os.getenv("JUDGE_CONCURRENCY", str(core_pool.size if core_pool.enabled else 4)))
+LANG_CONCURRENCY = {
+    lang: int(os.getenv(f"JUDGE_CONCURRENCY_{lang.upper()}", str(JUDGE_CONCURRENCY)))
+    for lang in LANG_CONFIG
+}
+
+
+class CompileError(Exception):
+    """Решение не скомпилировалось — вердикт один на всю посылку"""
+
+
+def resolve_limits(lang: str, time_limit_ms: int = None, memory_limit_mb: int = None) -> dict:
+    """Лимиты прогона: заданные у задачи или значения по умолчанию для языка"""
+    return {
+        "time_ms": time_limit_ms or LANG_CONFIG[lang]["time_limit_ms"],
+        "memory_mb": memory_limit_mb or DEFAULT_MEMORY_LIMIT_MB
+    }
+
+
+def _wrap(lang: str, code: str, param_types: list, batch: bool, template=None) -> str:
+    try:
+        if batch and template is not None:
+            # обертка задачи собрана заранее — только подставляем код
+            return template.render(code)
+        if batch:
+            return wrap_code_batch(lang, code, param_types, LANG_CONFIG[lang].get("isolate", False))
+        return wrap_code(lang, code, param_types)
+    except BatchNotSupported:
+        raise
+    except ValueError as e:
+        # не нашли функцию — для пользователя это та же ошибка компиляции
+        raise CompileError(str(e))
+
+
+def _failure(status: str, error: str) -> dict:
+    return {"output": None, "error": error, "stats": None, "status": status}
+
+
+def _allocation_failed(stderr: bytes) -> bool:
+    text = stderr.decode(errors="replace")
+    return any(marker in text for marker in ALLOCATION_FAILURES)
+
+
+def _single_outcome(returncode, stdout: bytes, stderr: bytes, timed_out: bool) -> dict:
+    """Исход одиночного прогона (без пакетной обертки и её замеров)"""
+    if len(stdout) > OUTPUT_LIMIT:
+        return _failure("ole", OUTPUT_ERROR)
+    if timed_out:
+        return _failure("tle", TIMEOUT_ERROR)
+    if returncode == OOM_EXIT_CODE or (returncode != 0 and _allocation_failed(stderr)):
+        return _failure("mle", MEMORY_ERROR)
+    if returncode != 0:
+        error_msg = stderr.decode(errors="replace").strip() or f"Container exited with code {returncode}"
+        return _failure("re", f"Container execution failed: {error_msg}")
+    return {"output": stdout.decode(errors="replace").strip(), "error": None, "stats": None, "status": "ok"}
+
+
+class _BatchCollector:
+    """Собирает результаты пакетного запуска по мере того, как тесты завершаются.
+
+    Заодно служит сторожем: deadline сдвигается после каждого теста, и если
+    очередной тест не уложился в лимит, запуск убивают, не дожидаясь остальных.
+    Если stop_on(index, outcome) вернул True, запуск тоже убивают, а оставшиеся
+    тесты не запускаются вовсе. Тест, превысивший OUTPUT_LIMIT, получает OLE,
+    а запуск убивают и продолжают со следующего теста.
+
+    Память в замерах — пик RSS процесса с начала запуска, поэтому после теста
+    с MLE запуск тоже убивают: иначе превышение припишется и всем следующим тестам.
+
+    Если задан check(index) -> Comparator, вывод теста сравнивается с ожидаемым
+    по мере поступления: целиком он не копится, в исход попадает только начало
+    (для показа) и готовый ответ сравнения в "match".
+    """
+
+    def __init__(self, count: int, limits: dict, on_outcome=None, offset: int = 0, stop_on=None, check=None):
+        self.count = count
+        self.limits = limits
+        self.on_outcome = on_outcome
+        self.stop_on = stop_on
+        self.stopped = False
+        self.aborted = False
+        self.offset = offset
+        self.outcomes = []
+        self.check = check
+        self.comparators = {}
+        # новый на каждый запуск: метки теста с другим nonce напечатало решение
+        self.nonce = secrets.token_hex(16)
+        self.parser = BatchOutputParser(
+            OUTPUT_LIMIT,
+            on_text=self._compare if check is not None else None,
+            keep=DISPLAY_LIMIT if check is not None else None,
+            nonce=self.nonce
+        )
+        self.deadline = time.monotonic() + STARTUP_GRACE + limits["time_ms"] / 1000
+
+    def _comparator(self, index: int):
+        if index not in self.comparators:
+            self.comparators[index] = self.check(index)
+        return self.comparators[index]
+
+    def _compare(self, case: int, text: str):
+        comparator = self._comparator(self.offset + case)
+        if not comparator.failed:
+            comparator.feed(text)
+
+    def _add(self, outcome: dict):
+        if len(self.outcomes) >= self.count or self.stopped or self.aborted:
+            return
+        self.outcomes.append(outcome)
+        self.deadline = time.monotonic() + self.limits["time_ms"] / 1000 + CASE_SLACK
+        index = self.offset + len(self.outcomes) - 1
+        if self.on_outcome is not None:
+            self.on_outcome(index, outcome)
+        if self.stop_on is not None and self.stop_on(index, outcome):
+            self.stopped = True
+            # дедлайн в прошлом — песочница прервет запуск при следующей проверке
+            self.deadline = 0
+
+    def _add_cases(self, cases: list):
+        for status, text, stats in cases:
+            if stats is not None and stats["wall_ms"] > self.limits["time_ms"]:
+                outcome = _failure("tle", TIMEOUT_ERROR)
+            elif stats is not None and stats["memory_kb"] > self.limits["memory_mb"] * 1024:
+                outcome = _failure("mle", MEMORY_ERROR)
+            elif status == "MLE":
+                outcome = _failure("mle", MEMORY_ERROR)
+            elif status == "OLE":
+                outcome = _failure("ole", OUTPUT_ERROR)
+            elif status == "OK":
+                outcome = {"output": text, "error": None, "status": "ok"}
+                if self.check is not None:
+                    outcome["match"] = self._comparator(self.offset + len(self.outcomes)).finish()
+            else:
+                outcome = _failure("re", text)
+            outcome["stats"] = stats
+            self.comparators.pop(self.offset + len(self.outcomes), None)
+            self._add(outcome)
+            if outcome["status"] == "mle" and not self.stopped:
+                # следующие тесты — в новом процессе, с чистым пиком памяти
+                self.aborted = True
+                self.deadline = 0
+                return
+
+    def feed(self, chunk: bytes):
+        if self.aborted:
+            return
+        ready = self.parser.ready
+        cases = self.parser.feed(chunk)
+        if self.parser.ready and not ready:
+            # процесс запустился — дальше ждем не дольше лимита на тест
+            self.deadline = time.monotonic() + self.limits["time_ms"] / 1000 + CASE_SLACK
+        self._add_cases(cases)
+        if self.parser.overflow and not self.stopped:
+            # тест еще печатает — ждать его конца незачем
+            self._add(_failure("ole", OUTPUT_ERROR))
+            self.aborted = True
+            self.deadline = 0
+
+    def finish(self, stderr: bytes, returncode, timed_out: bool) -> list:
+        """Дописывает исход теста, на котором процесс оборвался, и возвращает собранное"""
+        if self.aborted:
+            return self.outcomes
+        self._add_cases(self.parser.close())
+        if len(self.outcomes) >= self.count or self.stopped:
+            return self.outcomes
+
+        if timed_out:
+            self._add(_failure("tle", TIMEOUT_ERROR))
+        elif returncode == OOM_EXIT_CODE or _allocation_failed(stderr):
+            self._add(_failure("mle", MEMORY_ERROR))
+        else:
+            error = stderr.decode(errors="replace").strip() or f"Container exited with code {returncode}"
+            if self.offset == 0 and not self.outcomes:
+                # упало еще до первого теста — дальше запускать бессмысленно
+                while len(self.outcomes) < self.count:
+                    self._add(_failure("re", error))
+            else:
+                self._add(_failure("re", error))
+        return self.outcomes
+
+
+def _run_batches(inputs: list, limits: dict, execute, on_outcome=None, stop_on=None, check=None) -> list:
+    """Гоняет пакет, пока не будут пройдены все входы (или stop_on не остановит проверку).
+
+    execute(stdin, collector) -> (returncode, stderr, timed_out) выполняет один запуск.
+    Если тест превысил лимит или уронил процесс, следующий запуск продолжает
+    со следующего теста, а не пересчитывает всё заново.
+    """
+    outcomes = []
+    while len(outcomes) < len(inputs):
+        rest = inputs[len(outcomes):]
+        collector = _BatchCollector(len(rest), limits, on_outcome, offset=len(outcomes), stop_on=stop_on, check=check)
+        returncode, stderr, timed_out = execute(frame_batch_stream(rest, collector.nonce), collector)
+        outcomes.extend(collector.finish(stderr, returncode, timed_out))
+        if collector.stopped:
+            break
+    return outcomes
+
+
+def _single_stdin(input_data):
+    """stdin одиночного запуска: строка теста или вход из хранилища тестов (потоком)"""
+    if isinstance(input_data, str) or input_data is None:
+        return ((input_data or "") + "\n").encode()
+    return chain(input_data.chunks(), [b"\n"])
+
+
+def _compile(box, config: dict, source: str, cancel: threading.Event = None):
+    """Собирает решение в песочнице; возвращает текст ошибки компиляции или None"""
+    compile_cmd = config.get("compile")
+    if not compile_cmd:
+        # интерпретируемые языки: артефакт — сам исходник
+        return None
+    if "compile_cached" in config and toolchain_caches.ready(getattr(box, "cache_dir", None)):
+        compile_cmd = config["compile_cached"]
+
+    # тот же исходник тем же тулчейном уже собирали — компилятор не запускаем
+    key = artifact_key(box.toolchain, compile_cmd, source)
+    binary = artifact_cache.read(key)
+    if binary is not None:
+        box.put_file(config["artifact"], binary, mode=0o755)
+        return None
+
+    exit_code, _, stderr, timed_out = box.exec(
+        compile_cmd, timeout=COMPILE_TIMEOUT, cancel=cancel, memory_mb=COMPILE_MEMORY_MB
+    )
+    if cancel is not None and cancel.is_set():
+        raise JudgeCancelled()
+    if timed_out:
+        return COMPILE_TIMEOUT_ERROR
+    if exit_code != 0:
+        return stderr.decode(errors="replace").strip() or f"Compiler exited with code {exit_code}"
+
+    if artifact_cache.enabled:
+        try:
+            artifact_cache.store_bytes(key, box.get_file(config["artifact"]))
+        except Exception as e:
+            print(f"Artifact cache: store failed: {e}")
+    return None
+
+
+def run_tests(lang: str, code: str, param_types: list, inputs: list, user_id: int,
+              cancel: threading.Event = None, on_outcome=None, limits: dict = None, stop_on=None,
+              check=None, template=None) -> list:
+    """Компилирует решение один раз и прогоняет его на всех входах.
+
+    По возможности все тесты идут одним запуском через пакетную обертку;
+    если решение её не поддерживает — по запуску на тест. Где запускать,
+    решает песочница языка (LANG_CONFIG[lang]["sandbox"]).
+    Возвращает список {"output", "error", "stats", "status"} в порядке входов,
+    status — ok / tle / mle / ole / re; on_outcome(index, outcome) вызывается сразу,
+    как только завершился очередной тест. Время компиляции в лимит не входит.
+    Если stop_on(index, outcome) вернул True, остальные тесты не запускаются
+    и список исходов короче входов. check(index) -> Comparator сравнивает вывод
+    с ожидаемым прямо во время прогона (ответ — в outcome["match"]).
+    template — заранее собранная пакетная обертка задачи (warap.HarnessTemplate).
+    """
+    if lang not in LANG_CONFIG:
+        raise ValueError(f"Unsupported language: {lang}")
+    config = LANG_CONFIG[lang]
+    limits = limits or resolve_limits(lang)
+    try:
+        source = _wrap(lang, code, param_types, batch=True, template=template)
+        batch = True
+    except BatchNotSupported:
+        source = _wrap(lang, code, param_types, batch=False)
+        batch = False
+
+    # ядро — на всю проверку: компиляция и все тесты идут на нем, без соседей
+    with core_pool.core(cancel) as cpu, open_sandbox(lang, config, user_id, cpu) as box:
+        box.put_file(config["file"], source)
+        compile_error = _compile(box, config, source, cancel)
+        if compile_error is None and batch:
+            def execute(stdin: bytes, collector: _BatchCollector):
+                exit_code, _, stderr, timed_out = box.exec(
+                    config["run"], stdin=stdin, cancel=cancel, on_stdout=collector.feed,
+                    watchdog=collector, memory_mb=limits["memory_mb"]
+                )
+                if cancel is not None and cancel.is_set():
+                    raise JudgeCancelled()
+                return exit_code, stderr, timed_out
+
+            outcomes = _run_batches(inputs, limits, execute, on_outcome, stop_on, check)
+        elif compile_error is None:
+            outcomes = []
+            for input_data in inputs:
+                if cancel is not None and cancel.is_set():
+                    raise JudgeCancelled()
+                if box.broken:
+                    # контейнер не удалось очистить после убитого теста — дальше не используем
+                    outcome = _failure("re", "Sandbox is unavailable")
+                else:
+                    exit_code, stdout, stderr, timed_out = box.exec(
+                        config["run"], stdin=_single_stdin(input_data),
+                        timeout=STARTUP_GRACE + limits["time_ms"] / 1000, cancel=cancel,
+                        memory_mb=limits["memory_mb"], max_output=OUTPUT_LIMIT
+                    )
+                    outcome = _single_outcome(exit_code, stdout, stderr, timed_out)
+                    if check is not None and outcome["status"] == "ok":
+                        comparator = check(len(outcomes))
+                        comparator.feed(outcome["output"])
+                        outcome["match"] = comparator.finish()
+                outcomes.append(outcome)
+                if on_outcome is not None:
+                    on_outcome(len(outcomes) - 1, outcome)
+                if stop_on is not None and stop_on(len(outcomes) - 1, outcome):
+                    break
+
+    # ошибку компиляции поднимаем уже после выхода из песочницы: контейнер пула исправен
+    if compile_error is not None:
+        raise CompileError(compile_error)
+    return outcomes
+
+
+def _diff(expected: str, actual: str, limit: int = 20) -> str:
+    """Короткий diff ожидаемого и фактического вывода для показа пользователю"""
+    lines = difflib.unified_diff(
+        (expected or "").strip().splitlines(), (actual or "").strip().splitlines(),
+        "expected", "actual", lineterm="", n=1
+    )
+    return "\n".join(list(lines)[:limit])
+
+
+VERDICTS = {"tle": "TLE", "mle": "MLE", "ole": "OLE", "re": "RE"}
+
+
+def _shorten(text: str, limit: int = DISPLAY_LIMIT) -> str:
+    if text is None or len(text) <= limit:
+        return text
+    return text[:limit] + "…"
+
+
+def grade_one(test, outcome: dict, checker=None) -> dict:
+    """Вердикт по одному тесту в формате ответа клиенту (с замерами, если они есть).
+
+    verdict: OK, WA (неверный ответ), TLE, MLE, OLE или RE. checker(expected) -> Comparator
+    сравнивает вывод, если его не сравнили еще во время прогона.
+    """
+    input_data = test.input or ""
+    expected_output = test.output or ""
+    stats = outcome.get("stats") or {}
+    if outcome["error"] is not None:
+        return {
+            "test_id": getattr(test, "id", None),
+            "input": input_data,
+            "expected": _shorten(expected_output),
+            "actual": None,
+            "passed": False,
+            "verdict": VERDICTS.get(outcome.get("status"), "RE"),
+            "error": outcome["error"],
+            **stats
+        }
+
+    actual_output = outcome["output"]
+    if "match" in outcome:
+        ok = outcome["match"]
+    else:
+        # у теста из хранилища output — превью, полный ожидаемый вывод читается потоком
+        expected = getattr(test, "expected", expected_output)
+        comparator = (checker or partial(make_comparator, DEFAULT_COMPARATOR))(expected)
+        comparator.feed(actual_output or "")
+        ok = comparator.finish()
+    result = {
+        "test_id": getattr(test, "id", None),
+        "input": input_data,
+        "expected": _shorten(expected_output),
+        "actual": _shorten(actual_output),
+        "passed": ok,
+        "verdict": "OK" if ok else "WA",
+        "error": None,
+        **stats
+    }
+    if not ok:
+        result["diff"] = _diff(expected_output, actual_output)
+    return result
+
+
+def grade(testiki: list, outcomes: list, checker=None):
+    """Сравнивает вывод решения с ожидаемым: (passed, results)"""
+    results = [grade_one(test, outcome, checker) for test, outcome in zip(testiki, outcomes)]
+    return sum(1 for r in results if r["passed"]), results
+
+
+_executor = ThreadPoolExecutor(max_workers=JUDGE_CONCURRENCY, thread_name_prefix="judge")
+_judge_slots = asyncio.Semaphore(JUDGE_CONCURRENCY)
+_lang_slots = {lang: asyncio.Semaphore(limit) for lang, limit in LANG_CONCURRENCY.items()}
+
+
+async def run_tests_async(lang: str, code: str, param_types: list, inputs: list, user_id: int,
+                          on_outcome=None, limits: dict = None, stop_on=None,
+                          check=None, template=None) -> list:
+    """Асинхронная обертка над run_tests, не блокирующая цикл событий.
+
+    Проверка идет в отдельном пуле потоков под общим и языковым лимитами.
+    Отмена задачи (остановка воркера очереди) убивает запуск в песочнице.
+    on_outcome вызывается из потока судьи.
+    """
+    if lang not in LANG_CONFIG:
+        raise ValueError(f"Unsupported language: {lang}")
+
+    cancel = threading.Event()
+    async with _lang_slots[lang], _judge_slots:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            _executor, partial(
+                run_tests, lang, code, param_types, inputs, user_id, cancel, on_outcome, limits, stop_on, check, template
+            )
+        )
+        try:
+            return await future
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
@@ -1,6 +1,11 @@
 from fastapi import FastAPI
 import os
 from routes import router
+from core_pool import core_pool
+from jobs import job_queue, JUDGE_WORKERS
+from worker import start_sandboxes, stop_sandboxes
+from database import session_local
+from test_store import collect_test_blobs
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
@@ -12,6 +17,51 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 app = FastAPI()
 app.include_router(router)
 
+
+# JUDGE_WORKERS=0 — API только ставит задания в очередь, проверяют отдельные воркеры (worker.py)
+@app.on_event("startup")
+def start_container_pool():
+    if JUDGE_WORKERS:
+        start_sandboxes()
+
+
+@app.on_event("startup")
+def pin_api_cores():
+    # API и его потоки — на зарезервированных ядрах, остальные отданы проверкам
+    core_pool.pin_api()
+
+
+@app.on_event("startup")
+async def start_judge_workers():
+    if JUDGE_WORKERS:
+        await job_queue.start()
+
+
+@app.on_event("startup")
+def collect_unused_test_blobs():
+    # данные тестов удаленных задач и брошенные загрузки остаются в хранилище
+    db = session_local()
+    try:
+        removed = collect_test_blobs(db)
+    except Exception as e:
+        print(f"Test blob cleanup failed: {e}")
+        return
+    finally:
+        db.close()
+    if removed:
+        print(f"Test blob cleanup: removed {removed} unused blobs")
+
+
+@app.on_event("shutdown")
+async def stop_judge_workers():
+    await job_queue.stop()
+
+
+@app.on_event("shutdown")
+def stop_container_pool():
+    if JUDGE_WORKERS:
+        stop_sandboxes()
+
 app.mount("/static/imgs_avatars", StaticFiles(directory="static/imgs_avatars"), name="static_imgs")
 
 
@@ -0,0 +1,47 @@
+from sqlalchemy import text
+from database import engine
+from models import Base
+
+
+# create_all создает только недостающие таблицы: новые колонки и ограничения
+# в уже существующих таблицах доводит до схемы моделей UPGRADES.
+# Каждый шаг идемпотентен — их можно выполнять при каждом запуске.
+UPGRADES = [
+    # judge_jobs.parent_id — оценка сложности ссылается на свою посылку
+    """
+    ALTER TABLE judge_jobs ADD COLUMN IF NOT EXISTS parent_id VARCHAR(32)
+        REFERENCES judge_jobs (id) ON DELETE CASCADE
+    """,
+    # judge_jobs.cancelled_at — отмена задания, от которого ушел клиент
+    "ALTER TABLE judge_jobs ADD COLUMN IF NOT EXISTS cancelled_at TIMESTAMP WITH TIME ZONE",
+    # дубли решений (остались от гонки при засчитывании) мешают создать уникальный индекс:
+    # оставляем верное решение, а среди равных — самое раннее
+    """
+    DELETE FROM solutions WHERE id IN (
+        SELECT id FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY user_id, task_id ORDER BY is_correct DESC NULLS LAST, id
+            ) AS n
+            FROM solutions
+        ) ranked
+        WHERE n > 1
+    )
+    """,
+    # на нем держится INSERT ... ON CONFLICT (user_id, task_id) DO NOTHING
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_solutions_user_task ON solutions (user_id, task_id)",
+]
+# API и воркеры стартуют одновременно — схему обновляет кто-то один
+UPGRADE_LOCK_ID = 7201
+
+
+def init_schema(bind=engine):
+    """Создает недостающие таблицы и доводит существующие до схемы моделей"""
+    with bind.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": UPGRADE_LOCK_ID})
+        Base.metadata.create_all(bind=conn)
+        if conn.dialect.name != "postgresql":
+            # шаги написаны для PostgreSQL; в другой базе схема создается только с нуля
+            return
+        for statement in UPGRADES:
+            conn.execute(text(statement))
@@ -1,9 +1,10 @@
 from sqlalchemy import (
     Column, Integer, String, Boolean, Date, Text, TIMESTAMP,
-    ForeignKey, BigInteger, TEXT
+    ForeignKey, BigInteger, TEXT, Float, UniqueConstraint
 )
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
+import uuid
 from database import Base
 from sqlalchemy.sql import func
 
@@ -62,9 +63,58 @@ class task_test(Base):
     output = Column(String(255), nullable=False)
     test_type = Column(String(10), nullable=False)
 
+# Данные больших тестов: сжатые файлы в хранилище (test_store), в task_tests — превью
+class TestBlob(Base):
+    __tablename__ = "test_blobs"
+
+    test_id = Column(Integer, ForeignKey("task_tests.id", ondelete="CASCADE"), primary_key=True)
+    input_key = Column(String(64), nullable=True)  # sha256 несжатых данных; None — вход в task_tests
+    input_size = Column(BigInteger, nullable=True)
+    output_key = Column(String(64), nullable=True)
+    output_size = Column(BigInteger, nullable=True)
+
+# Как часто тест валит посылки: по этой статистике скрытые тесты идут от самых «злых»
+class TestStat(Base):
+    __tablename__ = "test_stats"
+
+    test_id = Column(Integer, ForeignKey("task_tests.id", ondelete="CASCADE"), primary_key=True)
+    runs = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+
+# Лимиты задачи по языкам; если строки нет, действуют значения по умолчанию из LANG_CONFIG
+class TaskLimit(Base):
+    __tablename__ = "task_limits"
+    __table_args__ = (UniqueConstraint("task_id", "language"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False)
+    language = Column(String(50), nullable=False)
+    time_limit_ms = Column(Integer, nullable=True)  # на один тест, без компиляции
+    memory_limit_mb = Column(Integer, nullable=True)
+
+# Как сравнивать вывод решений задачи с ожидаемым; если строки нет — comparator "auto"
+class TaskChecker(Base):
+    __tablename__ = "task_checkers"
+
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), primary_key=True)
+    comparator = Column(String(32), nullable=False)  # exact, tokens, float, json, unordered_lines, auto
+    tolerance = Column(Float, nullable=True)  # для float
+
+# Разобранная сигнатура задачи и заранее собранная пакетная обертка (harness_cache);
+# key — хеш Task.code, языка и версии оберток: при их изменении строка пересобирается
+class TaskSignature(Base):
+    __tablename__ = "task_signatures"
+
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String(64), nullable=False)
+    param_types = Column(Text, nullable=False)  # JSON-список типов параметров
+    harness = Column(Text, nullable=True)  # обертка с метками warap.CODE_SLOT/NAME_SLOT; None — не собрать заранее
+
 # Решения
 class Solution(Base):
     __tablename__ = "solutions"
+    # одна строка на пару: по ней решение засчитывается (и ELO начисляется) один раз
+    __table_args__ = (UniqueConstraint("user_id", "task_id", name="uq_solutions_user_task"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -98,4 +148,70 @@ class Match(Base):
     task = relationship("Task", back_populates="matches")
     player1 = relationship("User", back_populates="matches_as_player1", foreign_keys=[player1_id])
     player2 = relationship("User", back_populates="matches_as_player2", foreign_keys=[player2_id])
-    winner = relationship("User", foreign_keys=[winner_id])git init
\ No newline at end of file
+    winner = relationship("User", foreign_keys=[winner_id])
+
+
+# Очередь проверки: посылки ждут здесь, пока их не заберет воркер судьи
+class JudgeJob(Base):
+    __tablename__ = "judge_jobs"
+
+    id = Column(String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    kind = Column(String(20), nullable=False, default="submission")
+    # у оценки сложности — посылка, в итог которой допишется оценка
+    parent_id = Column(String(32), ForeignKey("judge_jobs.id", ondelete="CASCADE"), nullable=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    code = Column(TEXT, nullable=False)
+
+    status = Column(String(20), default="queued", index=True)  # queued / running / done / failed / cancelled
+    result = Column(TEXT, nullable=True)  # JSON с итогом проверки
+
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    started_at = Column(TIMESTAMP(timezone=True))
+    finished_at = Column(TIMESTAMP(timezone=True))
+    # клиент ушел, пока задание шло: воркер, который его проверяет, прерывает проверку
+    cancelled_at = Column(TIMESTAMP(timezone=True))
+
+
+# Аренда задания в работе: воркер продлевает ее пульсом, просроченные задания забирают другие
+class JudgeLease(Base):
+    __tablename__ = "judge_leases"
+
+    job_id = Column(String(32), ForeignKey("judge_jobs.id", ondelete="CASCADE"), primary_key=True)
+    worker_id = Column(String(100), nullable=False)
+    heartbeat_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+
+
+# Замеры проверенных посылок: по ним считается, быстрее какой доли решений посылка
+class SubmissionStat(Base):
+    __tablename__ = "submission_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(32), ForeignKey("judge_jobs.id", ondelete="SET NULL"), nullable=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    accepted = Column(Boolean, default=False)
+
+    wall_ms = Column(Float)  # сумма по тестам
+    cpu_ms = Column(Float)  # сумма по тестам
+    memory_kb = Column(Integer)  # пик по тестам
+    tests = Column(TEXT)  # JSON [[wall_ms, cpu_ms, memory_kb], ...] по каждому тесту
+
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+
+# Эмпирическая сложность принятой посылки: процессорное время на входах растущего размера
+class ComplexityEstimate(Base):
+    __tablename__ = "complexity_estimates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(32), ForeignKey("judge_jobs.id", ondelete="SET NULL"), nullable=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    complexity = Column(String(20), nullable=True)  # O(n log n) и т.п.; None — не удалось оценить
+    points = Column(TEXT)  # JSON [[n, cpu_ms], ...]
+    limit_n = Column(Integer, nullable=True)  # масштаб, на котором решение не уложилось в лимит
+
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
@@ -1,23 +1,27 @@
 from typing import List
 from fastapi import HTTPException, Depends, Request, APIRouter
+from fastapi.responses import StreamingResponse
 from models import *
-import uuid
-from models import Base
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
 from schemas import *
-from database import session_local, engine
-import docker
-import random
-import tempfile, os, subprocess, string, re, json
-from warap import wrap_code
-
-client = docker.DockerClient(base_url="tcp://localhost:2375")
+from database import session_local
+import os
+import asyncio
+from admission import JudgeBusy
+from jobs import enqueue_submission, enqueue_test_generation, job_out, job_event_stream, cancel_job
+from artifact_cache import artifact_cache
+from test_store import test_blobs, add_blob_test, BlobTooLarge, TEST_BLOB_MAX_BYTES
+from checker import COMPARATORS
+from harness_cache import harness_cache
+from migrations import init_schema
+from fastapi.concurrency import run_in_threadpool
 
 UPLOAD_DIR = "static/imgs_avatars"
 
 router = APIRouter()
 
-Base.metadata.create_all(bind=engine)
+init_schema()
 
 def get_db():
     db = session_local()
@@ -52,24 +56,6 @@ async def get_tasks(
             Task.status == "approved"
         ).all()
 
-def _compare(expected: str, actual: str) -> bool:
-    e = (expected or "").strip()
-    a = (actual or "").strip()
-    # попытка JSON-равенства
-    try:
-        return json.loads(e) == json.loads(a)
-    except:
-        pass
-    try:
-        if "." in e or "." in a:
-            return abs(float(e) - float(a)) < 1e-6
-        return int(e) == int(a)
-    except:
-        pass
-    def norm(s: str) -> str:
-        return "\n".join(line.rstrip() for line in s.replace("\r\n","\n").replace("\r","\n").splitlines()).strip()
-    return norm(e) == norm(a)
-
 @router.get("/api/task/{task_id}", response_model=TaskOut)
 async def get_task(task_id: int, db: Session = Depends(get_db)):
     task = db.query(Task).filter(Task.id == task_id).first()
@@ -214,95 +200,61 @@ async def extended_profile(
 #     return {"status": "done", "total": total, "passed": passed, "results": results}
 
 
-@router.post("/api/task/{task_id}/user/{user_id}/post")
-async def post_solution(task_id: int, user_id: int, mega_task: SolutionCreate, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    solutionik = db.query(Solution).filter(
-        Solution.user_id == user_id,
-        Solution.task_id == task_id
-    ).first()
-
-    
-    testiki = db.query(task_test).filter(task_test.task_id == task_id).order_by(task_test.id).all()
-    myTest = db.query(Task).filter(Task.id == task_id).first()
-
-    if not testiki:
-        raise HTTPException(status_code=404, detail="Task not found")
+def _busy(e: JudgeBusy) -> HTTPException:
+    # клиент повторяет посылку не раньше, чем через Retry-After секунд
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
-    param_types = parse_parameters(myTest.code, myTest.language)
 
-    total = len(testiki)
-    passed = 0
-    results = []
-
-    for test in testiki:
-        input_data = test.input or ""
-        expected_output = test.output or ""
-        try:
-            actual_output = run_docker_code(
-                lang=myTest.language,
-                code=mega_task.solution,
-                input_data=input_data,
-                param_types=param_types,
-                user_id=user_id
-            )
-        except Exception as e:
-            results.append({
-                "test_id": getattr(test, "id", None),
-                "input": input_data,
-                "expected": expected_output,
-                "actual": None,
-                "passed": False,
-                "error": str(e)
-            })
-            continue
-
-        ok = _compare(expected_output, actual_output)
-        if ok:
-            passed += 1
-
-        results.append({
-            "test_id": getattr(test, "id", None),
-            "input": input_data,
-            "expected": expected_output,
-            "actual": actual_output,
-            "passed": ok,
-            "error": None
-        })
-    if passed == total:
+@router.post("/api/task/{task_id}/user/{user_id}/post", status_code=202)
+async def post_solution(task_id: int, user_id: int, mega_task: SolutionCreate, db: Session = Depends(get_db)):
+    # проверка идет в воркерах судьи, клиент опрашивает /api/jobs/{job_id}
+    # или слушает /api/jobs/{job_id}/events
+    def enqueue():
         user = db.query(User).filter(User.id == user_id).first()
         if not user:
-            raise ValueError("User not found")
-        
-        if total > 0 and passed == total:
-            if not solutionik:
-                new_solution = Solution(
-                    user_id=user_id,
-                    task_id=task_id,
-                    solution=mega_task.solution,
-                    submitted_at=datetime.now(timezone.utc),
-                    is_correct=True
-                )
-                db.add(new_solution)
-
-                if myTest.difficulty == 1:
-                    user.elo += 15
-                elif myTest.difficulty == 2:
-                    user.elo += 30
-                elif myTest.difficulty == 3:
-                    user.elo += 45
-                elif myTest.difficulty == 4:
-                    user.elo += 50
-                elif myTest.difficulty == 5:
-                    user.elo += 65
-
-                user.solved = (user.solved or 0) + 1
-        db.commit()
-        db.refresh(user)
-
-    return {"status": "done", "total": total, "passed": passed, "results": results}
+            raise HTTPException(status_code=404, detail="User not found")
+        has_tests = db.query(task_test.id).filter(task_test.task_id == task_id).first()
+        if not has_tests:
+            raise HTTPException(status_code=404, detail="Task not found")
+        try:
+            return enqueue_submission(db, task_id, user_id, mega_task.solution)
+        except JudgeBusy as e:
+            raise _busy(e)
+
+    job = await run_in_threadpool(enqueue)
+    return {"status": job.status, "job_id": job.id}
+
+@router.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, db: Session = Depends(get_db)):
+    job = await run_in_threadpool(lambda: db.query(JudgeJob).filter(JudgeJob.id == job_id).first())
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_out(job)
+
+@router.get("/api/judge/stats")
+async def judge_stats():
+    return {"artifact_cache": await run_in_threadpool(artifact_cache.stats)}
+
+@router.get("/api/jobs/{job_id}/events")
+async def job_events_stream(job_id: str):
+    # вердикты по тестам приходят по мере проверки (Server-Sent Events)
+    async def events():
+        finished = False
+        try:
+            async for event in job_event_stream(job_id):
+                yield event
+            finished = True
+        finally:
+            if not finished:
+                # клиент ушел, не дождавшись итога: проверку отменяем. Здесь уже нельзя
+                # ждать (поток отменен), поэтому отмена уходит в пул потоков без await
+                asyncio.get_running_loop().run_in_executor(None, cancel_job, job_id)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/api/solutions/correct/{tg_id}/{task_id}", status_code=200)
 async def correct_solutions_for_task(
@@ -318,23 +270,19 @@ async def correct_solutions_for_task(
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    solution = (
-        db.query(Solution)
-        .filter(Solution.user_id == user.id, Solution.task_id == task_id)
-        .first()
-    )
-
-    if not solution:
-        solution = Solution(
+    # просмотр чужих решений закрывает задачу; если решение уже есть, строка не меняется
+    db.execute(
+        insert(Solution)
+        .values(
             user_id=user.id,
             task_id=task_id,
             solution="-- viewed correct solution --",
             is_correct=True,
             submitted_at=datetime.now(timezone.utc)
         )
-        db.add(solution)
-        db.commit()
-        db.refresh(solution)
+        .on_conflict_do_nothing(index_elements=["user_id", "task_id"])
+    )
+    db.commit()
 
     all_correct_solutions = (
         db.query(Solution, User.name)
@@ -342,11 +290,21 @@ async def correct_solutions_for_task(
         .filter(Solution.task_id == task_id, Solution.is_correct == True)
         .all()
     )
+    # последняя оценка сложности каждого пользователя по задаче
+    complexities = {}
+    for estimate in (
+        db.query(ComplexityEstimate)
+        .filter(ComplexityEstimate.task_id == task_id)
+        .order_by(ComplexityEstimate.created_at, ComplexityEstimate.id)
+        .all()
+    ):
+        complexities[estimate.user_id] = estimate.complexity
 
     return [
         {
             "username": sol[1],
             "solution": sol[0].solution,
+            "complexity": complexities.get(sol[0].user_id),
         }
         for sol in all_correct_solutions
     ]
@@ -362,6 +320,9 @@ async def create_task(respons: TaskCreate, db: Session = Depends(get_db)):
     if user.elo < 1000:
         raise HTTPException(status_code=400, detail="У вас недостаточно ELO чтобы создать задание")
 
+    if respons.comparator is not None and respons.comparator not in COMPARATORS:
+        raise HTTPException(status_code=400, detail=f"Unknown comparator: {respons.comparator}")
+
     task = Task(
         title=respons.title,
         language=respons.language,
@@ -375,257 +336,103 @@ async def create_task(respons: TaskCreate, db: Session = Depends(get_db)):
     db.add(task)
     db.commit()
     db.refresh(task)
-    return task
 
-LANG_CONFIG = {
-    "python": {
-        "image": "python:3.11-slim",
-        "file": "/workspace/solution.py",
-        "run": "python /workspace/solution.py"
-    },
-    "js": {
-        "image": "node:20-slim",
-        "file": "/workspace/solution.js",
-        "run": "node /workspace/solution.js"
-    },
-    "c": {
-        "image": "gcc:12",
-        "file": "/workspace/solution.c",
-        "compile": "gcc /workspace/solution.c -o /workspace/solution",
-        "run": "/workspace/solution"
-    },
-    "cpp": {
-        "image": "gcc:12",
-        "file": "/workspace/solution.cpp",
-        "compile": "g++ /workspace/solution.cpp -o /workspace/solution",
-        "run": "/workspace/solution"
-    },
-    "rust": {
-        "image": "rust:1.72",
-        "file": "/workspace/solution.rs",
-        "compile": "rustc /workspace/solution.rs -o /workspace/solution",
-        "run": "/workspace/solution"
-    },
-    "go": {
-        "image": "golang:1.21",
-        "file": "/workspace/solution.go",
-        "run": "go run /workspace/solution.go"
-    }
-}
-
-def run_docker_code(lang: str, code: str, input_data: str, param_types: list, user_id: int) -> str:
-    if lang not in LANG_CONFIG:
-        raise ValueError(f"Unsupported language: {lang}")
-    
-    config = LANG_CONFIG[lang]
-    wrapped_code = wrap_code(lang, code, param_types)
+    if respons.time_limit_ms or respons.memory_limit_mb:
+        db.add(TaskLimit(
+            task_id=task.id,
+            language=task.language,
+            time_limit_ms=respons.time_limit_ms,
+            memory_limit_mb=respons.memory_limit_mb
+        ))
+        db.commit()
+        db.refresh(task)
 
+    if respons.comparator is not None:
+        db.add(TaskChecker(task_id=task.id, comparator=respons.comparator, tolerance=respons.tolerance))
+        db.commit()
+        db.refresh(task)
 
-    temp_dir = os.path.join(tempfile.gettempdir(), f"code_exec_{user_id}")
-    os.makedirs(temp_dir, exist_ok=True)
+    # сигнатура и обертка задачи собираются сразу, а не на первой посылке
+    await run_in_threadpool(harness_cache.get, task)
+    return task
 
-    try:
-        file_path = os.path.join(temp_dir, os.path.basename(config["file"]))
-        with open(file_path, "w") as f:
-            f.write(wrapped_code)
-
-        compile_cmd = config.get("compile", "")
-        run_cmd = config["run"]
-        full_cmd = f"{compile_cmd} && {run_cmd}" if compile_cmd else run_cmd
-
-        docker_cmd = [
-            'docker', 'run', '-i', '--rm',
-            '-v', f'{temp_dir}:/workspace',
-            '-w', '/workspace',
-            '--network', 'none',
-            '--memory', '100m',
-            config["image"],
-            'sh', '-c', full_cmd
-        ]
-
-        process = subprocess.Popen(
-            docker_cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        
-        stdout, stderr = process.communicate(
-            input=input_data + "\n",
-            timeout=10
-        )
+@router.put("/api/task/{task_id}/checker")
+async def set_task_checker(task_id: int, checker: TaskCheckerUpdate, db: Session = Depends(get_db)):
+    # компаратор входит в ключ verdict_cache — старые вердикты сами перестанут находиться
+    if checker.comparator not in COMPARATORS:
+        raise HTTPException(status_code=400, detail=f"Unknown comparator: {checker.comparator}")
+
+    def save():
+        if not db.query(Task.id).filter(Task.id == task_id).first():
+            raise HTTPException(status_code=404, detail="Task not found")
+        row = db.query(TaskChecker).filter(TaskChecker.task_id == task_id).first()
+        if row is None:
+            row = TaskChecker(task_id=task_id)
+            db.add(row)
+        row.comparator = checker.comparator
+        row.tolerance = checker.tolerance
+        db.commit()
 
-        if process.returncode != 0:
-            error_msg = stderr.strip() or f"Container exited with code {process.returncode}"
-            raise RuntimeError(error_msg)
+    await run_in_threadpool(save)
+    return {"task_id": task_id, "comparator": checker.comparator, "tolerance": checker.tolerance}
 
-        return stdout.strip()
-    
-    except subprocess.TimeoutExpired:
-        process.kill()
-        stdout, stderr = process.communicate()
-        raise TimeoutError("Container execution timed out")
-    
-    except Exception as e:
-        raise RuntimeError(f"Container execution failed: {str(e)}")
-    
-    finally:
-        # Удаляем временную директорию после использования
-        import shutil
-        shutil.rmtree(temp_dir, ignore_errors=True)
-
-def parse_parameters(code: str, lang: str) -> list:
-    """Анализирует код и возвращает список типов параметров функции"""
-
-    if lang == "python":
-        match = re.search(r"def\s+\w+\s*\((.*?)\)\s*:", code)
-        if not match:
-            return []
-        params_str = match.group(1).strip()
-        if not params_str:
-            return []
-        params = []
-        for param in params_str.split(","):
-            param = param.strip()
-            if ":" in param:  # param: type
-                type_part = param.split(":")[1].strip()
-                if "=" in type_part:  # убираем значения по умолчанию
-                    type_part = type_part.split("=")[0].strip()
-                params.append(type_part)
-            else:
-                if "=" in param:  # без аннотации, но с дефолтом
-                    param = param.split("=")[0].strip()
-                params.append("any")
-        return params
-
-    elif lang in ["c", "cpp", "c++", "java"]:
-        match = re.search(r"\w+\s+\w+\s*\((.*?)\)\s*\{", code, re.DOTALL)
-        if not match:
-            return []
-        params_str = match.group(1).strip()
-        if not params_str:
-            return []
-        params = []
-        for param in params_str.split(","):
-            param = param.strip()
-            if not param:
-                continue
-            # убираем имя переменной
-            parts = param.split()
-            if len(parts) > 1:
-                type_part = " ".join(parts[:-1])
-            else:
-                type_part = parts[0]
-            params.append(type_part)
-        return params
-
-    elif lang == "js":
-        match = re.search(r"function\s+\w+\s*\((.*?)\)\s*\{", code)
-        if match:
-            params_str = match.group(1).strip()
-            if not params_str:
-                return []
-            return ["any"] * len(params_str.split(","))
-        return []
-
-    elif lang == "rust":
-        match = re.search(r"fn\s+\w+\s*\((.*?)\)", code)
-        if not match:
-            return []
-        params_str = match.group(1).strip()
-        if not params_str:
-            return []
-        params = []
-        for param in params_str.split(","):
-            if ":" in param:
-                type_part = param.split(":")[1].strip()
-                params.append(type_part)
-            else:
-                params.append("any")
-        return params
-
-    elif lang == "go":
-        match = re.search(r"func\s+\w+\s*\((.*?)\)", code)
-        if not match:
-            return []
-        params_str = match.group(1).strip()
-        if not params_str:
-            return []
-        params = []
-        for param in params_str.split(","):
-            parts = param.strip().split()
-            if len(parts) == 2:  # name type
-                params.append(parts[1])
-            elif len(parts) == 1:  # только тип
-                params.append(parts[0])
-            else:
-                params.append("any")
-        return params
-
-    return []
-
-def generate_inputs(param_types: list) -> str:
-    """Генерирует входные данные на основе типов параметров"""
-    inputs = []
-    for param_type in param_types:
-        param_type = param_type.lower()
-        
-        if "int" in param_type:
-            inputs.append(str(random.randint(-100, 100)))
-        elif "float" in param_type or "double" in param_type:
-            inputs.append(f"{random.uniform(-10.0, 10.0):.4f}")
-        elif "str" in param_type or "string" in param_type:
-            length = random.randint(1, 20)
-            inputs.append(''.join(random.choices(string.ascii_letters, k=length)))
-        elif "list" in param_type or "array" in param_type:
-            length = random.randint(1, 5)
-            items = [str(random.randint(1, 100)) for _ in range(length)]
-            inputs.append(" ".join(items))
-        elif "bool" in param_type:
-            inputs.append(random.choice(["true", "false"]))
-        else:
-            # По умолчанию генерируем int
-            inputs.append(str(random.randint(1, 100)))
-    
-    return " ".join(inputs)
-
-@router.post("/api/create_tests/{user_id}")
+@router.post("/api/create_tests/{user_id}", status_code=202)
 async def create_test(response: TaskTests, user_id: int, db: Session = Depends(get_db)):
-    task = db.query(Task).filter(Task.id == response.task_id).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    param_types = parse_parameters(task.code, task.language)
-    
-    generated_tests = 0
-    for _ in range(50):
+    # эталон прогоняется в очереди судьи, прогресс — /api/jobs/{job_id} и /api/jobs/{job_id}/events
+    def enqueue():
+        task = db.query(Task).filter(Task.id == response.task_id).first()
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
         try:
-            input_data = generate_inputs(param_types)
-            
-            output = run_docker_code(
-                lang=task.language,
-                code=task.code,
-                input_data=input_data,
-                param_types=param_types,
-                user_id=user_id
-            )
-            
-            new_test = task_test(
-                task_id=response.task_id,
-                input=input_data,
-                output=output,
-                test_type="hidden"
-            )
-            db.add(new_test)
-            generated_tests += 1
-        
-        except Exception as e:
-            print(f"Test generation failed: {str(e)}")
-            continue
+            return enqueue_test_generation(db, task, user_id)
+        except JudgeBusy as e:
+            raise _busy(e)
 
-    db.commit()
-    return {"status": "success", "generated_tests": generated_tests}
+    job = await run_in_threadpool(enqueue)
+    return {"status": job.status, "job_id": job.id}
+
+
+@router.put("/api/test_blobs", status_code=201)
+async def upload_test_blob(request: Request):
+    # тело запроса — сырые данные теста; пишутся в хранилище кусками, целиком в память не читаются
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > TEST_BLOB_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Test data is larger than {TEST_BLOB_MAX_BYTES} bytes")
+    writer = await run_in_threadpool(test_blobs.writer, TEST_BLOB_MAX_BYTES)
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(writer.write, chunk)
+    except BlobTooLarge as e:
+        await run_in_threadpool(writer.abort)
+        raise HTTPException(status_code=413, detail=str(e))
+    except BaseException:
+        await run_in_threadpool(writer.abort)
+        raise
+    key, size = await run_in_threadpool(writer.close)
+    return {"key": key, "size": size}
+
+@router.post("/api/task/{task_id}/tests", status_code=201)
+async def add_task_test(task_id: int, test: BlobTestCreate, db: Session = Depends(get_db)):
+    def add():
+        if not db.query(Task.id).filter(Task.id == task_id).first():
+            raise HTTPException(status_code=404, detail="Task not found")
+        sizes = {}
+        for field in ("input", "output"):
+            key = getattr(test, f"{field}_key")
+            if key is None:
+                if getattr(test, field) is None:
+                    raise HTTPException(status_code=400, detail=f"Either {field} or {field}_key is required")
+                continue
+            if not test_blobs.exists(key):
+                raise HTTPException(status_code=404, detail=f"Blob {key} not found")
+            sizes[field] = test_blobs.size(key)
+        return add_blob_test(
+            db, task_id, test.test_type, test.input, test.output,
+            test.input_key, sizes.get("input"), test.output_key, sizes.get("output")
+        )
+
+    created = await run_in_threadpool(add)
+    return {"id": created.id, "input": created.input, "output": created.output, "test_type": created.test_type}
 
 @router.get("/api/leaderboard", response_model=List[UserOut])
 async def get_leaderboard(db: Session = Depends(get_db)):
@@ -0,0 +1,402 @@
+import os
+import resource
+import selectors
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from docker_pool import (
+    container_pool, spawn_container, pid_alive, stdin_chunks, OutputBuffer, PooledContainer,
+    CANCEL_POLL_INTERVAL, STDERR_LIMIT, OWNER, OWNER_LABEL, MEMORY_HEADROOM_MB
+)
+from toolchain_cache import toolchain_caches, TOOLCHAIN_CACHE_MOUNT, TOOLCHAIN_CACHE_DIR
+from artifact_cache import ARTIFACT_CACHE_DIR
+
+
+DEFAULT_MEMORY_LIMIT_MB = int(os.getenv("JUDGE_MEMORY_LIMIT_MB", "256"))
+# tmpfs для рабочих директорий на хосте: /dev/shm есть почти везде, иначе обычный tmp
+LOCAL_SANDBOX_ROOT = os.getenv("JUDGE_LOCAL_SANDBOX_ROOT", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+LOCAL_MAX_OUTPUT_BYTES = 64 * 1024 * 1024
+# кеш сборки go общий для всех запусков, иначе каждая сборка идет с нуля
+LOCAL_GOCACHE = os.getenv("JUDGE_LOCAL_GOCACHE", os.path.join(tempfile.gettempdir(), "judge-gocache"))
+# сколько процессов (и потоков) может создать одна команда в локальной песочнице
+LOCAL_MAX_PROCESSES = int(os.getenv("JUDGE_LOCAL_MAX_PROCESSES", "64"))
+# init пространства имен локальной песочницы: общие кеши — только для чтения, лимит процессов,
+# команда — дочерним процессом. Когда init завершается (или его убивают), ядро убивает
+# все процессы пространства имен, даже ушедшие в свою сессию через setsid.
+# RLIMIT_NPROC ставится здесь, а не в preexec: снаружи он считал бы все процессы
+# пользователя судьи на хосте, а внутри нового user namespace — только процессы песочницы.
+# Для судьи, запущенного от root, ядро RLIMIT_NPROC не применяет.
+LOCAL_NAMESPACE_INIT = r"""
+cmd=$1; nproc=$2; shift 2
+for path do
+    [ -d "$path" ] || continue
+    mount --bind "$path" "$path" && mount -o remount,bind,ro "$path" || exit 125
+done
+prlimit --nproc="$nproc:$nproc" -- sh -c "$cmd"
+"""
+
+
+class JudgeCancelled(Exception):
+    """Проверку отменили (например, клиент закрыл соединение)"""
+
+
+def _communicate(process: subprocess.Popen, stdin, timeout: float, cancel: threading.Event = None,
+                 on_stdout=None, watchdog=None, kill=None, max_output: int = None):
+    """Кормит stdin, читает вывод по мере поступления и следит за дедлайнами.
+
+    stdin — байты или итератор кусков. Возвращает (stdout, stderr, timed_out);
+    при отмене поднимает JudgeCancelled. stdout копится не больше max_output + 1
+    байта (или не копится вовсе, если есть on_stdout), stderr — не больше STDERR_LIMIT.
+    kill() вызывается, когда процесс нужно остановить досрочно.
+    """
+    def feed():
+        try:
+            for chunk in stdin_chunks(stdin):
+                process.stdin.write(chunk)
+            process.stdin.close()
+        except OSError:
+            pass
+    threading.Thread(target=feed, daemon=True).start()
+
+    stdout, stderr = OutputBuffer(max_output), OutputBuffer(STDERR_LIMIT)
+    timed_out = cancelled = False
+    deadline = time.monotonic() + timeout if timeout is not None else float("inf")
+    with selectors.DefaultSelector() as sel:
+        sel.register(process.stdout, selectors.EVENT_READ)
+        sel.register(process.stderr, selectors.EVENT_READ)
+        while sel.get_map():
+            current = min(deadline, watchdog.deadline) if watchdog is not None else deadline
+            remaining = current - time.monotonic()
+            cancelled = cancel is not None and cancel.is_set()
+            if remaining <= 0 or cancelled:
+                timed_out = not cancelled
+                break
+            if stdout.overflow:
+                break
+            for key, _ in sel.select(min(CANCEL_POLL_INTERVAL, remaining)):
+                chunk = os.read(key.fd, 65536)
+                if not chunk:
+                    sel.unregister(key.fileobj)
+                elif key.fileobj is process.stdout:
+                    if on_stdout is not None:
+                        on_stdout(chunk)
+                    else:
+                        stdout.add(chunk)
+                else:
+                    stderr.add(chunk)
+
+    if timed_out or cancelled or stdout.overflow:
+        kill()
+    try:
+        process.wait(timeout=CANCEL_POLL_INTERVAL * 4)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    process.stdout.close()
+    process.stderr.close()
+
+    if cancelled:
+        raise JudgeCancelled()
+    return stdout.value(), stderr.value(), timed_out
+
+
+class _WorkdirSandbox:
+    """Общая часть песочниц, у которых /workspace — директория на хосте"""
+
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        self.broken = False
+
+    def _host_path(self, path: str) -> str:
+        return os.path.join(self.workdir, os.path.relpath(path, "/workspace"))
+
+    def put_file(self, path: str, content, mode: int = 0o644):
+        data = content.encode() if isinstance(content, str) else content
+        host_path = self._host_path(path)
+        with open(host_path, "wb") as f:
+            f.write(data)
+        os.chmod(host_path, mode)
+
+    def get_file(self, path: str) -> bytes:
+        with open(self._host_path(path), "rb") as f:
+            return f.read()
+
+
+class DockerCliSandbox(_WorkdirSandbox):
+    """Каждая команда — отдельный `docker run --rm` с /workspace, примонтированным с хоста"""
+
+    def __init__(self, image: str, workdir: str, cpu: int = None):
+        super().__init__(workdir)
+        self.image = image
+        self.toolchain = image
+        self.cache_dir = toolchain_caches.host_dir(image)
+        self.cpu = cpu
+
+    def _docker_cmd(self, cmd: str, name: str, memory_mb: int) -> list:
+        cache = ['-v', f'{self.cache_dir}:{TOOLCHAIN_CACHE_MOUNT}:ro'] if self.cache_dir else []
+        cpuset = ['--cpuset-cpus', str(self.cpu)] if self.cpu is not None else []
+        return [
+            'docker', 'run', '-i', '--rm',
+            '--name', name,
+            '--label', f'{OWNER_LABEL}={OWNER}',
+            '-v', f'{self.workdir}:/workspace',
+            *cache,
+            '-w', '/workspace',
+            '--network', 'none',
+            '--memory', f'{memory_mb + MEMORY_HEADROOM_MB}m',
+            '--memory-swap', f'{memory_mb + MEMORY_HEADROOM_MB}m',
+            *cpuset,
+            self.image,
+            'sh', '-c', cmd
+        ]
+
+    def exec(self, cmd: str, stdin=None, timeout: float = None, cancel: threading.Event = None,
+             on_stdout=None, watchdog=None, memory_mb: int = DEFAULT_MEMORY_LIMIT_MB, max_output: int = None):
+        """Запускает команду: (returncode, stdout, stderr, timed_out).
+
+        Убивает сам контейнер, а не только docker CLI — иначе при таймауте
+        или отмене контейнер продолжал бы работать после --rm клиента.
+        """
+        name = f"judge-{uuid.uuid4().hex}"
+        process = subprocess.Popen(
+            self._docker_cmd(cmd, name, memory_mb),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+
+        def kill():
+            subprocess.run(['docker', 'kill', name], capture_output=True)
+            process.kill()
+
+        stdout, stderr, timed_out = _communicate(process, stdin or b"", timeout, cancel, on_stdout, watchdog, kill, max_output)
+        return process.returncode, stdout, stderr, timed_out
+
+
+class DockerEngine:
+    """Клиент Docker Engine API для бэкенда docker_api и пула.
+
+    HTTP-соединения клиента (requests.Session) переиспользуются между запусками,
+    поэтому запуск контейнеров и exec не платят за fork CLI и новое подключение.
+    """
+
+    def __init__(self):
+        self.client = None
+
+    def start(self, client):
+        client.ping()
+        self.client = client
+
+    @property
+    def enabled(self) -> bool:
+        return self.client is not None
+
+    def close(self):
+        self.client = None
+
+
+docker_engine = DockerEngine()
+
+
+_unshare_checked = None
+
+
+def _unshare_prefix() -> list:
+    """Префикс для запуска в своих пространствах имен (сеть, процессы, монтирования), если они доступны"""
+    global _unshare_checked
+    if _unshare_checked is None:
+        prefix = ["unshare", "--net", "--pid", "--fork", "--kill-child", "--mount-proc", "--map-root-user"]
+        try:
+            ok = (
+                shutil.which("unshare") and shutil.which("prlimit")
+                and subprocess.run(prefix + ["true"], capture_output=True, timeout=5).returncode == 0
+            )
+        except Exception:
+            ok = False
+        _unshare_checked = prefix if ok else []
+        if not ok:
+            print("Local sandbox: unshare is unavailable, running without namespace isolation")
+    return _unshare_checked
+
+
+def _readonly_paths(cmd: str) -> list:
+    """Общие кеши, которые команда не должна менять; GOCACHE пишет только сам go build"""
+    paths = [ARTIFACT_CACHE_DIR, TOOLCHAIN_CACHE_DIR]
+    if cmd.split(None, 1)[:1] != ["go"]:
+        paths.append(LOCAL_GOCACHE)
+    return [os.path.abspath(path) for path in paths]
+
+
+def _local_env(workdir: str) -> dict:
+    """Минимальное окружение: без секретов процесса судьи, но с путями к тулчейнам хоста"""
+    home = os.path.expanduser("~")
+    return {
+        "PATH": os.environ.get("PATH", "/usr/local/bin:/usr/bin:/bin"),
+        "HOME": workdir,
+        "LANG": "C.UTF-8",
+        "GOCACHE": LOCAL_GOCACHE,
+        "RUSTUP_HOME": os.environ.get("RUSTUP_HOME", os.path.join(home, ".rustup")),
+        "CARGO_HOME": os.environ.get("CARGO_HOME", os.path.join(home, ".cargo")),
+    }
+
+
+class LocalSandbox(_WorkdirSandbox):
+    """Процесс прямо на хосте: rlimit, свои пространства имен (unshare), рабочая директория на tmpfs.
+
+    Без сети, со своим деревом процессов (после команды не остается ничего
+    запущенного) и с общими кешами только для чтения. Без накладных расходов
+    на контейнер, но и без изоляции остальной файловой системы — только для
+    доверенных или малорисковых языков. Тулчейн берется с хоста.
+    """
+
+    def __init__(self, workdir: str, cpu: int = None):
+        super().__init__(workdir)
+        self.toolchain = "local"
+        self.cpu = cpu
+
+    def exec(self, cmd: str, stdin=None, timeout: float = None, cancel: threading.Event = None,
+             on_stdout=None, watchdog=None, memory_mb: int = DEFAULT_MEMORY_LIMIT_MB, max_output: int = None):
+        """Запускает команду: (returncode, stdout, stderr, timed_out)"""
+        cmd = cmd.replace("/workspace", self.workdir)
+        data_limit = (memory_mb + MEMORY_HEADROOM_MB) * 1024 * 1024
+        cpu_limit = int(timeout if timeout is not None else 60) + 1
+        cpu = self.cpu
+
+        def limit():
+            if cpu is not None:
+                # иначе процесс унаследует маску API (зарезервированные ядра)
+                os.sched_setaffinity(0, {cpu})
+            # RLIMIT_DATA, а не RLIMIT_AS: node и go резервируют много виртуальной памяти
+            # до OOM killer дело не доходит: выделение памяти отказывает, решение падает само,
+            # и judge распознает MLE по статусу обертки или тексту ошибки (ALLOCATION_FAILURES)
+            resource.setrlimit(resource.RLIMIT_DATA, (data_limit, data_limit))
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit))
+            resource.setrlimit(resource.RLIMIT_FSIZE, (LOCAL_MAX_OUTPUT_BYTES, LOCAL_MAX_OUTPUT_BYTES))
+            resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+        prefix = _unshare_prefix()
+        if prefix:
+            args = prefix + ["sh", "-c", LOCAL_NAMESPACE_INIT, "sh", cmd, str(LOCAL_MAX_PROCESSES)] + _readonly_paths(cmd)
+        else:
+            args = ["sh", "-c", cmd]
+        process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.workdir,
+            env=_local_env(self.workdir),
+            preexec_fn=limit,
+            start_new_session=True
+        )
+
+        def kill():
+            # в группе — unshare и init пространства имен; со смертью init ядро убивает
+            # все процессы пространства, в том числе сменившие сессию
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+        stdout, stderr, timed_out = _communicate(process, stdin or b"", timeout, cancel, on_stdout, watchdog, kill, max_output)
+        # убиваем и то, что процесс мог оставить в фоне
+        kill()
+        process.wait()
+        returncode = process.returncode
+        if prefix and returncode > 128:
+            # init передает смерть команды от сигнала как код 128 + сигнал — возвращаем как у Popen
+            returncode = 128 - returncode
+        # в сообщениях об ошибках — те же пути, что и в контейнере
+        stderr = stderr.replace(self.workdir.encode(), b"/workspace")
+        return returncode, stdout, stderr, timed_out
+
+
+def _workspace_prefix(pid: int) -> str:
+    return f"judge-{pid}-"
+
+
+@contextmanager
+def _workspace():
+    """Уникальная рабочая директория на tmpfs хоста; в имени — pid владельца"""
+    workdir = tempfile.mkdtemp(prefix=_workspace_prefix(os.getpid()), dir=LOCAL_SANDBOX_ROOT)
+    try:
+        yield workdir
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def reap_workspaces() -> int:
+    """Удаляет рабочие директории, оставшиеся от упавших процессов судьи"""
+    removed = 0
+    for name in os.listdir(LOCAL_SANDBOX_ROOT):
+        parts = name.split("-")
+        if len(parts) < 3 or parts[0] != "judge" or not parts[1].isdigit():
+            continue
+        if pid_alive(int(parts[1])):
+            continue
+        shutil.rmtree(os.path.join(LOCAL_SANDBOX_ROOT, name), ignore_errors=True)
+        removed += 1
+    return removed
+
+
+@contextmanager
+def _docker_cli(lang: str, config: dict, user_id: int, cpu: int = None):
+    with _workspace() as workdir:
+        yield DockerCliSandbox(config["image"], workdir, cpu)
+
+
+@contextmanager
+def _docker_api(lang: str, config: dict, user_id: int, cpu: int = None):
+    if not docker_engine.enabled:
+        # демон недоступен по API — та же проверка через docker CLI
+        with _docker_cli(lang, config, user_id, cpu) as box:
+            yield box
+        return
+    # свой контейнер на проверку: /workspace в памяти, файлы — через stdin exec
+    client = docker_engine.client
+    container = spawn_container(client, config["image"], labels={"codebattle.job": lang}, cpu=cpu)
+    box = PooledContainer(client, container, config["image"])
+    try:
+        yield box
+    finally:
+        box.destroy()
+
+
+@contextmanager
+def _docker_sdk(lang: str, config: dict, user_id: int, cpu: int = None):
+    if not container_pool.enabled(lang):
+        # пул не поднялся — отдельный контейнер на проверку через Engine API (или CLI)
+        with _docker_api(lang, config, user_id, cpu) as box:
+            yield box
+        return
+    with container_pool.container(lang, cpu) as box:
+        yield box
+
+
+@contextmanager
+def _local(lang: str, config: dict, user_id: int, cpu: int = None):
+    with _workspace() as workdir:
+        yield LocalSandbox(workdir, cpu)
+
+
+SANDBOXES = {
+    "docker": _docker_cli,
+    "docker_api": _docker_api,
+    "docker_sdk": _docker_sdk,
+    "local": _local,
+}
+
+
+def open_sandbox(lang: str, config: dict, user_id: int, cpu: int = None):
+    """Песочница для одной проверки; бэкенд выбирается полем "sandbox" в LANG_CONFIG.
+
+    cpu — ядро из core_pool, за которым закрепляются все запуски проверки.
+    """
+    backend = config.get("sandbox", "docker_sdk")
+    if backend not in SANDBOXES:
+        raise ValueError(f"Unknown sandbox backend: {backend}")
+    return SANDBOXES[backend](lang, config, user_id, cpu)
@@ -15,6 +15,14 @@ class TaskTests(BaseModel):
     output: str
     test_type:str = "sample"
 
+# Тест, вход и/или вывод которого заранее загружены в хранилище (PUT /api/test_blobs)
+class BlobTestCreate(BaseModel):
+    input: Optional[str] = None
+    output: Optional[str] = None
+    input_key: Optional[str] = None
+    output_key: Optional[str] = None
+    test_type: str = "hidden"
+
 # Схема пользователя для ответа клиенту
 class UserOut(BaseModel):
     id: int
@@ -37,6 +45,15 @@ class TaskCreate(BaseModel):
     code: str
     difficulty: int
     tg_id: int  
+    time_limit_ms: Optional[int] = Field(None, gt=0, le=10000)
+    memory_limit_mb: Optional[int] = Field(None, gt=0, le=512)
+    comparator: Optional[str] = None  # см. checker.COMPARATORS
+    tolerance: Optional[float] = Field(None, ge=0)
+
+# Сравнение вывода решений задачи с ожидаемым
+class TaskCheckerUpdate(BaseModel):
+    comparator: str
+    tolerance: Optional[float] = Field(None, ge=0)
 
 # Схема задачи для ответа клиенту
 class TaskOut(BaseModel):
@@ -0,0 +1,280 @@
+import gzip
+import hashlib
+import os
+import re
+import tempfile
+import time
+from models import task_test, TestBlob
+
+
+# большие тесты лежат сжатыми в контентно-адресуемом хранилище, маленькие — прямо в task_tests
+TEST_BLOB_DIR = os.path.abspath(os.getenv("JUDGE_TEST_BLOB_DIR", "data/test_blobs"))
+# task_tests.input и output — String(255)
+INLINE_LIMIT = 255
+PREVIEW_CHARS = 200
+CHUNK_SIZE = 64 * 1024
+# потолок несжатого размера одного файла в хранилище (загрузка через PUT /api/test_blobs)
+TEST_BLOB_MAX_BYTES = int(os.getenv("JUDGE_TEST_BLOB_MAX_MB", "256")) * 1024 * 1024
+# рядом с данными: несжатый размер, чтобы не распаковывать файл ради него
+SIZE_SUFFIX = ".size"
+# файл, на который не ссылается ни один тест, удаляется не раньше: между загрузкой
+# через PUT /api/test_blobs и созданием теста он еще ничей
+TEST_BLOB_GC_GRACE = float(os.getenv("JUDGE_TEST_BLOB_GC_GRACE_HOURS", "24")) * 3600
+
+
+class BlobTooLarge(ValueError):
+    """Данные длиннее max_size хранилища"""
+
+
+KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class BlobWriter:
+    """Пишет данные в хранилище по кускам: сжимает и хеширует на лету, в памяти не держит.
+
+    Если данных больше max_size, write бросает BlobTooLarge (вызывающий делает abort).
+    """
+
+    def __init__(self, store: "TestBlobStore", max_size: int = None):
+        self.store = store
+        self.max_size = max_size
+        self.size = 0
+        self._digest = hashlib.sha256()
+        os.makedirs(store.root, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.root, prefix=".tmp-")
+        self._raw = os.fdopen(fd, "wb")
+        self._file = gzip.GzipFile(fileobj=self._raw, mode="wb", mtime=0)
+
+    def write(self, chunk: bytes):
+        if self.max_size is not None and self.size + len(chunk) > self.max_size:
+            raise BlobTooLarge(f"Test data is larger than {self.max_size} bytes")
+        self._digest.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def close(self):
+        """(ключ, размер несжатых данных)"""
+        self._file.close()
+        self._raw.close()
+        key = self._digest.hexdigest()
+        path = self.store._path(key)
+        if os.path.exists(path):
+            # те же данные уже лежат — второй экземпляр не нужен; свежий mtime
+            # не дает сборке мусора удалить файл, пока тест на него еще не сослался
+            os.remove(self._tmp_path)
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._tmp_path, path)
+        self.store._write_size(key, self.size)
+        return key, self.size
+
+    def abort(self):
+        try:
+            self._file.close()
+            self._raw.close()
+        finally:
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+
+
+class TestBlobStore:
+    """Сжатые (gzip) данные тестов на диске, ключ — sha256 несжатого содержимого"""
+
+    def __init__(self, root: str = TEST_BLOB_DIR):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def writer(self, max_size: int = None) -> BlobWriter:
+        return BlobWriter(self, max_size)
+
+    def _write_size(self, key: str, size: int):
+        path = self._path(key) + SIZE_SUFFIX
+        if os.path.exists(path):
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            f.write(str(size))
+        os.replace(tmp_path, path)
+
+    def put(self, data: bytes):
+        writer = self.writer()
+        try:
+            writer.write(data)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.close()
+
+    def exists(self, key: str) -> bool:
+        # ключ приходит от клиента — ничего, кроме sha256, в путь не попадает
+        return bool(KEY_PATTERN.fullmatch(key)) and os.path.exists(self._path(key))
+
+    def size(self, key: str) -> int:
+        """Размер несжатых данных — из записанного при сохранении файла .size"""
+        try:
+            with open(self._path(key) + SIZE_SUFFIX) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            pass
+        # файл сохранен до появления .size — считаем один раз и запоминаем
+        size = 0
+        for chunk in self.chunks(key):
+            size += len(chunk)
+        self._write_size(key, size)
+        return size
+
+    def chunks(self, key: str):
+        """Распаковывает данные по кускам, не читая файл целиком"""
+        with gzip.open(self._path(key), "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def read(self, key: str) -> bytes:
+        return b"".join(self.chunks(key))
+
+    def preview(self, key: str, limit: int = PREVIEW_CHARS) -> str:
+        with gzip.open(self._path(key), "rb") as f:
+            return _preview(f.read(limit + 1).decode(errors="ignore"), limit)
+
+    def collect(self, referenced: set, grace: float = TEST_BLOB_GC_GRACE) -> int:
+        """Удаляет данные, на которые нет ссылок в referenced и которые не менялись
+        дольше grace секунд, вместе с их .size и брошенными временными файлами.
+        Возвращает число удаленных ключей."""
+        if not os.path.isdir(self.root):
+            return 0
+        cutoff = time.time() - grace
+        removed = 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                key = name[:-len(SIZE_SUFFIX)] if name.endswith(SIZE_SUFFIX) else name
+                if key in referenced:
+                    continue
+                if name.endswith(SIZE_SUFFIX) and os.path.exists(self._path(key)):
+                    # .size уходит вместе со своими данными
+                    continue
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        continue
+                    os.remove(path)
+                    if KEY_PATTERN.fullmatch(name):
+                        removed += 1
+                        os.remove(path + SIZE_SUFFIX)
+                except OSError:
+                    # файл уже удален или .size у него нет
+                    pass
+        return removed
+
+
+test_blobs = TestBlobStore()
+
+
+def _preview(text: str, limit: int = PREVIEW_CHARS) -> str:
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class BlobInput:
+    """Данные теста из хранилища: размер известен заранее, сами данные читаются потоком
+    (вход — в песочницу, ожидаемый вывод — в компаратор)"""
+
+    def __init__(self, key: str, size: int, store: TestBlobStore = test_blobs):
+        self.key = key
+        self.size = size
+        self.store = store
+
+    def chunks(self):
+        return self.store.chunks(self.key)
+
+
+class StoredTest:
+    """Тест, часть данных которого в хранилище.
+
+    input и output — превью для показа, source — полный вход для запуска,
+    expected — полный ожидаемый вывод для компаратора (см. checker.expected_chunks).
+    """
+
+    def __init__(self, test, blob, store: TestBlobStore = test_blobs):
+        self.id = test.id
+        self.task_id = test.task_id
+        self.test_type = test.test_type
+        self.input = test.input
+        self.input_key = blob.input_key
+        self.output_key = blob.output_key
+        self.source = BlobInput(blob.input_key, blob.input_size, store) if blob.input_key else test.input
+        self.output = test.output
+        self.expected = BlobInput(blob.output_key, blob.output_size, store) if blob.output_key else test.output
+
+
+def test_source(test):
+    """Что подавать на вход решению: строка или BlobInput"""
+    return getattr(test, "source", test.input) or ""
+
+
+def test_expected(test):
+    """С чем сравнивать вывод решения: строка или BlobInput"""
+    return getattr(test, "expected", test.output) or ""
+
+
+def load_tests(db, testiki: list) -> list:
+    """Подменяет тесты, данные которых в хранилище, на StoredTest"""
+    ids = [test.id for test in testiki]
+    blobs = {blob.test_id: blob for blob in db.query(TestBlob).filter(TestBlob.test_id.in_(ids)).all()} if ids else {}
+    return [StoredTest(test, blobs[test.id]) if test.id in blobs else test for test in testiki]
+
+
+def collect_test_blobs(db, store: TestBlobStore = test_blobs) -> int:
+    """Чистит хранилище от данных удаленных тестов и загрузок, из которых тест так и не создали"""
+    referenced = set()
+    for input_key, output_key in db.query(TestBlob.input_key, TestBlob.output_key):
+        referenced.update((input_key, output_key))
+    return store.collect(referenced)
+
+
+def add_test(db, task_id: int, input_data: str, output: str, test_type: str = "hidden", commit: bool = True):
+    """Сохраняет тест: маленький — строкой в task_tests, большой — в хранилище с превью в task_tests"""
+    big_input = len(input_data) > INLINE_LIMIT
+    big_output = len(output) > INLINE_LIMIT
+    input_key = output_key = None
+    input_size = output_size = None
+    if big_input:
+        input_key, input_size = test_blobs.put(input_data.encode())
+    if big_output:
+        output_key, output_size = test_blobs.put(output.encode())
+    return add_blob_test(
+        db, task_id, test_type,
+        input_data if not big_input else None, output if not big_output else None,
+        input_key, input_size, output_key, output_size, commit
+    )
+
+
+def add_blob_test(db, task_id: int, test_type: str, input_data: str = None, output: str = None,
+                  input_key: str = None, input_size: int = None, output_key: str = None, output_size: int = None,
+                  commit: bool = True):
+    """Тест, данные которого (вход, вывод или оба) уже лежат в хранилище под ключами"""
+    test = task_test(
+        task_id=task_id,
+        input=input_data if input_key is None else test_blobs.preview(input_key),
+        output=output if output_key is None else test_blobs.preview(output_key),
+        test_type=test_type
+    )
+    db.add(test)
+    if input_key is not None or output_key is not None:
+        db.flush()
+        db.add(TestBlob(
+            test_id=test.id,
+            input_key=input_key,
+            input_size=input_size,
+            output_key=output_key,
+            output_size=output_size
+        ))
+    if commit:
+        db.commit()
+    return test
@@ -0,0 +1,161 @@
+import os
+import random
+import string
+from models import task_test
+from test_store import add_test, INLINE_LIMIT
+
+
+GENERATED_TESTS = int(os.getenv("JUDGE_GENERATED_TESTS", "50"))
+# сколько случайных тестов оставить после минимизации
+GENERATED_KEEP = int(os.getenv("JUDGE_GENERATED_KEEP", "15"))
+# размеры стресс-тестов: длина строк и списков; числа — до 10^6 по модулю,
+# элементы списков — до 10^4, чтобы вход влез в task_tests
+STRESS_SIZES = [int(size) for size in os.getenv("JUDGE_STRESS_SIZES", "8,16,32").split(",") if size]
+STRESS_MAGNITUDE = 10 ** 6
+STRESS_ITEM_MAGNITUDE = 10 ** 4
+
+def _kind(param_type: str) -> str:
+    param_type = param_type.lower()
+    if "int" in param_type:
+        return "int"
+    if "float" in param_type or "double" in param_type:
+        return "float"
+    if "str" in param_type or "string" in param_type:
+        return "str"
+    if "list" in param_type or "array" in param_type:
+        return "list"
+    if "bool" in param_type:
+        return "bool"
+    return "other"
+
+
+def _value(kind: str, size: int = None) -> str:
+    if kind == "int":
+        bound = STRESS_MAGNITUDE if size else 100
+        return str(random.randint(-bound, bound))
+    if kind == "float":
+        bound = STRESS_MAGNITUDE if size else 10.0
+        return f"{random.uniform(-bound, bound):.4f}"
+    if kind == "str":
+        length = size or random.randint(1, 20)
+        return ''.join(random.choices(string.ascii_letters, k=length))
+    if kind == "list":
+        length = size or random.randint(1, 5)
+        bound = STRESS_ITEM_MAGNITUDE if size else 100
+        return " ".join(str(random.randint(1, bound)) for _ in range(length))
+    if kind == "bool":
+        return random.choice(["true", "false"])
+    # По умолчанию генерируем int
+    return str(random.randint(1, 100))
+
+
+def _shape(kind: str, value: str) -> str:
+    """Класс значения, который обычно ведет решение по разным веткам"""
+    if kind in ("int", "float", "other"):
+        number = float(value)
+        return "neg" if number < 0 else "zero" if number == 0 else "pos"
+    if kind == "str":
+        return "empty" if not value else "one" if len(value) == 1 else "short" if len(value) <= 8 else "long"
+    if kind == "list":
+        items = [int(item) for item in value.split()]
+        order = "sorted" if items == sorted(items) else "reversed" if items == sorted(items, reverse=True) else "mixed"
+        return f"{min(len(items), 3)}:{order}:{'dup' if len(set(items)) < len(items) else 'uniq'}"
+    return value
+
+
+def generate_case(param_types: list, size: int = None):
+    """Вход теста и классы его значений; size задает стресс-тест такого размера"""
+    kinds = [_kind(param_type) for param_type in param_types]
+    values = [_value(kind, size) for kind in kinds]
+    return " ".join(values), tuple(_shape(kind, value) for kind, value in zip(kinds, values))
+
+
+def generate_scaled(param_types: list, n: int) -> str:
+    """Вход масштаба n: целые равны n, строки длины n.
+
+    Обертка делит вход по пробелам и дает параметру-списку один токен,
+    поэтому список масштаба n не передать — он остается одним случайным числом.
+    """
+    values = []
+    for kind in (_kind(param_type) for param_type in param_types):
+        if kind in ("int", "other"):
+            values.append(str(n))
+        elif kind == "float":
+            values.append(f"{n}.0")
+        elif kind == "str":
+            values.append(''.join(random.choices(string.ascii_letters, k=n)))
+        else:
+            values.append(_value(kind))
+    return " ".join(values)
+
+
+def generate_cases(param_types: list, count: int = GENERATED_TESTS, stress_sizes: list = STRESS_SIZES) -> list:
+    """Случайные тесты и стресс-тесты по возрастанию размера: [(input, shape, stress)]"""
+    cases = [(*generate_case(param_types), False) for _ in range(count)]
+    cases += [(*generate_case(param_types, size), True) for size in stress_sizes]
+    return cases
+
+
+def minimize_tests(cases: list, outcomes: list, keep: int = GENERATED_KEEP) -> list:
+    """Индексы тестов, которые стоит сохранить.
+
+    Дубликаты и неудачные прогоны эталона отбрасываются. Из случайных тестов
+    жадно набирается подмножество, покрывающее все различные ответы и классы
+    входов (знак числа, длина, упорядоченность списка); тесты, не добавляющие
+    нового, — лишняя работа для каждой будущей посылки. Стресс-тесты остаются все.
+    """
+    seen = set()
+    candidates, stress = [], []
+    for index, ((input_data, shape, is_stress), outcome) in enumerate(zip(cases, outcomes)):
+        if outcome["error"] is not None or input_data in seen:
+            continue
+        seen.add(input_data)
+        if is_stress:
+            stress.append(index)
+        else:
+            features = {("output", outcome["output"].strip())}
+            features.update(("shape", position, value) for position, value in enumerate(shape))
+            candidates.append((index, features))
+
+    selected = []
+    uncovered = set().union(*(features for _, features in candidates))
+    while candidates and uncovered and len(selected) < keep:
+        best = max(candidates, key=lambda candidate: len(candidate[1] & uncovered))
+        if not best[1] & uncovered:
+            break
+        selected.append(best[0])
+        uncovered -= best[1]
+        candidates.remove(best)
+    return sorted(selected) + stress
+
+
+def save_generated_tests(db, task_id: int, inputs: list, outcomes: list) -> int:
+    """Сохраняет успешные прогоны эталона одной пачкой, пропуская уже существующие входы.
+
+    Тесты длиннее task_tests уходят в хранилище тестов (test_store).
+    """
+    existing = {row.input for row in db.query(task_test.input).filter(task_test.task_id == task_id)}
+    rows = []
+    saved = 0
+    for input_data, outcome in zip(inputs, outcomes):
+        if outcome["error"] is not None:
+            print(f"Test generation failed: {outcome['error']}")
+            continue
+        if input_data in existing:
+            continue
+        existing.add(input_data)
+        saved += 1
+        if len(input_data) > INLINE_LIMIT or len(outcome["output"]) > INLINE_LIMIT:
+            add_test(db, task_id, input_data, outcome["output"], "hidden", commit=False)
+            continue
+        rows.append({
+            "task_id": task_id,
+            "input": input_data,
+            "output": outcome["output"],
+            "test_type": "hidden"
+        })
+
+    if rows:
+        db.bulk_insert_mappings(task_test, rows)
+    db.commit()
+    return saved
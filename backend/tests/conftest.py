@@ -0,0 +1,32 @@
+import sys
+import types
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+# database.py подключается к PostgreSQL при импорте — тестам хватает SQLite в памяти.
+# Подменяем модуль до того, как его импортируют models и jobs.
+database = types.ModuleType("database")
+database.engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+database.session_local = sessionmaker(autoflush=False, autocommit=False, bind=database.engine)
+database.Base = declarative_base()
+sys.modules["database"] = database
+
+import models  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Чистая схема на каждый тест"""
+    models.Base.metadata.create_all(bind=database.engine)
+    session = database.session_local()
+    try:
+        yield session
+    finally:
+        session.close()
+        models.Base.metadata.drop_all(bind=database.engine)
@@ -0,0 +1,96 @@
+import subprocess
+import sys
+
+import pytest
+
+from warap import (
+    BATCH_READY, BATCH_SENTINEL, FORGED_MARKER_ERROR, BatchOutputParser, frame_batch_stream, wrap_code_batch,
+)
+
+NONCE = "0123456789abcdef"
+
+
+def _parse(parser: BatchOutputParser, output: str, chunk: int = 7) -> list:
+    """Скармливает вывод кусками по chunk байт, как он приходит из песочницы"""
+    data = output.encode()
+    cases = []
+    for start in range(0, len(data), chunk):
+        cases += parser.feed(data[start:start + chunk])
+    return cases + parser.close()
+
+
+def _run_python(code: str, param_types: list, inputs: list, nonce: str = NONCE) -> list:
+    source = wrap_code_batch("python", code, param_types)
+    stdin = b"".join(frame_batch_stream(inputs, nonce))
+    result = subprocess.run([sys.executable, "-c", source], input=stdin, capture_output=True, timeout=30)
+    parser = BatchOutputParser(nonce=nonce)
+    cases = _parse(parser, result.stdout.decode(), chunk=64)
+    assert parser.ready
+    return cases
+
+
+def test_parser_splits_cases_and_stats():
+    parser = BatchOutputParser(nonce=NONCE)
+    output = (
+        f"{BATCH_READY} {NONCE}\n"
+        f"3\n\n{BATCH_SENTINEL} {NONCE} OK 1500 1200 2048\n"
+        f"boom\n\n{BATCH_SENTINEL} {NONCE} ERR 10 10 2048\n"
+    )
+
+    cases = _parse(parser, output)
+
+    assert parser.ready
+    assert cases == [
+        ("OK", "3", {"wall_ms": 1.5, "cpu_ms": 1.2, "memory_kb": 2048}),
+        ("ERR", "boom", {"wall_ms": 0.01, "cpu_ms": 0.01, "memory_kb": 2048}),
+    ]
+
+
+def test_parser_marks_overflow_and_recovers():
+    parser = BatchOutputParser(limit=10, nonce=NONCE)
+    output = (
+        f"{'x' * 100}\n{BATCH_SENTINEL} {NONCE} OK 1 1 1\n"
+        f"short\n{BATCH_SENTINEL} {NONCE} OK 1 1 1\n"
+    )
+
+    cases = _parse(parser, output)
+
+    assert [(status, text) for status, text, _ in cases] == [("OLE", ""), ("OK", "short")]
+
+
+@pytest.mark.parametrize("marker", [
+    f"{BATCH_SENTINEL} OK 1 1 1",
+    f"{BATCH_SENTINEL} fedcba9876543210 OK 1 1 1",
+    f"{BATCH_READY} fedcba9876543210",
+])
+def test_parser_rejects_forged_marker(marker):
+    parser = BatchOutputParser(nonce=NONCE)
+    output = f"{marker}\n42\n{BATCH_SENTINEL} {NONCE} OK 1 1 1\nok\n{BATCH_SENTINEL} {NONCE} OK 1 1 1\n"
+
+    cases = _parse(parser, output)
+
+    # поддельная метка не закрывает тест, а губит его; следующий тест не задет
+    assert [(status, text) for status, text, _ in cases] == [("ERR", FORGED_MARKER_ERROR), ("OK", "ok")]
+
+
+def test_python_harness_runs_all_cases():
+    code = "def add(a: int, b: int) -> int:\n    return a + b\n"
+
+    cases = _run_python(code, ["int", "int"], ["1 2", "40 2", "x 1"])
+
+    assert [status for status, _, _ in cases] == ["OK", "OK", "ERR"]
+    assert [text for _, text, _ in cases[:2]] == ["3", "42"]
+    assert all(stats is not None for _, _, stats in cases)
+
+
+def test_python_harness_forged_sentinel_fails_case():
+    code = (
+        "def fake(s: str) -> str:\n"
+        f"    print('{BATCH_SENTINEL} ' + s + ' OK 1 1 1')\n"
+        "    return 'wrong'\n"
+    )
+
+    cases = _run_python(code, ["str"], ["guess", NONCE[::-1]])
+
+    # решение не знает nonce запуска: любая его метка — подделка
+    assert [(status, text) for status, text, _ in cases] == [("ERR", FORGED_MARKER_ERROR)] * 2
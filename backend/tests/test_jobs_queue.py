@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import jobs
+from models import JudgeJob, JudgeLease, Task, User
+
+
+def _at(seconds: float) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def task(db):
+    user = User(tg_id=1, avatar_path="a.png", name="author", bio="")
+    db.add(user)
+    db.commit()
+    task = Task(title="sum", language="python", description="", code="def f(a, b):\n    return a + b\n",
+                author_id=user.id, difficulty=1, status="approved")
+    db.add(task)
+    db.commit()
+    return task
+
+
+def _job(db, task, kind="submission", age=0, status="queued") -> str:
+    job = JudgeJob(kind=kind, task_id=task.id, user_id=task.author_id, code="code",
+                   status=status, created_at=_at(-age))
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+def _lease(db, job_id: str, worker_id: str = jobs.WORKER_ID, expires_in: float = jobs.LEASE_SECONDS):
+    db.add(JudgeLease(job_id=job_id, worker_id=worker_id, heartbeat_at=_at(0), expires_at=_at(expires_in)))
+    db.commit()
+
+
+def _status(db, job_id: str) -> str:
+    db.expire_all()
+    return db.get(JudgeJob, job_id).status
+
+
+def test_claim_next_takes_job_and_leases_it(db, task):
+    job_id = _job(db, task)
+
+    claimed = jobs._claim_next()
+
+    assert claimed == (job_id, "submission", task.id, task.author_id, "code")
+    assert _status(db, job_id) == "running"
+    lease = db.get(JudgeLease, job_id)
+    assert lease.worker_id == jobs.WORKER_ID
+    assert lease.expires_at > lease.heartbeat_at
+
+
+def test_claim_next_does_not_claim_twice(db, task):
+    first, second = _job(db, task, age=10), _job(db, task, age=5)
+
+    assert jobs._claim_next()[0] == first
+    assert jobs._claim_next()[0] == second
+    assert jobs._claim_next() is None
+
+
+def test_claim_next_prefers_higher_priority(db, task):
+    _job(db, task, kind="generate_tests", age=60)
+    submission = _job(db, task, kind="submission")
+
+    assert jobs._claim_next()[0] == submission
+
+
+def test_claim_next_skips_running_jobs(db, task):
+    _job(db, task, status="running")
+
+    assert jobs._claim_next() is None
+
+
+def test_heartbeat_renews_only_given_jobs(db, task):
+    renewed, other = _job(db, task, status="running"), _job(db, task, status="running")
+    _lease(db, renewed, expires_in=1)
+    _lease(db, other, expires_in=1)
+
+    before = {job_id: db.get(JudgeLease, job_id).expires_at for job_id in (renewed, other)}
+
+    assert jobs._heartbeat([renewed]) == 1
+
+    db.expire_all()
+    assert db.get(JudgeLease, renewed).expires_at > before[renewed]
+    assert db.get(JudgeLease, other).expires_at == before[other]
+
+
+def test_heartbeat_ignores_jobs_leased_by_other_worker(db, task):
+    job_id = _job(db, task, status="running")
+    _lease(db, job_id, worker_id="other-worker")
+
+    assert jobs._heartbeat([job_id]) == 0
+    assert jobs._heartbeat([]) == 0
+
+
+def test_requeue_expired_returns_expired_and_orphaned_jobs(db, task):
+    expired, orphaned, alive = (_job(db, task, status="running") for _ in range(3))
+    _lease(db, expired, worker_id="dead-worker", expires_in=-1)
+    _lease(db, alive, worker_id="other-worker")
+
+    assert jobs._requeue_expired() == 2
+
+    assert _status(db, expired) == "queued"
+    assert _status(db, orphaned) == "queued"
+    assert _status(db, alive) == "running"
+    assert db.get(JudgeLease, expired) is None
+    assert db.get(JudgeLease, alive) is not None
+    assert db.get(JudgeJob, expired).started_at is None
+
+
+def test_requeue_expired_by_worker_releases_its_jobs(db, task):
+    own, other = _job(db, task, status="running"), _job(db, task, status="running")
+    _lease(db, own)
+    _lease(db, other, worker_id="other-worker")
+
+    assert jobs._requeue_expired(jobs.WORKER_ID) == 1
+
+    assert _status(db, own) == "queued"
+    assert _status(db, other) == "running"
+
+
+def test_requeued_job_is_claimed_again(db, task):
+    job_id = _job(db, task)
+    assert jobs._claim_next()[0] == job_id
+    jobs._requeue_expired(jobs.WORKER_ID)
+
+    assert jobs._claim_next()[0] == job_id
+    assert _status(db, job_id) == "running"
+
+
+def test_finish_requires_lease(db, task):
+    job_id = _job(db, task, status="running")
+    _lease(db, job_id, worker_id="other-worker")
+
+    assert jobs._finish(job_id, "done", {}) is False
+    assert _status(db, job_id) == "running"
@@ -0,0 +1,87 @@
+import os
+import threading
+
+
+# общие кеши тулчейнов (GOCACHE, предкомпилированные заголовки): собираются один раз
+# на образ и монтируются в песочницы только для чтения
+TOOLCHAIN_CACHE_DIR = os.path.abspath(os.getenv("JUDGE_TOOLCHAIN_CACHE_DIR", "data/toolchain_cache"))
+TOOLCHAIN_CACHE_MOUNT = "/judge-cache"
+TOOLCHAIN_BUILD_TIMEOUT = int(os.getenv("JUDGE_TOOLCHAIN_BUILD_TIMEOUT", "900"))
+READY_MARKER = ".ready"
+
+
+class ToolchainCaches:
+    """Каталоги кешей по образам: <root>/<язык>-<id образа>.
+
+    Каталог привязан к id образа, поэтому после обновления образа кеш
+    собирается заново, а не подсовывает компилятору чужие артефакты.
+    Пока кеш не собран, компиляция идет обычной командой.
+    """
+
+    def __init__(self, root: str = TOOLCHAIN_CACHE_DIR):
+        self.root = root
+        self._dirs = {}
+        self._lock = threading.Lock()
+
+    def start(self, client, lang_config: dict):
+        """Заводит каталоги кешей и в фоне собирает недостающие"""
+        for lang, config in lang_config.items():
+            build = config.get("toolchain_cache")
+            if not build or not config["sandbox"].startswith("docker"):
+                continue
+            try:
+                image_id = client.images.get(config["image"]).id.split(":")[-1][:16]
+            except Exception as e:
+                print(f"Toolchain cache for {lang} disabled: {e}")
+                continue
+            path = os.path.join(self.root, f"{lang}-{image_id}")
+            os.makedirs(path, exist_ok=True)
+            with self._lock:
+                self._dirs[config["image"]] = path
+            if not self.ready(path):
+                threading.Thread(
+                    target=self._build, args=(client, lang, config["image"], build, path),
+                    name=f"toolchain-cache-{lang}", daemon=True
+                ).start()
+
+    def _build(self, client, lang: str, image: str, command: str, path: str):
+        container = None
+        try:
+            container = client.containers.run(
+                image, ["sh", "-c", command],
+                detach=True,
+                network_disabled=True,
+                volumes={path: {"bind": TOOLCHAIN_CACHE_MOUNT, "mode": "rw"}},
+                working_dir=TOOLCHAIN_CACHE_MOUNT
+            )
+            result = container.wait(timeout=TOOLCHAIN_BUILD_TIMEOUT)
+            if result.get("StatusCode") != 0:
+                logs = container.logs(stdout=False, stderr=True).decode(errors="replace").strip()
+                print(f"Toolchain cache for {lang} failed: {logs[-500:]}")
+                return
+            with open(os.path.join(path, READY_MARKER), "w"):
+                pass
+        except Exception as e:
+            print(f"Toolchain cache for {lang} failed: {e}")
+        finally:
+            if container is not None:
+                try:
+                    container.remove(force=True)
+                except Exception:
+                    pass
+
+    def host_dir(self, image: str):
+        """Каталог кеша образа (монтируется, даже если кеш еще собирается) или None"""
+        with self._lock:
+            return self._dirs.get(image)
+
+    def volumes(self, image: str) -> dict:
+        """Монтирование кеша для docker SDK"""
+        path = self.host_dir(image)
+        return {path: {"bind": TOOLCHAIN_CACHE_MOUNT, "mode": "ro"}} if path else {}
+
+    def ready(self, path: str) -> bool:
+        return bool(path) and os.path.exists(os.path.join(path, READY_MARKER))
+
+
+toolchain_caches = ToolchainCaches()
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+VERDICT_CACHE_SIZE = int(os.getenv("JUDGE_VERDICT_CACHE_SIZE", "1024"))
+
+
+def normalize_source(code: str) -> str:
+    """Убирает различия, которые не меняют поведение: переводы строк и хвостовые пробелы"""
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def tests_version(testiki: list) -> str:
+    """Версия набора тестов — хеш их содержимого, меняется при любой правке task_tests"""
+    digest = hashlib.sha256()
+    for test in testiki:
+        for value in (test.id, test.input, test.output, getattr(test, "input_key", None),
+                      getattr(test, "output_key", None)):
+            data = str(value or "").encode()
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def verdict_key(lang: str, code: str, version: str) -> str:
+    digest = hashlib.sha256()
+    for part in (lang, normalize_source(code), version):
+        data = part.encode()
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class VerdictCache:
+    """LRU-кеш вердиктов: одинаковая посылка на тех же тестах не запускается повторно"""
+
+    def __init__(self, max_entries: int = VERDICT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, task_id: int, key: str, verdict: dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (task_id, verdict)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_task(self, task_id: int):
+        # старые записи и так не совпадут по версии тестов — освобождаем место сразу
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] == task_id]:
+                del self._entries[key]
+
+
+verdict_cache = VerdictCache()
@@ -1,35 +1,365 @@
+import codecs
+import json
 import re
 
-def wrap_code(lang: str, code: str, param_types: list) -> str:
-    """Создает обертку для кода, чтобы правильно вызывать функцию"""
+# Строка-разделитель, которой пакетная обертка закрывает вывод каждого теста.
+# Сама метка постоянная (обертка детерминирована для одного и того же кода и
+# попадает в кеш артефактов), а за ней идет одноразовый nonce запуска. Обертка
+# читает его первой строкой stdin еще до кода решения и держит в локальной
+# переменной своего main: ни в argv, ни в окружении (/proc/self/cmdline,
+# /proc/self/environ) его нет, и решение не может напечатать правильный разделитель.
+BATCH_SENTINEL = "@@CODEBATTLE_CASE_END@@"
+BATCH_READY = "@@CODEBATTLE_READY@@"
+FORGED_MARKER_ERROR = "Output contains a reserved judge marker"
+# длиннее строка метки не бывает: метка, nonce, статус и три числа
+MARKER_LINE_LIMIT = 256
+
+
+class BatchNotSupported(ValueError):
+    """Код нельзя запустить пакетом (например, у решения свой main)"""
+
+
+def parse_parameters(code: str, lang: str) -> list:
+    """Анализирует код и возвращает список типов параметров функции"""
+
     if lang == "python":
+        match = re.search(r"def\s+\w+\s*\((.*?)\)\s*:", code)
+        if not match:
+            return []
+        params_str = match.group(1).strip()
+        if not params_str:
+            return []
+        params = []
+        for param in params_str.split(","):
+            param = param.strip()
+            if ":" in param:  # param: type
+                type_part = param.split(":")[1].strip()
+                if "=" in type_part:  # убираем значения по умолчанию
+                    type_part = type_part.split("=")[0].strip()
+                params.append(type_part)
+            else:
+                if "=" in param:  # без аннотации, но с дефолтом
+                    param = param.split("=")[0].strip()
+                params.append("any")
+        return params
+
+    elif lang in ["c", "cpp", "c++", "java"]:
+        match = re.search(r"\w+\s+\w+\s*\((.*?)\)\s*\{", code, re.DOTALL)
+        if not match:
+            return []
+        params_str = match.group(1).strip()
+        if not params_str:
+            return []
+        params = []
+        for param in params_str.split(","):
+            param = param.strip()
+            if not param:
+                continue
+            # убираем имя переменной
+            parts = param.split()
+            if len(parts) > 1:
+                type_part = " ".join(parts[:-1])
+            else:
+                type_part = parts[0]
+            params.append(type_part)
+        return params
+
+    elif lang == "js":
+        match = re.search(r"function\s+\w+\s*\((.*?)\)\s*\{", code)
+        if match:
+            params_str = match.group(1).strip()
+            if not params_str:
+                return []
+            return ["any"] * len(params_str.split(","))
+        return []
+
+    elif lang == "rust":
+        match = re.search(r"fn\s+\w+\s*\((.*?)\)", code)
+        if not match:
+            return []
+        params_str = match.group(1).strip()
+        if not params_str:
+            return []
+        params = []
+        for param in params_str.split(","):
+            if ":" in param:
+                type_part = param.split(":")[1].strip()
+                params.append(type_part)
+            else:
+                params.append("any")
+        return params
+
+    elif lang == "go":
+        match = re.search(r"func\s+\w+\s*\((.*?)\)", code)
+        if not match:
+            return []
+        params_str = match.group(1).strip()
+        if not params_str:
+            return []
+        params = []
+        for param in params_str.split(","):
+            parts = param.strip().split()
+            if len(parts) == 2:  # name type
+                params.append(parts[1])
+            elif len(parts) == 1:  # только тип
+                params.append(parts[0])
+            else:
+                params.append("any")
+        return params
+
+    return []
+
+
+def _python_function(code: str, param_types: list, func_name: str = None):
+    if func_name is None:
         func_match = re.search(r"def\s+(\w+)\s*\(", code)
         if not func_match:
             raise ValueError("Function definition not found in Python code")
         func_name = func_match.group(1)
-        
-        conversions = []
-        for i, param_type in enumerate(param_types):
-            if "int" in param_type:
-                conversions.append(f"arg{i} = int(data[{i}])")
-            elif "float" in param_type:
-                conversions.append(f"arg{i} = float(data[{i}])")
-            elif "str" in param_type:
-                conversions.append(f"arg{i} = data[{i}]")
-            elif "list[int]" in param_type or "List[int]" in param_type:
-                conversions.append(f"arg{i} = list(map(int, data[{i}].split()))")
-            elif "list[float]" in param_type or "List[float]" in param_type:
-                conversions.append(f"arg{i} = list(map(float, data[{i}].split()))")
-            elif "list[str]" in param_type or "List[str]" in param_type:
-                conversions.append(f"arg{i} = data[{i}].split()")
-            elif "bool" in param_type:
-                conversions.append(f"arg{i} = data[{i}].lower() == 'true'")
-            else:
-                conversions.append(f"arg{i} = data[{i}]")
-        
+
+    conversions = []
+    for i, param_type in enumerate(param_types):
+        if "int" in param_type:
+            conversions.append(f"arg{i} = int(data[{i}])")
+        elif "float" in param_type:
+            conversions.append(f"arg{i} = float(data[{i}])")
+        elif "str" in param_type:
+            conversions.append(f"arg{i} = data[{i}]")
+        elif "list[int]" in param_type or "List[int]" in param_type:
+            conversions.append(f"arg{i} = list(map(int, data[{i}].split()))")
+        elif "list[float]" in param_type or "List[float]" in param_type:
+            conversions.append(f"arg{i} = list(map(float, data[{i}].split()))")
+        elif "list[str]" in param_type or "List[str]" in param_type:
+            conversions.append(f"arg{i} = data[{i}].split()")
+        elif "bool" in param_type:
+            conversions.append(f"arg{i} = data[{i}].lower() == 'true'")
+        else:
+            conversions.append(f"arg{i} = data[{i}]")
+    return func_name, conversions
+
+
+def _js_function(code: str, param_types: list, func_name: str = None):
+    if func_name is None:
+        # Извлекаем имя функции (поддерживаем function и стрелочные функции)
+        func_match = re.search(r"(?:function\s+(\w+)|const\s+(\w+)\s*=\s*\([^)]*\)\s*=>|let\s+(\w+)\s*=\s*\([^)]*\)\s*=>|var\s+(\w+)\s*=\s*\([^)]*\)\s*=>)", code)
+        if not func_match:
+            raise ValueError("Function definition not found in JavaScript code")
+
+        func_name = func_match.group(1) or func_match.group(2) or func_match.group(3) or func_match.group(4)
+
+    conversions = []
+    for i, param_type in enumerate(param_types):
+        if "int" in param_type:
+            conversions.append(f"const arg{i} = parseInt(data[{i}]);")
+        elif "float" in param_type:
+            conversions.append(f"const arg{i} = parseFloat(data[{i}]);")
+        elif "array<int>" in param_type:
+            conversions.append(f"const arg{i} = data[{i}].split(' ').map(x => parseInt(x));")
+        elif "array<float>" in param_type:
+            conversions.append(f"const arg{i} = data[{i}].split(' ').map(x => parseFloat(x));")
+        elif "array<string>" in param_type:
+            conversions.append(f"const arg{i} = data[{i}].split(' ');")
+        elif "bool" in param_type:
+            conversions.append(f"const arg{i} = data[{i}].toLowerCase() === 'true';")
+        else:
+            conversions.append(f"const arg{i} = data[{i}];")
+    return func_name, conversions
+
+
+def _c_function(code: str, param_types: list, args: str = "argv", offset: int = 1, func_name: str = None):
+    if func_name is None:
+        # Ищем любую другую функцию
+        func_match = re.search(r"^\s*[\w\s]+\s+(\w+)\s*\([^)]*\)\s*\{", code, re.MULTILINE)
+        if not func_match:
+            raise ValueError("Function definition not found in C code")
+        func_name = func_match.group(1)
+
+    conversions = []
+    for i, param_type in enumerate(param_types):
+        src = f"{args}[{i + offset}]"
+        if "int" in param_type:
+            conversions.append(f"int arg{i} = atoi({src});")
+        elif "float" in param_type or "double" in param_type:
+            conversions.append(f"double arg{i} = atof({src});")
+        elif "char*" in param_type:
+            conversions.append(f"char* arg{i} = {src};")
+        elif "[]" in param_type:
+            conversions.append(f"int arg{i}[100]; parse_array({src}, arg{i});")
+        else:
+            conversions.append(f"char* arg{i} = {src};")
+    return func_name, conversions
+
+
+def _cpp_function(code: str, param_types: list, args: str = "argv", offset: int = 1, func_name: str = None):
+    if func_name is None or not param_types:
+        # Ищем любую функцию
+        func_match = re.search(r"^\s*[\w\s]+\s+(\w+)\s*\(([^)]*)\)\s*\{", code, re.MULTILINE)
+        if not func_match:
+            raise ValueError("Function definition not found in C++ code")
+
+        func_name = func_name or func_match.group(1)
+        params_str = func_match.group(2)
+
+    # Если типы параметров не предоставлены, пытаемся определить их количество
+    if not param_types:
+        if params_str.strip() == "":
+            param_types = []
+        else:
+            # Простой подсчёт параметров по запятым
+            param_count = params_str.count(",") + 1
+            param_types = ["string"] * param_count
+
+    conversions = []
+    for i, param_type in enumerate(param_types):
+        src = f"{args}[{i + offset}]"
+        if "int" in param_type:
+            conversions.append(f"int arg{i} = std::stoi({src});")
+        elif "double" in param_type or "float" in param_type:
+            conversions.append(f"double arg{i} = std::stod({src});")
+        elif "string" in param_type:
+            conversions.append(f"std::string arg{i} = {src};")
+        elif "vector<int>" in param_type:
+            conversions.append(f"std::vector<int> arg{i}; {{std::stringstream ss({src}); int t; while(ss>>t) arg{i}.push_back(t);}}")
+        elif "vector<double>" in param_type:
+            conversions.append(f"std::vector<double> arg{i}; {{std::stringstream ss({src}); double t; while(ss>>t) arg{i}.push_back(t);}}")
+        elif "vector<string>" in param_type:
+            conversions.append(f"std::vector<std::string> arg{i}; {{std::stringstream ss({src}); std::string t; while(ss>>t) arg{i}.push_back(t);}}")
+        else:
+            conversions.append(f"auto arg{i} = {src};")
+    return func_name, conversions
+
+
+def _rust_function(code: str, param_types: list, func_name: str = None):
+    if func_name is None:
+        func_match = re.search(r"fn\s+(\w+)\s*\([^)]*\)", code)
+        if not func_match:
+            raise ValueError("Function definition not found in Rust code")
+        func_name = func_match.group(1)
+
+    conversions = []
+    for i, param_type in enumerate(param_types):
+        if "i32" in param_type:
+            conversions.append(f"let arg{i}: i32 = args[{i}].parse().unwrap();")
+        elif "f64" in param_type:
+            conversions.append(f"let arg{i}: f64 = args[{i}].parse().unwrap();")
+        elif param_type == "String":
+            conversions.append(f"let arg{i}: String = args[{i}].to_string();")
+        elif param_type == "&str":
+            conversions.append(f"let arg{i}: &str = args[{i}];")
+        elif "bool" in param_type:
+            conversions.append(f"let arg{i}: bool = args[{i}].parse().unwrap();")
+        elif "Vec<i32>" in param_type:
+            conversions.append(f"let arg{i}: Vec<i32> = args[{i}].split_whitespace().map(|s| s.parse().unwrap()).collect();")
+        elif "Vec<f64>" in param_type:
+            conversions.append(f"let arg{i}: Vec<f64> = args[{i}].split_whitespace().map(|s| s.parse().unwrap()).collect();")
+        elif "Vec<String>" in param_type:
+            conversions.append(f"let arg{i}: Vec<String> = args[{i}].split_whitespace().map(|s| s.to_string()).collect();")
+        elif "&[i32]" in param_type:
+            conversions.append(f"let tmp{i}: Vec<i32> = args[{i}].split_whitespace().map(|s| s.parse().unwrap()).collect();")
+            conversions.append(f"let arg{i}: &[i32] = &tmp{i};")
+        elif "&[f64]" in param_type:
+            conversions.append(f"let tmp{i}: Vec<f64> = args[{i}].split_whitespace().map(|s| s.parse().unwrap()).collect();")
+            conversions.append(f"let arg{i}: &[f64] = &tmp{i};")
+        elif "&[String]" in param_type:
+            conversions.append(f"let tmp{i}: Vec<String> = args[{i}].split_whitespace().map(|s| s.to_string()).collect();")
+            conversions.append(f"let arg{i}: &[String] = &tmp{i};")
+        elif param_type == "String":
+            conversions.append(f"let arg{i}: String = args[{i}].to_string();")
+        elif param_type == "&str":
+            conversions.append(f"let tmp{i}: String = args[{i}].to_string();")
+            conversions.append(f"let arg{i}: &str = &tmp{i};")
+        else:
+            conversions.append(f"let arg{i} = args[{i}];")
+    return func_name, conversions
+
+
+def _go_function(code: str, param_types: list, func_name: str = None):
+    if func_name is None:
+        func_match = re.search(r"func\s+(\w+)\s*\([^)]*\)", code)
+        if not func_match:
+            raise ValueError("Function definition not found in Go code")
+        func_name = func_match.group(1)
+
+    conversions = []
+    for i, param_type in enumerate(param_types):
+        if "int" == param_type:
+            conversions.append(f"arg{i}, _ := strconv.Atoi(args[{i}])")
+        elif "float64" in param_type:
+            conversions.append(f"arg{i}, _ := strconv.ParseFloat(args[{i}], 64)")
+        elif "string" in param_type:
+            conversions.append(f"arg{i} := args[{i}]")
+        elif "[]int" in param_type:
+            conversions.append(f"arg{i} := sliceToInt(args[{i}])")
+        elif "[]float64" in param_type:
+            conversions.append(f"arg{i} := sliceToFloat(args[{i}])")
+        elif "[]string" in param_type:
+            conversions.append(f"arg{i} := strings.Split(args[{i}], \" \")")
+        elif "bool" in param_type:
+            conversions.append(f"arg{i}, _ := strconv.ParseBool(args[{i}])")
+        else:
+            conversions.append(f"arg{i} := args[{i}]")
+    return func_name, conversions
+
+
+C_PARSE_ARRAY = """
+void parse_array(char* str, int* arr) {
+    int i = 0;
+    char* token = strtok(str, " ");
+    while (token != NULL) {
+        arr[i++] = atoi(token);
+        token = strtok(NULL, " ");
+    }
+}
+"""
+
+C_JUDGE_STATS = """
+static long judge_usec_since(clockid_t clock, struct timespec start) {
+    struct timespec now;
+    clock_gettime(clock, &now);
+    return (now.tv_sec - start.tv_sec) * 1000000L + (now.tv_nsec - start.tv_nsec) / 1000;
+}
+
+static void judge_print_stats(struct timespec wall, struct timespec cpu) {
+    struct rusage usage;
+    getrusage(RUSAGE_SELF, &usage);
+    printf("%ld %ld %ld\\n", judge_usec_since(CLOCK_MONOTONIC, wall),
+           judge_usec_since(CLOCK_PROCESS_CPUTIME_ID, cpu), usage.ru_maxrss);
+    fflush(stdout);
+}
+"""
+
+GO_SLICE_HELPERS = """
+func sliceToInt(s string) []int {
+    strs := strings.Split(s, " ")
+    arr := make([]int, len(strs))
+    for i, str := range strs {
+        arr[i], _ = strconv.Atoi(str)
+    }
+    return arr
+}
+
+func sliceToFloat(s string) []float64 {
+    strs := strings.Split(s, " ")
+    arr := make([]float64, len(strs))
+    for i, str := range strs {
+        arr[i], _ = strconv.ParseFloat(str, 64)
+    }
+    return arr
+}
+"""
+
+
+def _has_main(code: str) -> bool:
+    return "int main(" in code or "void main(" in code
+
+
+def wrap_code(lang: str, code: str, param_types: list) -> str:
+    """Создает обертку для кода, чтобы правильно вызывать функцию"""
+    if lang == "python":
+        func_name, conversions = _python_function(code, param_types)
         conversion_code = "\n    ".join(conversions)
         args_str = ", ".join([f"arg{i}" for i in range(len(param_types))])
-        
+
         wrapper = f"""
 import sys
 
@@ -44,33 +374,10 @@ if __name__ == '__main__':
         return wrapper.strip()
 
     elif lang == "js":
-        # Извлекаем имя функции (поддерживаем function и стрелочные функции)
-        func_match = re.search(r"(?:function\s+(\w+)|const\s+(\w+)\s*=\s*\([^)]*\)\s*=>|let\s+(\w+)\s*=\s*\([^)]*\)\s*=>|var\s+(\w+)\s*=\s*\([^)]*\)\s*=>)", code)
-        if not func_match:
-            raise ValueError("Function definition not found in JavaScript code")
-        
-        func_name = func_match.group(1) or func_match.group(2) or func_match.group(3) or func_match.group(4)
-
-        conversions = []
-        for i, param_type in enumerate(param_types):
-            if "int" in param_type:
-                conversions.append(f"const arg{i} = parseInt(data[{i}]);")
-            elif "float" in param_type:
-                conversions.append(f"const arg{i} = parseFloat(data[{i}]);")
-            elif "array<int>" in param_type:
-                conversions.append(f"const arg{i} = data[{i}].split(' ').map(x => parseInt(x));")
-            elif "array<float>" in param_type:
-                conversions.append(f"const arg{i} = data[{i}].split(' ').map(x => parseFloat(x));")
-            elif "array<string>" in param_type:
-                conversions.append(f"const arg{i} = data[{i}].split(' ');")
-            elif "bool" in param_type:
-                conversions.append(f"const arg{i} = data[{i}].toLowerCase() === 'true';")
-            else:
-                conversions.append(f"const arg{i} = data[{i}];")
-        
+        func_name, conversions = _js_function(code, param_types)
         conversion_code = "\n    ".join(conversions)
         args_str = ", ".join([f"arg{i}" for i in range(len(param_types))])
-        
+
         wrapper = f"""
 const data = require('fs').readFileSync(0, 'utf-8').trim().split(/\\s+/);
 
@@ -84,62 +391,26 @@ console.log(result);
 
     elif lang == "c":
         # Проверяем, содержит ли код функцию main
-        if "int main(" in code or "void main(" in code:
+        if _has_main(code):
             # Если код уже содержит main, модифицируем его для чтения аргументов
             wrapper = f"""
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
-
-void parse_array(char* str, int* arr) {{
-    int i = 0;
-    char* token = strtok(str, " ");
-    while (token != NULL) {{
-        arr[i++] = atoi(token);
-        token = strtok(NULL, " ");
-    }}
-}}
-
+{C_PARSE_ARRAY}
 {code}
 """
             return wrapper.strip()
-        
-        # Ищем любую другую функцию
-        func_match = re.search(r"^\s*[\w\s]+\s+(\w+)\s*\([^)]*\)\s*\{", code, re.MULTILINE)
-        if not func_match:
-            raise ValueError("Function definition not found in C code")
-        func_name = func_match.group(1)
-        
-        conversions = []
-        for i, param_type in enumerate(param_types):
-            if "int" in param_type:
-                conversions.append(f"int arg{i} = atoi(argv[{i+1}]);")
-            elif "float" in param_type or "double" in param_type:
-                conversions.append(f"double arg{i} = atof(argv[{i+1}]);")
-            elif "char*" in param_type:
-                conversions.append(f"char* arg{i} = argv[{i+1}];")
-            elif "[]" in param_type:
-                conversions.append(f"int arg{i}[100]; parse_array(argv[{i+1}], arg{i});")
-            else:
-                conversions.append(f"char* arg{i} = argv[{i+1}];")
-        
+
+        func_name, conversions = _c_function(code, param_types)
         conversion_code = "\n    ".join(conversions)
         args_str = ", ".join([f"arg{i}" for i in range(len(param_types))])
-        
+
         wrapper = f"""
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
-
-void parse_array(char* str, int* arr) {{
-    int i = 0;
-    char* token = strtok(str, " ");
-    while (token != NULL) {{
-        arr[i++] = atoi(token);
-        token = strtok(NULL, " ");
-    }}
-}}
-
+{C_PARSE_ARRAY}
 {code}
 
 int main(int argc, char* argv[]) {{
@@ -152,7 +423,7 @@ int main(int argc, char* argv[]) {{
 
     elif lang == "cpp":
         # Проверяем, содержит ли код функцию main
-        if "int main(" in code or "void main(" in code:
+        if _has_main(code):
             return f"""
 #include <iostream>
 #include <sstream>
@@ -161,44 +432,11 @@ int main(int argc, char* argv[]) {{
 
 {code}
 """.strip()
-        
-        # Ищем любую функцию
-        func_match = re.search(r"^\s*[\w\s]+\s+(\w+)\s*\(([^)]*)\)\s*\{", code, re.MULTILINE)
-        if not func_match:
-            raise ValueError("Function definition not found in C++ code")
-        
-        func_name = func_match.group(1)
-        params_str = func_match.group(2)
-        
-        # Если типы параметров не предоставлены, пытаемся определить их количество
-        if not param_types:
-            if params_str.strip() == "":
-                param_types = []
-            else:
-                # Простой подсчёт параметров по запятым
-                param_count = params_str.count(",") + 1
-                param_types = ["string"] * param_count
-        
-        conversions = []
-        for i, param_type in enumerate(param_types):
-            if "int" in param_type:
-                conversions.append(f"int arg{i} = std::stoi(argv[{i+1}]);")
-            elif "double" in param_type or "float" in param_type:
-                conversions.append(f"double arg{i} = std::stod(argv[{i+1}]);")
-            elif "string" in param_type:
-                conversions.append(f"std::string arg{i} = argv[{i+1}];")
-            elif "vector<int>" in param_type:
-                conversions.append(f"std::vector<int> arg{i}; {{std::stringstream ss(argv[{i+1}]); int t; while(ss>>t) arg{i}.push_back(t);}}")
-            elif "vector<double>" in param_type:
-                conversions.append(f"std::vector<double> arg{i}; {{std::stringstream ss(argv[{i+1}]); double t; while(ss>>t) arg{i}.push_back(t);}}")
-            elif "vector<string>" in param_type:
-                conversions.append(f"std::vector<std::string> arg{i}; {{std::stringstream ss(argv[{i+1}]); std::string t; while(ss>>t) arg{i}.push_back(t);}}")
-            else:
-                conversions.append(f"auto arg{i} = argv[{i+1}];")
-        
+
+        func_name, conversions = _cpp_function(code, param_types)
         conversion_code = "\n    ".join(conversions)
-        args_str = ", ".join([f"arg{i}" for i in range(len(param_types))])
-        
+        args_str = ", ".join([f"arg{i}" for i in range(len(conversions))])
+
         wrapper = f"""
 #include <iostream>
 #include <sstream>
@@ -214,51 +452,12 @@ int main(int argc, char* argv[]) {{
 }}
 """
         return wrapper.strip()
-    
+
     elif lang == "rust":
-        func_match = re.search(r"fn\s+(\w+)\s*\([^)]*\)", code)
-        if not func_match:
-            raise ValueError("Function definition not found in Rust code")
-        func_name = func_match.group(1)
-        
-        conversions = []
-        for i, param_type in enumerate(param_types):
-            if "i32" in param_type:
-                conversions.append(f"let arg{i}: i32 = args[{i}].parse().unwrap();")
-            elif "f64" in param_type:
-                conversions.append(f"let arg{i}: f64 = args[{i}].parse().unwrap();")
-            elif param_type == "String":
-                conversions.append(f"let arg{i}: String = args[{i}].to_string();")
-            elif param_type == "&str":
-                conversions.append(f"let arg{i}: &str = args[{i}];")
-            elif "bool" in param_type:
-                conversions.append(f"let arg{i}: bool = args[{i}].parse().unwrap();")
-            elif "Vec<i32>" in param_type:
-                conversions.append(f"let arg{i}: Vec<i32> = args[{i}].split_whitespace().map(|s| s.parse().unwrap()).collect();")
-            elif "Vec<f64>" in param_type:
-                conversions.append(f"let arg{i}: Vec<f64> = args[{i}].split_whitespace().map(|s| s.parse().unwrap()).collect();")
-            elif "Vec<String>" in param_type:
-                conversions.append(f"let arg{i}: Vec<String> = args[{i}].split_whitespace().map(|s| s.to_string()).collect();")
-            elif "&[i32]" in param_type:
-                conversions.append(f"let tmp{i}: Vec<i32> = args[{i}].split_whitespace().map(|s| s.parse().unwrap()).collect();")
-                conversions.append(f"let arg{i}: &[i32] = &tmp{i};")
-            elif "&[f64]" in param_type:
-                conversions.append(f"let tmp{i}: Vec<f64> = args[{i}].split_whitespace().map(|s| s.parse().unwrap()).collect();")
-                conversions.append(f"let arg{i}: &[f64] = &tmp{i};")
-            elif "&[String]" in param_type:
-                conversions.append(f"let tmp{i}: Vec<String> = args[{i}].split_whitespace().map(|s| s.to_string()).collect();")
-                conversions.append(f"let arg{i}: &[String] = &tmp{i};")
-            elif param_type == "String":
-                conversions.append(f"let arg{i}: String = args[{i}].to_string();")
-            elif param_type == "&str":
-                conversions.append(f"let tmp{i}: String = args[{i}].to_string();")
-                conversions.append(f"let arg{i}: &str = &tmp{i};")
-            else:
-                conversions.append(f"let arg{i} = args[{i}];")
-        
+        func_name, conversions = _rust_function(code, param_types)
         conversion_code = "\n    ".join(conversions)
         args_str = ", ".join([f"arg{i}" for i in range(len(param_types))])
-        
+
         wrapper = f"""
 use std::io::{{self, Read}};
 
@@ -268,9 +467,9 @@ fn main() {{
     let mut input = String::new();
     io::stdin().read_to_string(&mut input).unwrap();
     let args: Vec<&str> = input.split_whitespace().collect();
-    
+
     {conversion_code}
-    
+
     let result = {func_name}({args_str});
     println!("{{}}", result);
 }}
@@ -278,33 +477,10 @@ fn main() {{
         return wrapper.strip()
 
     elif lang == "go":
-        func_match = re.search(r"func\s+(\w+)\s*\([^)]*\)", code)
-        if not func_match:
-            raise ValueError("Function definition not found in Go code")
-        func_name = func_match.group(1)
-        
-        conversions = []
-        for i, param_type in enumerate(param_types):
-            if "int" == param_type:
-                conversions.append(f"arg{i}, _ := strconv.Atoi(args[{i}])")
-            elif "float64" in param_type:
-                conversions.append(f"arg{i}, _ := strconv.ParseFloat(args[{i}], 64)")
-            elif "string" in param_type:
-                conversions.append(f"arg{i} := args[{i}]")
-            elif "[]int" in param_type:
-                conversions.append(f"arg{i} := sliceToInt(args[{i}])")
-            elif "[]float64" in param_type:
-                conversions.append(f"arg{i} := sliceToFloat(args[{i}])")
-            elif "[]string" in param_type:
-                conversions.append(f"arg{i} := strings.Split(args[{i}], \" \")")
-            elif "bool" in param_type:
-                conversions.append(f"arg{i}, _ := strconv.ParseBool(args[{i}])")
-            else:
-                conversions.append(f"arg{i} := args[{i}]")
-        
+        func_name, conversions = _go_function(code, param_types)
         conversion_code = "\n    ".join(conversions)
         args_str = ", ".join([f"arg{i}" for i in range(len(param_types))])
-        
+
         wrapper = f"""
 package main
 
@@ -315,25 +491,674 @@ import (
     "strings"
 )
 
+{code}
+{GO_SLICE_HELPERS}
+func main() {{
+    args := os.Args[1:]
+    {conversion_code}
+    result := {func_name}({args_str})
+    fmt.Println(result)
+}}
+"""
+        return wrapper.strip()
+
+    else:
+        raise ValueError(f"Unsupported language: {lang}")
+
+
+def wrap_code_batch(lang: str, code: str, param_types: list, isolate: bool = False, func_name: str = None) -> str:
+    """Создает обертку, которая за один запуск прогоняет функцию на всех тестах.
+
+    На вход: строка с nonce запуска, строка с числом тестов N, затем для каждого теста строка с длиной
+    в байтах и сами данные. После вывода каждого теста печатается строка
+    "BATCH_SENTINEL <nonce> OK <wall_us> <cpu_us> <maxrss_kb>" или то же с ERR (если
+    тест упал с исключением, перед ней печатается текст ошибки) или MLE (python, cpp:
+    не удалось выделить память). Время меряется вокруг
+    вызова функции, память — пик RSS процесса на момент окончания теста. Перед
+    первым тестом печатается "BATCH_READY <nonce>": с этого момента идет отсчет
+    лимита времени. Вход с nonce формирует frame_batch_stream.
+
+    isolate (python, js): каждый тест видит решение в исходном состоянии — глобальные
+    переменные, изменённые предыдущим тестом, не протекают в следующий.
+    func_name — имя вызываемой функции, если оно уже известно (иначе ищется в code).
+    """
+    arg_count = len(param_types)
+
+    if lang == "python":
+        func_name, conversions = _python_function(code, param_types, func_name=func_name)
+        conversion_code = "\n    ".join(conversions)
+        args_str = ", ".join([f"arg{i}" for i in range(arg_count)])
+
+        if isolate:
+            # зигота: интерпретатор и решение загружены один раз, каждый тест — в свежем fork()
+            run_case = f"""
+def _judge_fork(data):
+    sys.stdout.flush()
+    _judge_r, _judge_w = os.pipe()
+    _judge_pid = os.fork()
+    if _judge_pid == 0:
+        os.close(_judge_r)
+        _judge_code = 1
+        try:
+            _judge_result = "\\n".join(_judge_run(data)[::-1])
+            sys.stdout.flush()
+            with os.fdopen(_judge_w, "wb") as _judge_pipe:
+                _judge_pipe.write(_judge_result.encode())
+            _judge_code = 0
+        finally:
+            os._exit(_judge_code)
+    os.close(_judge_w)
+    with os.fdopen(_judge_r, "rb") as _judge_pipe:
+        _judge_result = _judge_pipe.read().decode()
+    _, _judge_wait = os.waitpid(_judge_pid, 0)
+    if _judge_result:
+        return _judge_result.split("\\n", 1)[::-1]
+    if os.WIFSIGNALED(_judge_wait):
+        if os.WTERMSIG(_judge_wait) == signal.SIGKILL:
+            # убил OOM killer — завершаемся так же, как завершился бы сам запуск
+            os._exit(137)
+        return f"Killed by signal {{os.WTERMSIG(_judge_wait)}}", "ERR"
+    return f"Exited with code {{os.waitstatus_to_exitcode(_judge_wait)}}", "ERR"
+
+_judge_case_runner = _judge_fork
+"""
+        else:
+            run_case = "_judge_case_runner = _judge_run"
+
+        wrapper = f"""
+import os
+import resource
+import signal
+import sys
+import time
+
 {code}
 
-func sliceToInt(s string) []int {{
-    strs := strings.Split(s, " ")
-    arr := make([]int, len(strs))
-    for i, str := range strs {{
-        arr[i], _ = strconv.Atoi(str)
+def _judge_case(data):
+    {conversion_code}
+    return {func_name}({args_str})
+
+def _judge_run(data):
+    _judge_wall, _judge_cpu = time.perf_counter(), time.process_time()
+    try:
+        _judge_out = _judge_case(data)
+        _judge_status = "OK"
+    except MemoryError:
+        # выделение памяти отказало на лимите песочницы — это MLE, а не ошибка решения
+        _judge_out = "MemoryError"
+        _judge_status = "MLE"
+    except Exception as e:
+        _judge_out = f"{{type(e).__name__}}: {{e}}"
+        _judge_status = "ERR"
+    return str(_judge_out), "%s %d %d %d" % (
+        _judge_status,
+        (time.perf_counter() - _judge_wall) * 1e6,
+        (time.process_time() - _judge_cpu) * 1e6,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    )
+{run_case}
+
+def _judge_main():
+    # nonce — локальная переменная: из кода решения по имени он не виден
+    judge_in = sys.stdin.buffer
+    nonce = judge_in.readline().decode().strip()
+    count = int(judge_in.readline())
+    print("{BATCH_READY} " + nonce, flush=True)
+    for _ in range(count):
+        size = int(judge_in.readline())
+        data = judge_in.read(size).decode().split()
+        data += [""] * ({arg_count} - len(data))
+        out, stats = _judge_case_runner(data)
+        print(out)
+        print("\\n{BATCH_SENTINEL} " + nonce + " " + stats, flush=True)
+
+if __name__ == '__main__':
+    _judge_main()
+"""
+        return wrapper.strip()
+
+    elif lang == "js":
+        func_name, conversions = _js_function(code, param_types, func_name=func_name)
+        conversion_code = "\n        ".join(conversions)
+        args_str = ", ".join([f"arg{i}" for i in range(arg_count)])
+
+        solve = f"""function (data) {{
+        {conversion_code}
+        return {func_name}({args_str});
+    }}"""
+        if isolate:
+            # node не умеет fork(): решение компилируется один раз, а каждый тест
+            # исполняет его в свежем vm-контексте со своими глобальными объектами
+            solution = json.dumps(f"{code}\n;globalThis.judgeSolve = {solve};\n")
+            prelude = f"""
+const judgeVm = require('vm');
+const judgeScript = new judgeVm.Script({solution}, {{ filename: "/workspace/solution.js" }});
+const judgeHost = {{
+    console, require, process, Buffer, TextEncoder, TextDecoder, queueMicrotask,
+    setTimeout, clearTimeout, setInterval, clearInterval, setImmediate, clearImmediate
+}};
+function judgeFresh() {{
+    const context = judgeVm.createContext({{ ...judgeHost }});
+    judgeScript.runInContext(context);
+    return context.judgeSolve;
+}}
+"""
+            prepare = """const judgeSolve = judgeFresh();
+        judgeWall = process.hrtime.bigint();
+        judgeCpu = process.cpuUsage();"""
+        else:
+            prelude = f"""
+{code}
+
+const judgeSolve = {solve};
+"""
+            prepare = ""
+
+        wrapper = f"""
+{prelude}
+// вход и nonce — в области видимости функции: коду решения они недоступны
+(function judgeMain() {{
+const judgeRaw = require('fs').readFileSync(0);
+let judgePos = 0;
+function judgeLine() {{
+    let end = judgeRaw.indexOf(10, judgePos);
+    if (end === -1) end = judgeRaw.length;
+    const line = judgeRaw.subarray(judgePos, end).toString();
+    judgePos = end + 1;
+    return line.trim();
+}}
+const judgeNonce = judgeLine();
+const judgeCount = parseInt(judgeLine());
+console.log("{BATCH_READY} " + judgeNonce);
+for (let judgeCase = 0; judgeCase < judgeCount; judgeCase++) {{
+    const judgeSize = parseInt(judgeLine());
+    const data = judgeRaw.subarray(judgePos, judgePos + judgeSize).toString().trim().split(/\\s+/);
+    judgePos += judgeSize;
+    while (data.length < {arg_count}) data.push("");
+    let judgeStatus = "OK";
+    let judgeOut;
+    let judgeWall = process.hrtime.bigint();
+    let judgeCpu = process.cpuUsage();
+    try {{
+        {prepare}
+        judgeOut = judgeSolve(data);
+    }} catch (e) {{
+        judgeOut = e && e.message ? `${{e.name}}: ${{e.message}}` : String(e);
+        judgeStatus = "ERR";
     }}
-    return arr
+    const judgeCpuUsed = process.cpuUsage(judgeCpu);
+    const judgeStats = `${{(process.hrtime.bigint() - judgeWall) / 1000n}} ${{judgeCpuUsed.user + judgeCpuUsed.system}} ${{process.resourceUsage().maxRSS}}`;
+    console.log(judgeOut);
+    console.log("\\n{BATCH_SENTINEL} " + judgeNonce + " " + judgeStatus + " " + judgeStats);
 }}
+}})();
+"""
+        return wrapper.strip()
 
-func main() {{
-    args := os.Args[1:]
+    elif lang == "c":
+        if _has_main(code):
+            raise BatchNotSupported("C code with its own main can't be run in batch mode")
+
+        func_name, conversions = _c_function(code, param_types, args="args", offset=0, func_name=func_name)
+        conversion_code = "\n        ".join(conversions)
+        args_str = ", ".join([f"arg{i}" for i in range(arg_count)])
+
+        wrapper = f"""
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <sys/resource.h>
+{C_PARSE_ARRAY}
+{code}
+
+{C_JUDGE_STATS}
+int main(void) {{
+    char judge_nonce[65] = "";
+    int judge_count;
+    if (scanf("%64s %d", judge_nonce, &judge_count) != 2) return 0;
+    printf("{BATCH_READY} %s\\n", judge_nonce);
+    fflush(stdout);
+    for (int judge_case = 0; judge_case < judge_count; judge_case++) {{
+        long judge_size;
+        if (scanf("%ld", &judge_size) != 1) return 1;
+        getchar();
+        char* judge_buf = malloc(judge_size + 1);
+        judge_buf[fread(judge_buf, 1, judge_size, stdin)] = '\\0';
+        long judge_cap = judge_size / 2 + {arg_count} + 1;
+        char** args = malloc(sizeof(char*) * judge_cap);
+        for (long i = 0; i < judge_cap; i++) args[i] = "";
+        long judge_argc = 0;
+        char* judge_tok = strtok(judge_buf, " \\t\\r\\n");
+        while (judge_tok != NULL) {{
+            args[judge_argc++] = judge_tok;
+            judge_tok = strtok(NULL, " \\t\\r\\n");
+        }}
+        struct timespec judge_wall, judge_cpu;
+        clock_gettime(CLOCK_MONOTONIC, &judge_wall);
+        clock_gettime(CLOCK_PROCESS_CPUTIME_ID, &judge_cpu);
+        {conversion_code}
+        {func_name}({args_str});
+        fflush(stdout);
+        printf("\\n{BATCH_SENTINEL} %s OK ", judge_nonce);
+        judge_print_stats(judge_wall, judge_cpu);
+        fflush(stdout);
+        free(args);
+        free(judge_buf);
+    }}
+    return 0;
+}}
+"""
+        return wrapper.strip()
+
+    elif lang == "cpp":
+        if _has_main(code):
+            raise BatchNotSupported("C++ code with its own main can't be run in batch mode")
+
+        func_name, conversions = _cpp_function(code, param_types, args="args", offset=0, func_name=func_name)
+        conversion_code = "\n            ".join(conversions)
+        args_str = ", ".join([f"arg{i}" for i in range(len(conversions))])
+
+        wrapper = f"""
+#include <iostream>
+#include <sstream>
+#include <vector>
+#include <string>
+#include <exception>
+#include <new>
+#include <time.h>
+#include <sys/resource.h>
+
+{code}
+
+{C_JUDGE_STATS}
+int main() {{
+    std::string judge_nonce;
+    int judge_count;
+    if (!(std::cin >> judge_nonce >> judge_count)) return 0;
+    std::cout << "{BATCH_READY} " << judge_nonce << std::endl;
+    for (int judge_case = 0; judge_case < judge_count; judge_case++) {{
+        long judge_size;
+        std::cin >> judge_size;
+        std::cin.get();
+        std::string judge_buf(judge_size, '\\0');
+        std::cin.read(&judge_buf[0], judge_size);
+        std::vector<std::string> args;
+        {{
+            std::istringstream judge_ss(judge_buf);
+            std::string t;
+            while (judge_ss >> t) args.push_back(t);
+        }}
+        if (args.size() < {len(conversions)}) args.resize({len(conversions)});
+        const char* judge_status = "OK";
+        struct timespec judge_wall, judge_cpu;
+        clock_gettime(CLOCK_MONOTONIC, &judge_wall);
+        clock_gettime(CLOCK_PROCESS_CPUTIME_ID, &judge_cpu);
+        try {{
+            {conversion_code}
+            std::cout << {func_name}({args_str});
+        }} catch (const std::bad_alloc&) {{
+            // выделение памяти отказало на лимите песочницы — это MLE, а не ошибка решения
+            std::cout << "std::bad_alloc";
+            judge_status = "MLE";
+        }} catch (const std::exception& e) {{
+            std::cout << e.what();
+            judge_status = "ERR";
+        }} catch (...) {{
+            std::cout << "unknown exception";
+            judge_status = "ERR";
+        }}
+        std::cout << "\\n{BATCH_SENTINEL} " << judge_nonce << " " << judge_status << " " << std::flush;
+        judge_print_stats(judge_wall, judge_cpu);
+    }}
+    return 0;
+}}
+"""
+        return wrapper.strip()
+
+    elif lang == "rust":
+        func_name, conversions = _rust_function(code, param_types, func_name=func_name)
+        conversion_code = "\n            ".join(conversions)
+        args_str = ", ".join([f"arg{i}" for i in range(arg_count)])
+
+        wrapper = f"""
+use std::io::{{self, Read, Write}};
+
+{code}
+
+#[repr(C)]
+struct JudgeRusage {{
+    ru_utime: [i64; 2],
+    ru_stime: [i64; 2],
+    ru_maxrss: i64,
+    ru_rest: [i64; 13],
+}}
+
+extern "C" {{
+    fn getrusage(who: i32, usage: *mut JudgeRusage) -> i32;
+}}
+
+fn judge_rusage() -> (i64, i64) {{
+    let mut usage = JudgeRusage {{ ru_utime: [0; 2], ru_stime: [0; 2], ru_maxrss: 0, ru_rest: [0; 13] }};
+    unsafe {{
+        getrusage(0, &mut usage);
+    }}
+    let cpu = (usage.ru_utime[0] + usage.ru_stime[0]) * 1_000_000 + usage.ru_utime[1] + usage.ru_stime[1];
+    (cpu, usage.ru_maxrss)
+}}
+
+fn judge_read_line(raw: &[u8], pos: &mut usize) -> String {{
+    let start = *pos;
+    while *pos < raw.len() && raw[*pos] != b'\\n' {{
+        *pos += 1;
+    }}
+    let line = String::from_utf8_lossy(&raw[start..*pos]).trim().to_string();
+    *pos += 1;
+    line
+}}
+
+fn main() {{
+    std::panic::set_hook(Box::new(|_| {{}}));
+    let mut raw = Vec::new();
+    io::stdin().read_to_end(&mut raw).unwrap();
+    let mut pos = 0usize;
+    let judge_nonce = judge_read_line(&raw, &mut pos);
+    let judge_count: usize = judge_read_line(&raw, &mut pos).parse().unwrap_or(0);
+    println!("{BATCH_READY} {{}}", judge_nonce);
+    for _ in 0..judge_count {{
+        let judge_size: usize = judge_read_line(&raw, &mut pos).parse().unwrap_or(0);
+        let judge_end = (pos + judge_size).min(raw.len());
+        let input = String::from_utf8_lossy(&raw[pos.min(judge_end)..judge_end]).to_string();
+        pos = judge_end;
+        let judge_wall = std::time::Instant::now();
+        let (judge_cpu, _) = judge_rusage();
+        let outcome = std::panic::catch_unwind(std::panic::AssertUnwindSafe(|| {{
+            let mut args: Vec<&str> = input.split_whitespace().collect();
+            args.resize(args.len().max({arg_count}), "");
+            {conversion_code}
+            let result = {func_name}({args_str});
+            format!("{{}}", result)
+        }}));
+        let judge_elapsed = judge_wall.elapsed().as_micros();
+        let (judge_cpu_end, judge_maxrss) = judge_rusage();
+        let (text, status) = match outcome {{
+            Ok(text) => (text, "OK"),
+            Err(e) => {{
+                let msg = e.downcast_ref::<&str>().map(|s| s.to_string())
+                    .or_else(|| e.downcast_ref::<String>().cloned())
+                    .unwrap_or_else(|| "panic".to_string());
+                (msg, "ERR")
+            }}
+        }};
+        let stdout = io::stdout();
+        let mut out = stdout.lock();
+        writeln!(out, "{{}}", text).unwrap();
+        writeln!(out, "\\n{BATCH_SENTINEL} {{}} {{}} {{}} {{}} {{}}", judge_nonce, status, judge_elapsed, judge_cpu_end - judge_cpu, judge_maxrss).unwrap();
+        out.flush().unwrap();
+    }}
+}}
+"""
+        return wrapper.strip()
+
+    elif lang == "go":
+        func_name, conversions = _go_function(code, param_types, func_name=func_name)
+        conversion_code = "\n    ".join(conversions)
+        args_str = ", ".join([f"arg{i}" for i in range(arg_count)])
+
+        wrapper = f"""
+package main
+
+import (
+    "bufio"
+    "fmt"
+    "io"
+    "os"
+    "strconv"
+    "strings"
+    "syscall"
+    "time"
+)
+
+{code}
+{GO_SLICE_HELPERS}
+func judgeRusage() (int64, int64) {{
+    var usage syscall.Rusage
+    syscall.Getrusage(syscall.RUSAGE_SELF, &usage)
+    return (usage.Utime.Nano() + usage.Stime.Nano()) / 1000, usage.Maxrss
+}}
+
+func judgeCase(args []string) (out string, failed bool) {{
+    defer func() {{
+        if r := recover(); r != nil {{
+            out = fmt.Sprint(r)
+            failed = true
+        }}
+    }}()
     {conversion_code}
     result := {func_name}({args_str})
-    fmt.Println(result)
+    return fmt.Sprint(result), false
+}}
+
+func main() {{
+    reader := bufio.NewReader(os.Stdin)
+    judgeNonce, _ := reader.ReadString('\\n')
+    judgeNonce = strings.TrimSpace(judgeNonce)
+    var judgeCount int
+    fmt.Fscan(reader, &judgeCount)
+    reader.ReadString('\\n')
+    fmt.Println("{BATCH_READY} " + judgeNonce)
+    for c := 0; c < judgeCount; c++ {{
+        var judgeSize int
+        fmt.Fscan(reader, &judgeSize)
+        reader.ReadString('\\n')
+        buf := make([]byte, judgeSize)
+        io.ReadFull(reader, buf)
+        args := strings.Fields(string(buf))
+        for len(args) < {arg_count} {{
+            args = append(args, "")
+        }}
+        judgeWall := time.Now()
+        judgeCpu, _ := judgeRusage()
+        out, failed := judgeCase(args)
+        judgeElapsed := time.Since(judgeWall).Microseconds()
+        judgeCpuEnd, judgeMaxrss := judgeRusage()
+        status := "OK"
+        if failed {{
+            status = "ERR"
+        }}
+        fmt.Println(out)
+        fmt.Printf("\\n{BATCH_SENTINEL} %s %s %d %d %d\\n", judgeNonce, status, judgeElapsed, judgeCpuEnd-judgeCpu, judgeMaxrss)
+    }}
 }}
 """
         return wrapper.strip()
 
     else:
-        raise ValueError(f"Unsupported language: {lang}")
\ No newline at end of file
+        raise ValueError(f"Unsupported language: {lang}")
+
+
+_FUNCTIONS = {
+    "python": _python_function,
+    "js": _js_function,
+    "c": _c_function,
+    "cpp": _cpp_function,
+    "rust": _rust_function,
+    "go": _go_function,
+}
+
+# метки в заранее отрисованной обертке: на их место встают код решения и имя функции
+CODE_SLOT = "@@CODEBATTLE_CODE@@"
+NAME_SLOT = "@@CODEBATTLE_FUNC@@"
+_SLOTS = re.compile(f"({re.escape(CODE_SLOT)}|{re.escape(NAME_SLOT)})")
+
+
+def function_name(lang: str, code: str) -> str:
+    """Имя функции решения — его вызывает обертка"""
+    if lang not in _FUNCTIONS:
+        raise ValueError(f"Unsupported language: {lang}")
+    return _FUNCTIONS[lang](code, [])[0]
+
+
+class HarnessTemplate:
+    """Пакетная обертка задачи, в которую остается подставить код решения.
+
+    source — обертка с CODE_SLOT и NAME_SLOT на месте кода и имени функции;
+    разбор сигнатуры и сборка обертки по типам параметров уже сделаны.
+    """
+
+    def __init__(self, lang: str, source: str, isolate: bool = False):
+        self.lang = lang
+        self.source = source
+        self.isolate = isolate
+        self._parts = _SLOTS.split(source)
+        # js с isolate встраивает код решения строковым литералом
+        self._escape = lang == "js" and isolate
+
+    def render(self, code: str) -> str:
+        """То же, что wrap_code_batch(lang, code, param_types, isolate)"""
+        if self.lang in ("c", "cpp") and _has_main(code):
+            label = "C" if self.lang == "c" else "C++"
+            raise BatchNotSupported(f"{label} code with its own main can't be run in batch mode")
+        name = function_name(self.lang, code)
+        value = json.dumps(code)[1:-1] if self._escape else code
+        return "".join(value if part == CODE_SLOT else name if part == NAME_SLOT else part for part in self._parts)
+
+
+def harness_template(lang: str, param_types: list, isolate: bool = False):
+    """Шаблон пакетной обертки; None, если обертку не собрать без кода решения"""
+    if lang == "cpp" and not param_types:
+        # типы не разобраны — число параметров берется из кода решения
+        return None
+    source = wrap_code_batch(lang, CODE_SLOT, param_types, isolate, func_name=NAME_SLOT)
+    return HarnessTemplate(lang, source, isolate)
+
+
+def frame_batch_stream(inputs: list, nonce: str):
+    """Входы тестов в формате пакетной обертки, кусками; первой строкой — nonce запуска.
+
+    Вход — строка или объект с size и chunks() (например, test_store.BlobInput):
+    такой вход не собирается в памяти целиком, а идет в песочницу потоком.
+    """
+    yield f"{nonce}\n{len(inputs)}\n".encode()
+    for input_data in inputs:
+        if isinstance(input_data, str) or input_data is None:
+            payload = (input_data or "").encode()
+            yield f"{len(payload)}\n".encode() + payload
+        else:
+            yield f"{input_data.size}\n".encode()
+            yield from input_data.chunks()
+
+
+def _case_stats(measured: list):
+    """Замеры теста из строки-разделителя: {"wall_ms", "cpu_ms", "memory_kb"} или None"""
+    try:
+        wall_us, cpu_us, maxrss_kb = (int(value) for value in measured)
+    except ValueError:
+        return None
+    return {"wall_ms": round(wall_us / 1000, 3), "cpu_ms": round(cpu_us / 1000, 3), "memory_kb": maxrss_kb}
+
+
+def _marker_start(line: str) -> bool:
+    """Может ли line быть началом строки служебной метки"""
+    if len(line) > MARKER_LINE_LIMIT:
+        return False
+    return (line.startswith((BATCH_READY, BATCH_SENTINEL))
+            or BATCH_SENTINEL.startswith(line) or BATCH_READY.startswith(line))
+
+
+class BatchOutputParser:
+    """Разбирает вывод пакетной обертки по кускам, по мере поступления.
+
+    limit — потолок вывода одного теста в символах: тест, превысивший его,
+    получает статус OLE, а его вывод дальше не копится. on_text(index, text)
+    получает вывод теста index по строкам, пока тест еще идет; keep — сколько
+    символов вывода теста оставить для результата (None — весь).
+
+    nonce — тот, что передан обертке: строки служебных меток с другим nonce
+    напечатало решение, и такой тест получает ERR вместо своего результата.
+    """
+
+    def __init__(self, limit: int = None, on_text=None, keep: int = None, nonce: str = ""):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._tail = ""
+        self._current = []
+        self.ready = False
+        self.limit = limit
+        self.on_text = on_text
+        self.keep = keep
+        self.nonce = nonce
+        self.forged = False
+        self.cases = 0
+        self.overflow = False
+        self._size = 0
+        self._kept = 0
+        # хвост строки, на которой случилось переполнение, — до перевода строки выбрасываем
+        self._drop_partial = False
+
+    def _text(self, line: str):
+        if self.overflow:
+            return
+        self._size += len(line) + 1
+        if self.limit is not None and self._size > self.limit:
+            self.overflow = True
+            self._current = []
+            return
+        if self.on_text is not None:
+            self.on_text(self.cases, line + "\n")
+        if self.keep is None:
+            self._current.append(line)
+        elif self._kept < self.keep:
+            self._current.append(line[:self.keep - self._kept])
+            self._kept += len(line) + 1
+
+    def _lines(self, lines: list) -> list:
+        cases = []
+        for line in lines:
+            if line.startswith((BATCH_READY, BATCH_SENTINEL)):
+                marker, *fields = line.split()
+                if not fields or fields[0] != self.nonce:
+                    # чужая метка: решение пытается выдать свой вывод за результат теста
+                    self.forged = True
+                elif marker == BATCH_READY and not self.ready:
+                    self.ready = True
+                elif marker == BATCH_SENTINEL:
+                    status, *measured = fields[1:] or ["ERR"]
+                    text = "\n".join(self._current).strip()
+                    if self.forged:
+                        status, text = "ERR", FORGED_MARKER_ERROR
+                    elif self.overflow:
+                        status = "OLE"
+                    cases.append((status, text, _case_stats(measured)))
+                    self._current = []
+                    self._size = self._kept = 0
+                    self.overflow = False
+                    self.forged = False
+                    self.cases += 1
+            else:
+                self._text(line)
+        return cases
+
+    def feed(self, chunk: bytes) -> list:
+        """Возвращает тесты (status, text, stats), завершившиеся в этом куске"""
+        data = self._decoder.decode(chunk)
+        if self._drop_partial:
+            newline = data.find("\n")
+            if newline < 0:
+                return []
+            data = data[newline:]
+            self._drop_partial = False
+        *lines, self._tail = (self._tail + data).split("\n")
+        cases = self._lines(lines)
+        if (self.limit is not None and self._size + len(self._tail) > self.limit
+                and not _marker_start(self._tail)):
+            # строка без перевода длиннее лимита — копить её незачем;
+            # начало метки, разрезанной между кусками, оставляем: она закроет тест
+            self.overflow = True
+            self._current = []
+            self._tail = ""
+            self._drop_partial = True
+        return cases
+
+    def close(self) -> list:
+        tail, self._tail = self._tail + self._decoder.decode(b"", final=True), ""
+        return self._lines([tail]) if tail else []
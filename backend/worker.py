@@ -0,0 +1,68 @@
+# Отдельный процесс судьи: python worker.py
+# Забирает задания из judge_jobs в той же базе, что и API; таких процессов
+# можно запустить сколько угодно и на разных хостах. API с JUDGE_WORKERS=0
+# сам ничего не проверяет и только ставит задания в очередь. Процессам на одном
+# хосте нужны JUDGE_WORKER_COUNT и свой JUDGE_WORKER_INDEX (или непересекающиеся
+# JUDGE_CORES): иначе каждый займет под проверки все ядра хоста.
+import asyncio
+import os
+import signal
+import docker
+from judge import LANG_CONFIG
+from docker_pool import container_pool, reap_orphans
+from sandbox import docker_engine, reap_workspaces
+from toolchain_cache import toolchain_caches
+from core_pool import core_pool
+from jobs import job_queue, JUDGE_WORKERS, WORKER_ID
+from migrations import init_schema
+
+
+DOCKER_URL = os.getenv("JUDGE_DOCKER_URL", "tcp://localhost:2375")
+
+
+def start_sandboxes():
+    # после падения воркера остаются его рабочие директории и контейнеры
+    reap_workspaces()
+    # Engine API и пул не обязательны: без докер-демона судья работает через docker CLI
+    try:
+        client = docker.DockerClient(base_url=DOCKER_URL)
+        docker_engine.start(client)
+        reap_orphans(client)
+    except Exception as e:
+        print(f"Docker Engine API unavailable: {e}")
+        return
+    # до пула: его контейнеры монтируют каталоги кешей при создании
+    toolchain_caches.start(client, LANG_CONFIG)
+    try:
+        pooled = {lang: config for lang, config in LANG_CONFIG.items() if config["sandbox"] == "docker_sdk"}
+        container_pool.start(client, pooled)
+    except Exception as e:
+        print(f"Container pool disabled: {e}")
+
+
+def stop_sandboxes():
+    container_pool.close()
+    docker_engine.close()
+
+
+async def main():
+    # потоки самого воркера — на зарезервированных ядрах, остальные отданы проверкам
+    core_pool.pin_api()
+    # воркер может стартовать раньше API — схему доводит сам
+    init_schema()
+    start_sandboxes()
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+    await job_queue.start(max(1, JUDGE_WORKERS))
+    print(f"Judge worker {WORKER_ID} started")
+    try:
+        await stopped.wait()
+    finally:
+        await job_queue.stop()
+        stop_sandboxes()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -48,8 +48,43 @@ import { useSnackbar } from "notistack";
 import Editor from "@monaco-editor/react";
 
 const API_BASE = "http://localhost:3309";
+const JOB_POLL_INTERVAL = 1000;
 const difficultyColors = ["#4caf50", "#8bc34a", "#cddc39", "#ff9800", "#f44336"];
 
+// Посылка проверяется в очереди судьи — ждем, пока задание не завершится
+const waitForJob = async (jobId) => {
+  while (true) {
+    const res = await fetch(`${API_BASE}/api/jobs/${jobId}`);
+    if (!res.ok) throw new Error("Не удалось получить статус проверки");
+    const job = await res.json();
+    if (job.status !== "queued" && job.status !== "running") return job;
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+  }
+};
+
+// Вердикты по тестам приходят по SSE по мере проверки; если поток оборвался — опрашиваем
+const streamJob = (jobId, onTest) => new Promise((resolve, reject) => {
+  if (typeof EventSource === "undefined") {
+    waitForJob(jobId).then(resolve, reject);
+    return;
+  }
+  const results = [];
+  const source = new EventSource(`${API_BASE}/api/jobs/${jobId}/events`);
+  source.addEventListener("test", (e) => {
+    const test = JSON.parse(e.data);
+    results[test.index] = test;
+    onTest([...results]);
+  });
+  source.addEventListener("summary", (e) => {
+    source.close();
+    resolve({ ...JSON.parse(e.data), results });
+  });
+  source.onerror = () => {
+    source.close();
+    waitForJob(jobId).then(resolve, reject);
+  };
+});
+
 const TasksPage = () => {
   const [difficulty, setDifficulty] = useState([1, 5]);
   const [tasks, setTasks] = useState([]);
@@ -234,7 +269,20 @@ const TasksPage = () => {
         throw new Error(errorData.detail || "Ошибка при отправке решения");
       }
 
-      const data = await response.json();
+      const { job_id } = await response.json();
+      const data = await streamJob(job_id, (results) => {
+        setSubmissionResults({
+          total: results[results.length - 1]?.total ?? results.length,
+          passed: results.filter(test => test && test.passed).length,
+          results: results.filter(Boolean)
+        });
+      });
+      if (data.status === "failed") {
+        throw new Error(data.error || "Ошибка при проверке решения");
+      }
+      if (data.verdict === "CE") {
+        throw new Error(`Ошибка компиляции: ${data.error}`);
+      }
       setSubmissionResults(data);
       
       if (data.passed === data.total) {
@@ -568,7 +616,19 @@ const TestResults = ({ submissionResults }) => (
         {submissionResults.passed === submissionResults.total 
           ? "Все тесты пройдены успешно!" 
           : "Есть непройденные тесты"}
+        {submissionResults.skipped > 0 && ` (ещё ${submissionResults.skipped} не запускались)`}
       </Typography>
+      {submissionResults.performance && (
+        <Chip
+          label={submissionResults.performance.faster_than != null
+            ? `Быстрее ${submissionResults.performance.faster_than}% решений`
+            : `CPU: ${submissionResults.performance.cpu_ms} мс`}
+          sx={{ ml: 2 }}
+        />
+      )}
+      {submissionResults.complexity?.class && (
+        <Chip label={`Сложность: ${submissionResults.complexity.class}`} sx={{ ml: 2 }} />
+      )}
     </Box>
     
     <TableContainer component={Paper} sx={{ bgcolor: "#2d2d2d", maxHeight: 400, overflow: 'auto' }}>
@@ -579,6 +639,7 @@ const TestResults = ({ submissionResults }) => (
             <TableCell>Входные данные</TableCell>
             <TableCell>Ожидаемый результат</TableCell>
             <TableCell>Фактический результат</TableCell>
+            <TableCell>Время / память</TableCell>
             <TableCell>Статус</TableCell>
           </TableRow>
         </TableHead>
@@ -595,8 +656,16 @@ const TestResults = ({ submissionResults }) => (
               <TableCell sx={{ fontFamily: "monospace", maxWidth: 150, overflow: 'hidden', textOverflow: 'ellipsis' }}>
                 {test.actual || test.error || "—"}
               </TableCell>
+              <TableCell sx={{ fontFamily: "monospace", whiteSpace: "nowrap" }}>
+                {test.wall_ms != null ? `${test.wall_ms} мс / ${Math.round(test.memory_kb / 1024)} МБ` : "—"}
+              </TableCell>
               <TableCell>
-                {test.passed ? <CheckCircleIcon color="success" /> : <CancelIcon color="error" />}
+                {test.passed ? <CheckCircleIcon color="success" /> : (
+                  <Box sx={{ display: "flex", alignItems: "center", gap: 1 }}>
+                    <CancelIcon color="error" />
+                    {test.verdict && <Typography variant="caption">{test.verdict}</Typography>}
+                  </Box>
+                )}
               </TableCell>
             </TableRow>
           ))}
@@ -650,6 +719,7 @@ const SolutionsView = ({ solutions, loading, taskLanguage, expandedSolutions, on
                 <Box sx={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
                   <ListItemText
                     primary={solution.username || "Анонимный пользователь"}
+                    secondary={solution.complexity ? `Сложность: ${solution.complexity}` : null}
                   />
                   <IconButton onClick={() => onToggleExpand(index)}>
                     {expandedSolutions[index] ? <ExpandLessIcon /> : <ExpandMoreIcon />}